@@ -226,7 +226,7 @@ import pyffi.object_models.xml
 import pyffi.utils.mathutils
 import pyffi.utils.tangentspace
 from pyffi.object_models.xml.basic import BasicBase
-from pyffi.utils.graph import EdgeFilter
+from pyffi.utils.graph import EdgeFilter, walk
 
 class _MetaCgfFormat(pyffi.object_models.xml.MetaFileFormat):
     """Metaclass which constructs the chunk map during class creation."""
@@ -234,7 +234,18 @@ class _MetaCgfFormat(pyffi.object_models.xml.MetaFileFormat):
         super(_MetaCgfFormat, cls).__init__(name, bases, dct)
         
         # map chunk type integers to chunk type classes
-        cls.CHUNK_MAP = dict(
+        # (if classes are generated lazily, then on first access)
+        if not cls.xml_lazy:
+            cls.CHUNK_MAP = cls._get_chunk_map()
+
+    def __getattr__(cls, name):
+        if name == "CHUNK_MAP":
+            cls.CHUNK_MAP = cls._get_chunk_map()
+            return cls.CHUNK_MAP
+        return super(_MetaCgfFormat, cls).__getattr__(name)
+
+    def _get_chunk_map(cls):
+        return dict(
             (getattr(cls.ChunkType, chunk_name),
              getattr(cls, '%sChunk' % chunk_name))
             for chunk_name in cls.ChunkType._enumkeys
@@ -246,6 +257,8 @@ class CgfFormat(pyffi.object_models.xml.FileFormat, metaclass=_MetaCgfFormat):
     # where to look for cgf.xml and in what order: CGFXMLPATH env var,
     # or module directory
     xml_file_path = [os.getenv('CGFXMLPATH'), os.path.dirname(__file__)]
+    # generate chunk classes on first access if PYFFI_LAZY_CLASSES is set
+    xml_lazy = bool(os.getenv('PYFFI_LAZY_CLASSES'))
     EPSILON = 0.0001 # used for comparing floats
     # regular expression for file name extension matching on cgf files
     RE_FILENAME = re.compile(r'^.*\.(cgf|cga|chr|caf)$', re.IGNORECASE)
@@ -392,9 +405,9 @@ class CgfFormat(pyffi.object_models.xml.FileFormat, metaclass=_MetaCgfFormat):
             :param stream: The stream to read from.
             :type stream: file
             """
-            self._value = None # fix_links will set this field
+            self._value = None # resolve_link will set this field
             block_index, = struct.unpack('<i', stream.read(4))
-            data._link_stack.append(block_index)
+            data._link_list.append((self, block_index))
 
         def write(self, stream, data):
             """Write chunk index.
@@ -408,14 +421,17 @@ class CgfFormat(pyffi.object_models.xml.FileFormat, metaclass=_MetaCgfFormat):
                 stream.write(struct.pack(
                     '<i', data._block_index_dct[self._value]))
 
-        def fix_links(self, data):
-            """Resolve chunk index into a chunk.
+        def resolve_link(self, data, block_index):
+            """Resolve chunk index into a chunk. Called by
+            L{CgfFormat.Data.read} for every reference that was read,
+            once all chunks have been read.
 
-            :keyword block_dct: Dictionary mapping block index to block.
-            :type block_dct: dict
+            :param data: The data, with its chunk dictionary.
+            :type data: L{CgfFormat.Data}
+            :param block_index: The chunk index, as read from the file.
+            :type block_index: ``int``
             """
             logger = logging.getLogger("pyffi.cgf.data")
-            block_index = data._link_stack.pop(0)
             # case when there's no link
             if block_index == -1:
                 self._value = None
@@ -442,6 +458,21 @@ expected instance of %s
 but got instance of %s""" % (self._template, block.__class__))
             self._value = block
 
+        def fix_links(self, data):
+            """Resolve the chunk index that was read into this reference.
+            Kept for compatibility with code that reads chunks itself:
+            L{CgfFormat.Data.read} resolves all links with L{resolve_link}.
+
+            :param data: The data, with its chunk dictionary and the
+                (reference, chunk index) pairs that are not resolved yet.
+            :type data: L{CgfFormat.Data}
+            """
+            for i, (ref, block_index) in enumerate(data._link_list):
+                if ref is self:
+                    del data._link_list[i]
+                    self.resolve_link(data, block_index)
+                    return
+
         def get_links(self, data=None):
             """Return the chunk reference.
 
@@ -541,7 +572,7 @@ but got instance of %s""" % (self._template, block.__class__))
         :ivar versions: List of chunk versions.
         :type versions: ``list`` of L{int}
         """
-        _link_stack = None
+        _link_list = None
         _block_index_dct = None
         _block_dct = None
 
@@ -739,7 +770,7 @@ but got instance of %s""" % (self._template, block.__class__))
                         chunk_sizes.append(stream.tell() - chunkhdr.offset)
 
             # read the chunks
-            self._link_stack = [] # list of chunk identifiers, as added to the stack
+            self._link_list = [] # (reference, chunk index) pairs, as read
             self._block_dct = {} # maps chunk index to actual chunk
             self.chunks = [] # records all chunks as read from cgf file in proper order
             self.versions = [] # records all chunk versions as read from cgf file
@@ -857,18 +888,10 @@ chunk size mismatch when reading %s at 0x%08X
                                        chunkhdr.offset,
                                        chunk_sizes[chunknum], size))
 
-            # fix links
-            for chunk, chunkversion in zip(self.chunks, self.versions):
-                # (quick hackish trick with version)
-                self.version = chunkversion
-                try:
-                    #print(chunk.__class__)
-                    chunk.fix_links(self)
-                finally:
-                    self.version = self.header.version
-            if self._link_stack != []:
-                raise CgfFormat.CgfError(
-                    'not all links have been popped from the stack (bug?)')
+            # resolve links
+            for ref, block_index in self._link_list:
+                ref.resolve_link(self, block_index)
+            self._link_list = []
 
         def write(self, stream):
             """Write a cgf file. The L{header} and L{chunk_table} are
@@ -981,23 +1004,22 @@ chunk size mismatch when reading %s at 0x%08X
     # extensions of generated structures
 
     class Chunk:
-        def tree(self, block_type = None, follow_all = True):
+        def tree(self, block_type = None, follow_all = True, unique = False):
             """A generator for parsing all blocks in the tree (starting from and
             including C{self}).
 
             :param block_type: If not ``None``, yield only blocks of the type C{block_type}.
-            :param follow_all: If C{block_type} is not ``None``, then if this is ``True`` the function will parse the whole tree. Otherwise, the function will not follow branches that start by a non-C{block_type} block."""
-            # yield self
-            if not block_type:
-                yield self
-            elif isinstance(self, block_type):
-                yield self
-            elif not follow_all:
-                return # don't recurse further
-
-            # yield tree attached to each child
-            for child in self.get_refs():
-                for block in child.tree(block_type = block_type, follow_all = follow_all):
+            :param follow_all: If C{block_type} is not ``None``, then if this is ``True`` the function will parse the whole tree. Otherwise, the function will not follow branches that start by a non-C{block_type} block.
+            :param unique: Whether the generator can return the same block twice or not."""
+            # walk the tree, skipping branches of the wrong type if
+            # only matching branches are followed
+            if block_type and not follow_all:
+                accept = lambda block: isinstance(block, block_type)
+            else:
+                accept = None
+            for block in walk(self, lambda block: block.get_refs(),
+                              unique=unique, accept=accept):
+                if not block_type or isinstance(block, block_type):
                     yield block
 
         def apply_scale(self, scale):
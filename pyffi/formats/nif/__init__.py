@@ -348,13 +348,19 @@ end
 #
 # ***** END LICENSE BLOCK *****
 
+import bisect
+import concurrent.futures
+from functools import partial
+from io import BytesIO
 from itertools import repeat, chain
 import logging
 import math # math.pi
+import mmap
 import os
 import re
 import struct
 import sys
+import tempfile
 import warnings
 import weakref
 
@@ -371,12 +377,11 @@ import pyffi.utils.vertex_cache
 import pyffi.utils.quickhull
 # XXX convert the following to absolute imports
 from pyffi.object_models.editable import EditableBoolComboBox
-from pyffi.utils.graph import EdgeFilter
+from pyffi.utils.graph import EdgeFilter, walk
 from pyffi.object_models.xml.basic import BasicBase
 from pyffi.object_models.xml.struct_ import StructBase
 
 
-
 class NifFormat(FileFormat):
     """This class contains the generated classes from the xml."""
     xml_file_name = 'nif.xml'
@@ -384,6 +389,8 @@ class NifFormat(FileFormat):
     # or NifFormat module directory
     xml_file_path = [os.getenv('NIFXMLPATH'),
                      os.path.join(os.path.dirname(__file__), "nifxml")]
+    # generate block classes on first access if PYFFI_LAZY_CLASSES is set
+    xml_lazy = bool(os.getenv('PYFFI_LAZY_CLASSES'))
     # filter for recognizing NIF files by extension
     # .kf are NIF files containing keyframes
     # .kfa are NIF files containing keyframes in DAoC style
@@ -416,6 +423,8 @@ class NifFormat(FileFormat):
 
     class StringOffset(pyffi.object_models.common.Int):
         """This is just an integer with -1 as default value."""
+        __slots__ = ()
+
         def __init__(self, **kwargs):
             pyffi.object_models.common.Int.__init__(self, **kwargs)
             self.set_value(-1)
@@ -432,6 +441,8 @@ class NifFormat(FileFormat):
         >>> i.get_value()
         True
         """
+        __slots__ = ()
+
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
             self.set_value(False)
@@ -459,45 +470,70 @@ class NifFormat(FileFormat):
             else:
                 return 4
 
+        @classmethod
+        def _get_static_size(cls, data=None):
+            ver = data.version if data else -1
+            if ver > 0x04000002:
+                return 1
+            else:
+                return 4
+
         def get_hash(self, data=None):
             return self._value
 
         def read(self, stream, data):
             if data.version > 0x04000002:
-                value, = struct.unpack(data._byte_order + 'B',
-                                       stream.read(1))
+                value, = pyffi.object_models.common.UByte._structs[
+                    data._byte_order].unpack(stream.read(1))
             else:
-                value, = struct.unpack(data._byte_order + 'I',
-                                       stream.read(4))
+                value, = pyffi.object_models.common.UInt._structs[
+                    data._byte_order].unpack(stream.read(4))
             self._value = bool(value)
 
         def write(self, stream, data):
             if data.version > 0x04000002:
-                stream.write(struct.pack(data._byte_order + 'B',
-                                         int(self._value)))
+                stream.write(pyffi.object_models.common.UByte._structs[
+                    data._byte_order].pack(int(self._value)))
             else:
-                stream.write(struct.pack(data._byte_order + 'I',
-                                         int(self._value)))
+                stream.write(pyffi.object_models.common.UInt._structs[
+                    data._byte_order].pack(int(self._value)))
 
     class Flags(pyffi.object_models.common.UShort):
+        __slots__ = ()
+
         def __str__(self):
             return hex(self.get_value())
 
     class Ref(BasicBase):
         """Reference to another block."""
+        __slots__ = ('_template', '_link_observer')
         _is_template = True
         _has_links = True
         _has_refs = True
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
             self._template = kwargs.get("template")
-            self.set_value(None)
+            self._value = None
+            # notified before the reference is set, see set_link_observer
+            self._link_observer = None
+
+        def __getstate__(self):
+            # the link observer belongs to the tree of the reference
+            return (None, dict(arg=self.arg, _value=self._value,
+                               _template=self._template))
+
+        def __setstate__(self, state):
+            for name, value in state[1].items():
+                setattr(self, name, value)
+            self._link_observer = None
 
         def get_value(self):
             return self._value
 
         def set_value(self, value):
             if value is None:
+                if self._link_observer is not None:
+                    self._link_observer.set_link(self, value)
                 self._value = None
             else:
                 if self._template != None:
@@ -505,11 +541,17 @@ class NifFormat(FileFormat):
                         raise TypeError(
                             'expected an instance of %s but got instance of %s'
                             % (self._template, value.__class__))
+                if self._link_observer is not None:
+                    self._link_observer.set_link(self, value)
                 self._value = value
 
         def get_size(self, data=None):
             return 4
 
+        @classmethod
+        def _get_static_size(cls, data=None):
+            return 4
+
         def get_hash(self, data=None):
             if self.get_value():
                 return self.get_value().get_hash(data)
@@ -517,10 +559,10 @@ class NifFormat(FileFormat):
                 return None
 
         def read(self, stream, data):
-            self.set_value(None) # fix_links will set this field
-            block_index, = struct.unpack(data._byte_order + 'i',
-                                         stream.read(4))
-            data._link_stack.append(block_index)
+            self.set_value(None) # resolve_link will set this field
+            block_index, = pyffi.object_models.common.Int._structs[
+                data._byte_order].unpack(stream.read(4))
+            data._link_list.append((self, block_index))
 
         def write(self, stream, data):
             """Write block reference."""
@@ -537,12 +579,19 @@ class NifFormat(FileFormat):
                         % self.get_value().__class__.__name__)
                     # -1: link by number, 0: link by pointer
                     block_index = -1 if data.version >= 0x0303000D else 0
-            stream.write(struct.pack(
-                data._byte_order + 'i', block_index))
-
-        def fix_links(self, data):
-            """Fix block links."""
-            block_index = data._link_stack.pop(0)
+            stream.write(pyffi.object_models.common.Int._structs[
+                data._byte_order].pack(block_index))
+
+        def resolve_link(self, data, block_index):
+            """Set the reference to the block at C{block_index}. Called
+            by L{NifFormat.Data.read} for every reference that was read,
+            once all blocks have been read.
+
+            :param data: The data, with its block dictionary.
+            :type data: L{NifFormat.Data}
+            :param block_index: The block index, as read from the file.
+            :type block_index: ``int``
+            """
             # case when there's no link
             if data.version >= 0x0303000D:
                 if block_index == -1: # link by block number
@@ -562,6 +611,21 @@ class NifFormat(FileFormat):
                     "Expected an %s but got %s: ignoring reference."
                     % (self._template, block.__class__))
 
+        def fix_links(self, data):
+            """Resolve the block index that was read into this reference.
+            Kept for compatibility with code that reads blocks itself:
+            L{NifFormat.Data.read} resolves all links with L{resolve_link}.
+
+            :param data: The data, with its block dictionary and the
+                (reference, block index) pairs that are not resolved yet.
+            :type data: L{NifFormat.Data}
+            """
+            for i, (ref, block_index) in enumerate(data._link_list):
+                if ref is self:
+                    del data._link_list[i]
+                    self.resolve_link(data, block_index)
+                    return
+
         def get_links(self, data=None):
             val = self.get_value()
             if val is not None:
@@ -576,6 +640,12 @@ class NifFormat(FileFormat):
             else:
                 return []
 
+        def get_link_slots(self, data=None):
+            return [self]
+
+        def set_link_observer(self, observer, data=None):
+            self._link_observer = observer
+
         def replace_global_node(self, oldbranch, newbranch,
                                 edge_filter=EdgeFilter()):
             """
@@ -613,6 +683,7 @@ class NifFormat(FileFormat):
 
     class Ptr(Ref):
         """A weak reference to another block, used to point up the hierarchy tree. The reference is not returned by the L{get_refs} function to avoid infinite recursion."""
+        __slots__ = ()
         _is_template = True
         _has_links = True
         _has_refs = False
@@ -624,6 +695,8 @@ class NifFormat(FileFormat):
 
         def set_value(self, value):
             if value is None:
+                if self._link_observer is not None:
+                    self._link_observer.set_link(self, value)
                 self._value = None
             else:
                 if self._template != None:
@@ -631,6 +704,8 @@ class NifFormat(FileFormat):
                         raise TypeError(
                             'expected an instance of %s but got instance of %s'
                             % (self._template, value.__class__))
+                if self._link_observer is not None:
+                    self._link_observer.set_link(self, value)
                 self._value = weakref.ref(value)
 
         def __str__(self):
@@ -674,6 +749,8 @@ class NifFormat(FileFormat):
         >>> str(m)
         'Hi There'
         """
+        __slots__ = ()
+
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
             self.set_value('')
@@ -701,6 +778,8 @@ class NifFormat(FileFormat):
             stream.write("\x0a".encode("ascii"))
 
     class HeaderString(BasicBase):
+        __slots__ = ()
+
         def __str__(self):
             return 'NetImmerse/Gamebryo File Format, Version x.x.x.x'
 
@@ -781,6 +860,8 @@ class NifFormat(FileFormat):
                 return "%s File Format, Version %s" % (s, v)
 
     class FileVersion(pyffi.object_models.common.UInt):
+        __slots__ = ()
+
         def set_value(self):
             raise NotImplementedError("file version is specified via data")
 
@@ -840,6 +921,8 @@ class NifFormat(FileFormat):
 
     class ShortString(BasicBase):
         """Another type for strings."""
+        __slots__ = ()
+
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
             self._value = ''.encode("ascii")
@@ -875,8 +958,29 @@ class NifFormat(FileFormat):
             stream.write('\x00'.encode("ascii"))
 
     class string(SizedString):
+        __slots__ = ('_link_observer',)
         _has_strings = True
 
+        def __init__(self, **kwargs):
+            pyffi.object_models.common.SizedString.__init__(self, **kwargs)
+            # notified when the string is set, if it is the name of a
+            # block, see NifFormat.NiObject.set_link_observer
+            self._link_observer = None
+
+        def __getstate__(self):
+            # the link observer belongs to the tree of the string
+            return (None, dict(arg=self.arg, _value=self._value))
+
+        def __setstate__(self, state):
+            for name, value in state[1].items():
+                setattr(self, name, value)
+            self._link_observer = None
+
+        def set_value(self, value):
+            pyffi.object_models.common.SizedString.set_value(self, value)
+            if self._link_observer is not None:
+                self._link_observer.set_name(self)
+
         def get_size(self, data=None):
             ver = data.version if data else -1
             if ver >= 0x14010003:
@@ -884,8 +988,17 @@ class NifFormat(FileFormat):
             else:
                 return 4 + len(self._value)
 
+        @classmethod
+        def _get_static_size(cls, data=None):
+            ver = data.version if data else -1
+            if ver >= 0x14010003:
+                return 4
+            else:
+                return None
+
         def read(self, stream, data):
-            n, = struct.unpack(data._byte_order + 'i', stream.read(4))
+            n, = pyffi.object_models.common.Int._structs[
+                data._byte_order].unpack(stream.read(4))
             if data.version >= 0x14010003:
                 if n == -1:
                     self._value = ''.encode("ascii")
@@ -909,8 +1022,8 @@ class NifFormat(FileFormat):
                     try:
                         stream.write(struct.pack(
                             data._byte_order + 'i',
-                            data._string_list.index(self._value)))
-                    except ValueError:
+                            data._string_dct[self._value]))
+                    except KeyError:
                         raise ValueError(
                             "string '%s' not in string list" % self._value)
             else:
@@ -931,6 +1044,8 @@ class NifFormat(FileFormat):
 
     class FilePath(string):
         """A file path."""
+        __slots__ = ()
+
         def get_hash(self, data=None):
             """Returns a case insensitive hash value."""
             return self.get_value().lower()
@@ -938,6 +1053,8 @@ class NifFormat(FileFormat):
     class ByteArray(BasicBase):
         """Array (list) of bytes. Implemented as basic type to speed up reading
         and also to prevent data to be dumped by __str__."""
+        __slots__ = ()
+
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
             self.set_value("".encode()) # b'' for > py25
@@ -970,6 +1087,8 @@ class NifFormat(FileFormat):
     class ByteMatrix(BasicBase):
         """Matrix of bytes. Implemented as basic type to speed up reading
         and to prevent data being dumped by __str__."""
+        __slots__ = ()
+
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
             self.set_value([])
@@ -1087,10 +1206,63 @@ class NifFormat(FileFormat):
         :type modification: ``str``
         """
 
-        _link_stack = None
+        _link_list = None
         _block_dct = None
         _string_list = None
+        _string_dct = None
         _block_index_dct = None
+        _source_key = None
+        _ref_index = None
+        _block_index = None
+
+        check_block_sizes = True
+        """For versions 20.2.0.7 and up, check the number of bytes read
+        for every block against the block size in the header, and skip
+        to the end of the block if they disagree. Set to ``False`` to
+        skip the check when reading trusted files.
+        """
+
+        copy_unmodified_blocks = False
+        """For versions 3.3.0.13 and up, keep the bytes of every block
+        when reading, and write blocks which have not been modified
+        since by copying these bytes, rather than serializing them again.
+        A block counts as modified as soon as one of its attributes is
+        set, or one of its non-basic attributes (such as an array or a
+        struct) is accessed, see
+        L{StructBase._source_bytes <pyffi.object_models.xml.struct_.StructBase._source_bytes>}.
+        All blocks are serialized again if the block list, the string
+        list, or the version have changed.
+        """
+
+        lazy_blocks = False
+        """For versions 20.2.0.7 and up, read only the header and the
+        footer when reading a file, and read every block on first access
+        to one of its attributes. The header stores the type and the
+        size of every block, so all blocks are created right away, and
+        links to blocks which have not been read yet simply refer to
+        such unread blocks. Checking the type of a block, for instance
+        with L{get_blocks}, does not read it. Note that errors in a
+        block are raised only once the block is read.
+        """
+
+        read_jobs = 1
+        """For versions 20.2.0.7 and up, the number of processes which
+        read the blocks of large files (see L{read_jobs_min_size}), or
+        ``None`` for the number of processors. The header stores the
+        size of every block, so blocks are split into batches of
+        consecutive blocks, which are read independently: from a memory
+        map of the file if the stream is a file on disk, and otherwise
+        from a copy of the bytes of the batch. The blocks are then sent
+        back, and their links are resolved as usual. Ignored if
+        L{lazy_blocks} is set.
+        """
+
+        read_jobs_min_size = 0x400000
+        """The minimal total size of the blocks of a file, in bytes, for
+        its blocks to be read by several processes (see L{read_jobs}).
+        Starting processes and sending blocks between them is slower
+        than reading the blocks of small files.
+        """
 
         class VersionUInt(pyffi.object_models.common.UInt):
             def set_value(self, value):
@@ -1246,12 +1418,100 @@ class NifFormat(FileFormat):
 
         def replace_global_node(self, oldbranch, newbranch,
                               edge_filter=EdgeFilter()):
+            """Replace every reference to C{oldbranch} in the tree at
+            L{roots} by a reference to C{newbranch}.
+
+            Rather than walking the whole tree on every call, this uses
+            an index which maps every block to the references which
+            point to it. The index is built on first call, and kept up
+            to date as references are set and as arrays of references
+            are resized, so later calls only touch the references to
+            C{oldbranch}. It is built again if the roots change. If an
+            C{edge_filter} other than the default one is given, then
+            the tree is walked instead.
+
+            >>> from pyffi.formats.nif import NifFormat
+            >>> data = NifFormat.Data()
+            >>> root = NifFormat.NiNode()
+            >>> child = NifFormat.NiNode()
+            >>> shape = NifFormat.NiTriShape()
+            >>> root.add_child(child)
+            >>> root.add_child(shape)
+            >>> child.add_child(shape)
+            >>> data.roots = [root]
+            >>> other_shape = NifFormat.NiTriShape()
+            >>> data.replace_global_node(shape, other_shape)
+            >>> root.children[1] is other_shape, child.children[0] is other_shape
+            (True, True)
+            >>> other_shape.data = NifFormat.NiTriShapeData()
+            >>> data.replace_global_node(other_shape.data, None)
+            >>> other_shape.data is None
+            True
+            """
+            if edge_filter != EdgeFilter():
+                # the index only covers the default edges
+                for i, root in enumerate(self.roots):
+                    if root is oldbranch:
+                        self.roots[i] = newbranch
+                    elif root is not None:
+                        root.replace_global_node(oldbranch, newbranch,
+                                                 edge_filter=edge_filter)
+                return
+            ref_index = self._get_ref_index()
             for i, root in enumerate(self.roots):
                 if root is oldbranch:
                     self.roots[i] = newbranch
-                else:
-                    root.replace_global_node(oldbranch, newbranch,
-                                           edge_filter=edge_filter)
+                    ref_index.set_root(i, newbranch)
+                    if self._block_index is not None:
+                        self._block_index.invalidate()
+            ref_index.replace(oldbranch, newbranch)
+
+        def _get_ref_index(self):
+            """Get the reverse reference index of the tree at L{roots},
+            and build it first if there is none, or if it is no longer
+            valid."""
+            ref_index = self._ref_index
+            if (ref_index is None or not ref_index.valid
+                or len(ref_index.roots) != len(self.roots)
+                or any(root is not other for root, other
+                       in zip(self.roots, ref_index.roots))):
+                # the blocks of the tree are observed through the new
+                # index only
+                self._block_index = None
+                ref_index = self._ref_index = _RefIndex(self)
+            return ref_index
+
+        def _set_link(self, block, ref, value):
+            """Called by the link observer of C{block} before C{ref} is
+            set to C{value}."""
+            ref_index = self._ref_index
+            if ref_index is None or not ref_index.is_indexed(block):
+                return
+            # the tree only changes if a reference (rather than a
+            # pointer) does
+            if (self._block_index is not None and ref._has_refs
+                and ref.get_value() is not value):
+                self._block_index.invalidate()
+            ref_index.set_link(block, ref, value)
+
+        def _links_resized(self, block, links):
+            """Called by the link observer of C{block} after the array
+            of links C{links} of C{block} changed length."""
+            ref_index = self._ref_index
+            if ref_index is None or not ref_index.is_indexed(block):
+                return
+            if (self._block_index is not None
+                and links._elementType._has_refs):
+                self._block_index.invalidate()
+            ref_index.update_block(block)
+
+        def _set_name(self, block):
+            """Called by the link observer of C{block} after the name
+            of C{block} is set."""
+            ref_index = self._ref_index
+            if (self._block_index is not None and ref_index is not None
+                and ref_index.is_indexed(block)):
+                self._block_index.invalidate_names()
 
         def get_detail_child_nodes(self, edge_filter=EdgeFilter()):
             yield self._version_value_
@@ -1290,12 +1550,37 @@ class NifFormat(FileFormat):
             :type stream: ``file``
             """
             logger = logging.getLogger("pyffi.nif.data")
+            self._ref_index = None
+            self._block_index = None
             # read header
             logger.debug("Reading header at 0x%08X" % stream.tell())
             self.inspect_version_only(stream)
             logger.debug("Version 0x%08X" % self.version)
             self.header.read(stream, data=self)
 
+            # keep the source bytes for copying unmodified blocks,
+            # or for reading blocks on first access
+            source = None
+            self._source_key = None
+            filename = getattr(stream, "name", None)
+            lazy = self.lazy_blocks and self.version >= 0x14020007
+            if lazy or (self.copy_unmodified_blocks
+                        and self.version >= 0x0303000D):
+                pos = stream.tell()
+                stream.seek(0)
+                source = stream.read()
+                stream = BytesIO(source)
+                stream.seek(pos)
+                # blocks keep views into the source, rather than copies
+                source_view = memoryview(source)
+            if lazy:
+                self._index_blocks(stream, source)
+                return
+            if (self.read_jobs != 1 and self.version >= 0x14020007
+                and sum(self.header.block_size) >= self.read_jobs_min_size):
+                self._read_blocks_parallel(stream, source, filename)
+                return
+
             # list of root blocks
             # for versions < 3.3.0.13 this list is updated through the
             # "Top Level Object" string while reading the blocks
@@ -1304,7 +1589,7 @@ class NifFormat(FileFormat):
             self.roots = []
 
             # read the blocks
-            self._link_stack = [] # list of indices, as they are added to the stack
+            self._link_list = [] # (reference, block index) pairs, as read
             self._string_list = [s for s in self.header.strings]
             self._block_dct = {} # maps block index to actual block
             self.blocks = [] # records all blocks as read from file in order
@@ -1376,17 +1661,19 @@ class NifFormat(FileFormat):
                 except AttributeError:
                     raise ValueError(
                         "Unknown block type '%s'." % block_type)
+                block_start = stream.tell()
                 logger.debug("Reading %s block at 0x%08X"
-                             % (block_type, stream.tell()))
+                             % (block_type, block_start))
                 # read the block
                 try:
                     block.read(stream, self)
                 except:
                     logger.exception("Reading %s failed" % block.__class__)
-                    #logger.error("link stack: %s" % self._link_stack)
+                    #logger.error("link list: %s" % self._link_list)
                     #logger.error("block that failed:")
                     #logger.error("%s" % block)
                     raise
+                block_end = stream.tell()
                 # complete NiDataStream data
                 if block_type == "NiDataStream":
                     block.usage = data_stream_usage
@@ -1394,19 +1681,22 @@ class NifFormat(FileFormat):
                 # store block index
                 self._block_dct[block_index] = block
                 self.blocks.append(block)
-                # check block size
-                if self.version >= 0x14020007:
+                # check block size against the number of bytes read
+                if self.version >= 0x14020007 and self.check_block_sizes:
                     logger.debug("Checking block size")
-                    calculated_size = block.get_size(data=self)
-                    if calculated_size != self.header.block_size[block_num]:
-                        extra_size = self.header.block_size[block_num] - calculated_size
+                    block_size = self.header.block_size[block_num]
+                    extra_size = block_start + block_size - stream.tell()
+                    if extra_size != 0:
                         logger.error(
                             "Block size check failed: corrupt NIF file "
                             "or bad nif.xml?")
                         logger.error("Skipping %i bytes in %s"
                                      % (extra_size, block.__class__.__name__))
-                        # skip bytes that were missed
-                        stream.seek(extra_size, 1)
+                        # continue at the end of the block
+                        stream.seek(block_start + block_size)
+                # keep the source bytes, unless bytes were skipped
+                if source is not None and stream.tell() == block_end:
+                    block._source_bytes = source_view[block_start:block_end]
                 # add block to roots if flagged as such
                 if is_root:
                     self.roots.append(block)
@@ -1425,17 +1715,347 @@ class NifFormat(FileFormat):
                 logger.error(
                     'End of file not reached: corrupt NIF file?')
 
-            # fix links in blocks and footer (header has no links)
-            for block in self.blocks:
-                block.fix_links(self)
-            ftr.fix_links(self)
-            # the link stack should be empty now
-            if self._link_stack:
-                raise NifFormat.NifError('not all links have been popped from the stack (bug?)')
+            # resolve links in blocks and footer (header has no links)
+            for ref, block_index in self._link_list:
+                ref.resolve_link(self, block_index)
+            self._link_list = []
             # add root objects in footer to roots list
             if self.version >= 0x0303000D:
                 for root in ftr.roots:
                     self.roots.append(root)
+            # source bytes of the blocks are only valid for this key
+            if source is not None:
+                self._source_key = self._get_source_key()
+
+        def _get_block_type(self, block_num):
+            """Get the name of the type of a block from the header, for
+            versions 5.0.0.1 and up.
+
+            :param block_num: The block number.
+            :type block_num: ``int``
+            :return: The name of the block type, and for
+                L{NifFormat.NiDataStream} blocks, its usage and access
+                (``None`` for other blocks).
+            :rtype: ``tuple``
+            """
+            # note the 0xfff mask: required for the NiPhysX blocks
+            block_type = self.header.block_types[
+                self.header.block_type_index[block_num] & 0xfff]
+            block_type = block_type.decode("ascii")
+            # handle data stream classes
+            data_stream = None
+            if block_type.startswith("NiDataStream\x01"):
+                block_type, usage, access = block_type.split("\x01")
+                data_stream = (int(usage), int(access))
+            return block_type, data_stream
+
+        def _read_footer(self, stream):
+            """Read the footer, which follows the last block, and
+            resolve the links in L{_link_list}, for versions 3.3.0.13
+            and up.
+
+            :param stream: The stream, positioned at the footer.
+            :type stream: ``file``
+            """
+            logger = logging.getLogger("pyffi.nif.data")
+            logger.debug("Reading footer at 0x%08X" % stream.tell())
+            ftr = NifFormat.Footer()
+            ftr.read(stream, self)
+            if stream.read(1):
+                logger.error(
+                    'End of file not reached: corrupt NIF file?')
+            for ref, block_index in self._link_list:
+                ref.resolve_link(self, block_index)
+            self._link_list = []
+            for root in ftr.roots:
+                self.roots.append(root)
+
+        def _index_blocks(self, stream, source):
+            """Create all blocks from the types and sizes in the header,
+            without reading them, and read the footer (see
+            L{lazy_blocks}).
+
+            :param stream: The stream, positioned at the first block.
+            :type stream: ``file``
+            :param source: All bytes of the stream.
+            :type source: ``bytes``
+            """
+            self.roots = []
+            self._string_list = [s for s in self.header.strings]
+            file_version = (self.version, self.user_version,
+                            self.user_version_2, self._byte_order)
+            source_view = memoryview(source)
+            self._block_dct = {}
+            self.blocks = []
+            block_start = stream.tell()
+            for block_num in range(self.header.num_blocks):
+                block_type, data_stream = self._get_block_type(block_num)
+                try:
+                    block = getattr(NifFormat, block_type)._create_lazy()
+                except AttributeError:
+                    raise ValueError(
+                        "Unknown block type '%s'." % block_type)
+                block_end = block_start + self.header.block_size[block_num]
+                block._read_on_access = partial(
+                    self._read_block, block, source, self._string_list,
+                    file_version, block_start, block_end, data_stream)
+                if self.copy_unmodified_blocks:
+                    block._source_bytes = source_view[block_start:block_end]
+                self._block_dct[block_num] = block
+                self.blocks.append(block)
+                block_start = block_end
+
+            stream.seek(block_start)
+            self._link_list = []
+            self._read_footer(stream)
+            # source bytes of the blocks are only valid for this key
+            if self.copy_unmodified_blocks:
+                self._source_key = self._get_source_key()
+
+        def _read_blocks_parallel(self, stream, source, filename):
+            """Read all blocks in a pool of processes (see L{read_jobs}),
+            and read the footer.
+
+            :param stream: The stream, positioned at the first block.
+            :type stream: ``file``
+            :param source: All bytes of the stream, or ``None`` if they
+                have not been read.
+            :type source: ``bytes``
+            :param filename: The name of the file of the stream, if any.
+            :type filename: ``str``
+            """
+            logger = logging.getLogger("pyffi.nif.data")
+            jobs = self.read_jobs or os.cpu_count() or 1
+            self.roots = []
+            self._string_list = [s for s in self.header.strings]
+            self._block_dct = {}
+            self.blocks = []
+            # split the blocks into batches of about equal size, several
+            # per process, so all processes keep busy until the end
+            block_sizes = self.header.block_size
+            batch_size = sum(block_sizes) // (4 * jobs) + 1
+            batches = []
+            batch = []
+            batch_start = block_start = stream.tell()
+            for block_num in range(self.header.num_blocks):
+                block_type, data_stream = self._get_block_type(block_num)
+                block_end = block_start + block_sizes[block_num]
+                batch.append((block_num, block_type, block_start, block_end,
+                              data_stream))
+                if block_end - batch_start >= batch_size:
+                    batches.append(batch)
+                    batch = []
+                    batch_start = block_end
+                block_start = block_end
+            if batch:
+                batches.append(batch)
+            footer_start = block_start
+            # the processes read from a memory map of the file, so a
+            # stream which is not a file on disk is copied to one first
+            temp_filename = None
+            if not (isinstance(filename, str) and os.path.isfile(filename)):
+                if source is None:
+                    stream.seek(0)
+                    source = stream.read()
+                fd, temp_filename = tempfile.mkstemp(suffix=".nif")
+                with os.fdopen(fd, "wb") as temp_stream:
+                    temp_stream.write(source)
+                filename = temp_filename
+            args = [(filename, self.version, self.user_version,
+                     self.user_version_2, self._byte_order,
+                     self._string_list, batch)
+                    for batch in batches]
+            self._link_list = []
+            if source is not None:
+                source_view = memoryview(source)
+            try:
+                with concurrent.futures.ProcessPoolExecutor(
+                        max_workers=min(jobs, len(batches))) as executor:
+                    for batch, results in zip(
+                            batches, executor.map(_read_block_batch, args)):
+                        for (block_num, block_type, block_start, block_end,
+                             data_stream), (block, link_list, size) in zip(
+                                 batch, results):
+                            self._block_dct[block_num] = block
+                            self.blocks.append(block)
+                            self._link_list.extend(link_list)
+                            # check block size against the number of
+                            # bytes read
+                            extra_size = block_end - block_start - size
+                            if extra_size != 0:
+                                if self.check_block_sizes:
+                                    logger.error(
+                                        "Block size check failed: corrupt"
+                                        " NIF file or bad nif.xml?")
+                                    logger.error(
+                                        "Skipping %i bytes in %s"
+                                        % (extra_size, block_type))
+                            elif self.copy_unmodified_blocks:
+                                block._source_bytes = (
+                                    source_view[block_start:block_end])
+            finally:
+                if temp_filename is not None:
+                    os.remove(temp_filename)
+
+            stream.seek(footer_start)
+            self._read_footer(stream)
+            # source bytes of the blocks are only valid for this key
+            if self.copy_unmodified_blocks:
+                self._source_key = self._get_source_key()
+
+        def _read_block(self, block, source, string_list, file_version,
+                        block_start, block_end, data_stream):
+            """Read a block which was created by L{_index_blocks}, and
+            resolve its links. The string list of the file is passed
+            along, as L{write} replaces it. So are the version, user
+            version, user version 2 and byte order of the file, as
+            these may have been changed since the file was read."""
+            logger = logging.getLogger("pyffi.nif.data")
+            logger.debug("Reading %s block at 0x%08X"
+                         % (block.__class__.__name__, block_start))
+            stream = BytesIO(source)
+            stream.seek(block_start)
+            link_list, self._link_list = self._link_list, []
+            old_string_list, self._string_list = self._string_list, string_list
+            old_version = (self.version, self.user_version,
+                           self.user_version_2, self._byte_order)
+            (self.version, self.user_version,
+             self.user_version_2, self._byte_order) = file_version
+            try:
+                block.read(stream, self)
+                for ref, block_index in self._link_list:
+                    ref.resolve_link(self, block_index)
+                # complete NiDataStream data
+                if data_stream is not None:
+                    block.usage = data_stream[0]
+                    block.access.populate_attribute_values(
+                        data_stream[1], self)
+            except:
+                logger.exception("Reading %s failed" % block.__class__)
+                raise
+            finally:
+                self._link_list = link_list
+                self._string_list = old_string_list
+                (self.version, self.user_version,
+                 self.user_version_2, self._byte_order) = old_version
+            if self.check_block_sizes and stream.tell() != block_end:
+                logger.error(
+                    "Block size check failed: corrupt NIF file "
+                    "or bad nif.xml?")
+                logger.error("Ignoring %i bytes in %s"
+                             % (block_end - stream.tell(),
+                                block.__class__.__name__))
+                # do not copy the bytes of a block which was misread
+                block._source_bytes = None
+
+        def get_blocks(self, block_type=None):
+            """Iterate over all blocks, in the order of the block list,
+            or over the blocks which are an instance of C{block_type}.
+            Checking the type of a block does not read it, so if blocks
+            are read on first access (see L{lazy_blocks}), then blocks
+            of other types are never read.
+
+            >>> from pyffi.formats.nif import NifFormat
+            >>> data = NifFormat.Data()
+            >>> data.blocks = [NifFormat.NiNode(), NifFormat.NiTriShape(),
+            ...                NifFormat.NiTriShapeData()]
+            >>> [block.__class__.__name__
+            ...  for block in data.get_blocks(NifFormat.NiAVObject)]
+            ['NiNode', 'NiTriShape']
+
+            :param block_type: The block type, or ``None`` for all blocks.
+            :type block_type: L{NifFormat.NiObject}
+            """
+            if block_type is None:
+                return iter(self.blocks)
+            return (block for block in self.blocks
+                    if isinstance(block, block_type))
+
+        def _get_block_index(self):
+            """Get the index of the tree at L{roots}, and build it first
+            if there is none, or if it is no longer valid. The reverse
+            reference index is built first, as the block index relies
+            on its link observers to see changes to the tree."""
+            ref_index = self._get_ref_index()
+            block_index = self._block_index
+            if block_index is None or not block_index.valid:
+                block_index = self._block_index = _BlockIndex(
+                    ref_index.roots)
+            return block_index
+
+        def find(self, block_name=None, block_type=None):
+            """Find the first block in the tree at L{roots} with the
+            given name and/or of the given type, in the same order as
+            L{NifFormat.NiObject.find}.
+
+            The first call builds an index of the tree, which maps every
+            block type and every block name to its blocks, and every
+            block to its parents. The index is used until a reference
+            in the tree is set or an array of references in the tree
+            changes length (for the types and parents), or the name of
+            a block in the tree is set (for the names). Until then,
+            L{NifFormat.NiObject.find}, L{NifFormat.NiObject.find_chain},
+            and L{NifFormat.NiObject.tree} use it as well for all blocks
+            in the tree, wherever this gives the same result.
+
+            >>> from pyffi.formats.nif import NifFormat
+            >>> data = NifFormat.Data()
+            >>> root = NifFormat.NiNode()
+            >>> root.name = "Scene Root"
+            >>> for name in ("Bip01", "Bip01 Head"):
+            ...     child = NifFormat.NiNode()
+            ...     child.name = name
+            ...     root.add_child(child)
+            >>> data.roots = [root]
+            >>> data.find(block_name=b"Bip01 Head").name
+            b'Bip01 Head'
+            >>> [block.name for block in data.find_all(
+            ...     block_type=NifFormat.NiNode)]
+            [b'Scene Root', b'Bip01', b'Bip01 Head']
+            >>> root.children[1].name = "Bip01 Neck"
+            >>> data.find(block_name=b"Bip01 Head") is None
+            True
+            >>> [block.name for block in data.get_parents(root.children[1])]
+            [b'Scene Root']
+
+            :param block_name: The name of the block, or ``None`` for
+                any name.
+            :type block_name: ``bytes``
+            :param block_type: The block type, or ``None`` for any type.
+            :type block_type: L{NifFormat.NiObject}
+            :return: The block, or ``None`` if there is no such block.
+            """
+            for block in self._get_block_index().find_all(
+                    block_name or None, block_type or None):
+                return block
+            return None
+
+        def find_all(self, block_name=None, block_type=None):
+            """Find all blocks in the tree at L{roots} with the given
+            name and/or of the given type. Every block is listed once,
+            in the order in which L{find} would find them.
+
+            :param block_name: The name of the blocks, or ``None`` for
+                any name.
+            :type block_name: ``bytes``
+            :param block_type: The block type, or ``None`` for any type.
+            :type block_type: L{NifFormat.NiObject}
+            :return: The blocks.
+            :rtype: ``list`` of L{NifFormat.NiObject}
+            """
+            return list(self._get_block_index().find_all(
+                block_name or None, block_type or None))
+
+        def get_parents(self, block):
+            """Get all blocks in the tree at L{roots} which refer to
+            C{block}, in the order of L{find_all}.
+
+            :param block: The block.
+            :type block: L{NifFormat.NiObject}
+            :return: The parents of the block.
+            :rtype: ``list`` of L{NifFormat.NiObject}
+            """
+            return self._get_block_index().get_parents(block)
 
         def write(self, stream):
             """Write a NIF file. The L{header} and the L{blocks} are recalculated
@@ -1450,16 +2070,27 @@ class NifFormat(FileFormat):
             self.blocks = [] # list of all blocks to be written
             self._block_index_dct = {} # maps block to block index
             block_type_list = [] # list of all block type strings
+            block_type_index_dct = {} # maps block type string to its index
             block_type_dct = {} # maps block to block type string index
-            self._string_list = []
+            self._string_list = [] # unique strings, in first-seen order
+            self._string_dct = {} # maps string to string index
             for root in self.roots:
                 self._makeBlockList(root,
                                     self._block_index_dct,
-                                    block_type_list, block_type_dct)
-                for block in root.tree():
-                    self._string_list.extend(
-                        block.get_strings(self))
-            self._string_list = list(set(self._string_list)) # ensure unique elements
+                                    block_type_list, block_type_dct,
+                                    block_type_index_dct)
+            for block in self.blocks:
+                for s in block.get_strings(self):
+                    if s not in self._string_dct:
+                        self._string_dct[s] = len(self._string_list)
+                        self._string_list.append(s)
+            # keep the order of the header if the strings are unchanged
+            header_strings = list(self.header.strings)
+            if (len(set(header_strings)) == len(header_strings)
+                and set(header_strings) == set(self._string_list)):
+                self._string_list = header_strings
+                self._string_dct = dict(
+                    (s, i) for i, s in enumerate(header_strings))
             #print(self._string_list) # debug
 
             self.header.user_version = self.user_version # TODO dedicated type for user_version similar to FileVersion
@@ -1481,9 +2112,25 @@ class NifFormat(FileFormat):
             self.header.strings.update_size()
             for i, s in enumerate(self._string_list):
                 self.header.strings[i] = s
+
+            # write every block into its own buffer: the block sizes
+            # in the header are the number of bytes actually written
+            block_buffers = []
+            copy_blocks = (self._source_key is not None
+                           and self._source_key == self._get_source_key())
+            for block in self.blocks:
+                if copy_blocks and block._source_bytes is not None:
+                    logger.debug("Copying %s block"
+                                 % block.__class__.__name__)
+                    block_buffers.append(block._source_bytes)
+                    continue
+                logger.debug("Writing %s block" % block.__class__.__name__)
+                block_stream = BytesIO()
+                block.write(block_stream, self)
+                block_buffers.append(block_stream.getvalue())
             self.header.block_size.update_size()
-            for i, block in enumerate(self.blocks):
-                self.header.block_size[i] = block.get_size(data=self)
+            for i, block_buffer in enumerate(block_buffers):
+                self.header.block_size[i] = len(block_buffer)
             #if verbose >= 2:
             #    print(hdr)
 
@@ -1494,42 +2141,57 @@ class NifFormat(FileFormat):
             for i, root in enumerate(self.roots):
                 ftr.roots[i] = root
 
-            # write the file
+            # write the file into a buffer, and emit it in one go
+            buffer = BytesIO()
             logger.debug("Writing header")
             #logger.debug("%s" % self.header)
-            self.header.write(stream, self)
-            for block in self.blocks:
+            self.header.write(buffer, self)
+            for block, block_buffer in zip(self.blocks, block_buffers):
                 # signal top level object if block is a root object
                 if self.version < 0x0303000D and block in self.roots:
                     s = NifFormat.SizedString()
                     s.set_value("Top Level Object")
-                    s.write(stream, self)
+                    s.write(buffer, self)
                 if self.version >= 0x05000001:
                     if self.version <= 0x0A01006A:
                         # write zero dummy separator
-                        stream.write('\x00\x00\x00\x00'.encode("ascii"))
+                        buffer.write('\x00\x00\x00\x00'.encode("ascii"))
                 else:
                     # write block type string
                     s = NifFormat.SizedString()
                     assert(block_type_list[block_type_dct[block]]
                            == block.__class__.__name__) # debug
                     s.set_value(block.__class__.__name__)
-                    s.write(stream, self)
+                    s.write(buffer, self)
                 # write block index
-                logger.debug("Writing %s block" % block.__class__.__name__)
                 if self.version < 0x0303000D:
-                    stream.write(struct.pack(self._byte_order + 'i',
+                    buffer.write(struct.pack(self._byte_order + 'i',
                                              self._block_index_dct[block]))
                 # write block
-                block.write(stream, self)
+                buffer.write(block_buffer)
             if self.version < 0x0303000D:
                 s = NifFormat.SizedString()
                 s.set_value("End Of File")
-                s.write(stream, self)
-            ftr.write(stream, self)
+                s.write(buffer, self)
+            ftr.write(buffer, self)
+            stream.write(buffer.getbuffer())
+
+        def _get_source_key(self):
+            """Return everything, besides the blocks themselves, on which
+            the bytes of the blocks depend: the version, the byte order,
+            the block list (through block indices), and the string list
+            (through string indices, for versions 20.1.0.3 and up).
+            """
+            if self.version >= 0x14010003:
+                strings = list(self.header.strings)
+            else:
+                strings = None
+            return (self.version, self.user_version, self.user_version_2,
+                    self._byte_order, list(self.blocks), strings)
 
         def _makeBlockList(
-            self, root, block_index_dct, block_type_list, block_type_dct):
+            self, root, block_index_dct, block_type_list, block_type_dct,
+            block_type_index_dct=None):
             """This is a helper function for write to set up the list of all blocks,
             the block index map, and the block type map.
 
@@ -1544,7 +2206,15 @@ class NifFormat(FileFormat):
             :param block_type_dct: Dictionary mapping blocks in self.blocks to
                 their block type index.
             :type block_type_dct: dict
+            :param block_type_index_dct: Dictionary mapping the block types
+                in C{block_type_list} to their index. If ``None``, it is
+                built from C{block_type_list}.
+            :type block_type_index_dct: dict
             """
+            if block_type_index_dct is None:
+                block_type_index_dct = dict(
+                    (block_type, i)
+                    for i, block_type in enumerate(block_type_list))
 
             def _blockChildBeforeParent(block):
                 """Determine whether block comes before its parent or not, depending
@@ -1560,7 +2230,8 @@ class NifFormat(FileFormat):
                         and not isinstance(block, NifFormat.bhkConstraint))
 
             # block already listed? if so, return
-            if root in self.blocks:
+            # (block_index_dct has the same keys as self.blocks)
+            if root in block_index_dct:
                 return
             # add block type to block type dictionary
             block_type = root.__class__.__name__
@@ -1569,9 +2240,10 @@ class NifFormat(FileFormat):
                 block_type = ("NiDataStream\x01%i\x01%i"
                               % (root.usage, root.access.get_attributes_values(self)))
             try:
-                block_type_dct[root] = block_type_list.index(block_type)
-            except ValueError:
-                block_type_dct[root] = len(block_type_list)
+                block_type_dct[root] = block_type_index_dct[block_type]
+            except KeyError:
+                block_type_dct[root] = block_type_index_dct[block_type] = len(
+                    block_type_list)
                 block_type_list.append(block_type)
 
             # special case: add bhkConstraint entities before bhkConstraint
@@ -1580,7 +2252,8 @@ class NifFormat(FileFormat):
                 for entity in root.entities:
                     if entity is not None:
                         self._makeBlockList(
-                            entity, block_index_dct, block_type_list, block_type_dct)
+                            entity, block_index_dct, block_type_list, block_type_dct,
+                            block_type_index_dct)
 
             children_left = []
             # add children that come before the block
@@ -1588,7 +2261,8 @@ class NifFormat(FileFormat):
             for child in root.get_refs(data=self):
                 if _blockChildBeforeParent(child):
                     self._makeBlockList(
-                        child, block_index_dct, block_type_list, block_type_dct)
+                        child, block_index_dct, block_type_list, block_type_dct,
+                        block_type_index_dct)
                 else:
                     children_left.append(child)
 
@@ -1602,7 +2276,8 @@ class NifFormat(FileFormat):
             # add children that come after the block
             for child in children_left:
                 self._makeBlockList(
-                    child, block_index_dct, block_type_list, block_type_dct)
+                    child, block_index_dct, block_type_list, block_type_dct,
+                    block_type_index_dct)
 
     # extensions of generated structures
 
@@ -5183,9 +5858,8 @@ class NifFormat(FileFormat):
             """This function yields all skinned geometries which have self as
             skeleton root.
             """
-            for geom in self.get_global_iterator():
-                if (isinstance(geom, NifFormat.NiGeometry)
-                    and geom.is_skin()
+            for geom in self.tree(block_type=NifFormat.NiGeometry, unique=True):
+                if (geom.is_skin()
                     and geom.skin_instance.skeleton_root is self):
                     yield geom
 
@@ -5712,7 +6386,41 @@ class NifFormat(FileFormat):
             self.add_extra_data(extra)
 
     class NiObject:
+        def set_link_observer(self, observer, data=None):
+            StructBase.set_link_observer(self, observer, data)
+            # block names are indexed too
+            if "_name_value_" in self._lazy_attributes:
+                name = self._name_value_
+                if isinstance(name, NifFormat.string):
+                    name._link_observer = observer
+
+        def _get_block_index(self):
+            """Get the valid index of the data whose tree contains this
+            block, if there is one, and if the tree of this block is a
+            slice of it (see L{_BlockIndex.is_closed})."""
+            observer = self._link_observer
+            if observer is None:
+                return None
+            data = observer.data()
+            if data is None:
+                return None
+            block_index = data._block_index
+            if (block_index is None or not block_index.valid
+                or not block_index.contains(self)
+                or not block_index.is_closed(self)):
+                return None
+            return block_index
+
         def find(self, block_name = None, block_type = None):
+            # use the index of the tree which contains this block, if any
+            if block_name or block_type:
+                block_index = self._get_block_index()
+                if block_index is not None:
+                    for block in block_index.find_all(
+                            block_name or None, block_type or None, self):
+                        return block
+                    return None
+
             # does this block match the search criteria?
             if block_name and block_type:
                 if isinstance(self, block_type):
@@ -5745,6 +6453,13 @@ class NifFormat(FileFormat):
             :param block_type: The type that blocks should have in this chain."""
 
             if self is block: return [self]
+            # use the index of the tree which contains this block, if any
+            block_index = self._get_block_index()
+            if block_index is not None:
+                chain = block_index.find_chain(self, block)
+                if not block_type or all(
+                        isinstance(child, block_type) for child in chain[1:]):
+                    return chain
             for child in self.get_refs():
                 if block_type and not isinstance(child, block_type): continue
                 child_chain = child.find_chain(block, block_type)
@@ -5768,26 +6483,23 @@ class NifFormat(FileFormat):
             :param follow_all: If C{block_type} is not ``None``, then if this is ``True`` the function will parse the whole tree. Otherwise, the function will not follow branches that start by a non-C{block_type} block.
 
             :param unique: Whether the generator can return the same block twice or not."""
-            # unique blocks: reduce this to the case of non-unique blocks
-            if unique:
-                block_list = []
-                for block in self.tree(block_type = block_type, follow_all = follow_all, unique = False):
-                    if not block in block_list:
+            # use the index of the tree which contains this block, if any
+            if unique and (follow_all or not block_type):
+                block_index = self._get_block_index()
+                if block_index is not None:
+                    for block in block_index.find_all(None, block_type, self):
                         yield block
-                        block_list.append(block)
-                return
-
-            # yield self
-            if not block_type:
-                yield self
-            elif isinstance(self, block_type):
-                yield self
-            elif not follow_all:
-                return # don't recurse further
-
-            # yield tree attached to each child
-            for child in self.get_refs():
-                for block in child.tree(block_type = block_type, follow_all = follow_all):
+                    return
+            # walk the tree, skipping branches of the wrong type if
+            # only matching branches are followed
+            if block_type and not follow_all:
+                accept = lambda block: isinstance(block, block_type)
+            else:
+                accept = None
+            for block in walk(
+                    self, lambda block: block.get_refs(),
+                    unique=unique, accept=accept):
+                if not block_type or isinstance(block, block_type):
                     yield block
 
         def _validateTree(self):
@@ -5797,11 +6509,11 @@ class NifFormat(FileFormat):
             # will visit some child more than once (and as a consequence, infinitely
             # many times). So, walk the reference tree and check that every block is
             # only visited once.
-            children = []
+            children = set()
             for child in self.tree():
-                if child in children:
+                if id(child) in children:
                     raise ValueError('cyclic references detected')
-                children.append(child)
+                children.add(id(child))
 
         def is_interchangeable(self, other):
             """Are the two blocks interchangeable?
@@ -7300,6 +8012,424 @@ class NifFormat(FileFormat):
             v.v = -self.v
             return v
 
+def _read_block_batch(args):
+    """Read a batch of consecutive blocks, in a separate process, for
+    L{NifFormat.Data.read_jobs}. Links are not resolved: the block
+    index of every reference is sent back along with the blocks.
+
+    :param args: The name of the file; the version, user version, user
+        version 2, and byte order; the string list; and the block
+        number, the name of the block type, the start and end offset,
+        and the data stream parameters of every block in the batch.
+    :type args: ``tuple``
+    :return: For every block, the block, its (reference, block index)
+        pairs, and the number of bytes read.
+    :rtype: ``list``
+    """
+    (filename, version, user_version, user_version_2, byte_order,
+     string_list, batch) = args
+    logger = logging.getLogger("pyffi.nif.data")
+    data = NifFormat.Data(version, user_version, user_version_2)
+    data._byte_order = byte_order
+    data._string_list = string_list
+    results = []
+    with open(filename, "rb") as stream:
+        stream = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    with stream:
+        for (block_num, block_type, block_start, block_end,
+             data_stream) in batch:
+            block = getattr(NifFormat, block_type)()
+            data._link_list = []
+            stream.seek(block_start)
+            try:
+                block.read(stream, data)
+            except:
+                logger.exception("Reading %s failed" % block.__class__)
+                raise
+            if data_stream is not None:
+                block.usage = data_stream[0]
+                block.access.populate_attribute_values(data_stream[1], data)
+            results.append(
+                (block, data._link_list, stream.tell() - block_start))
+    return results
+
+
+class _BlockObserver(object):
+    """Link observer of a block in the tree of a L{NifFormat.Data}. It
+    is set on the block, on all its references and arrays of links, and
+    on its name (see L{NifFormat.NiObject.set_link_observer}), and
+    passes their changes on to the data, so its indices are kept up to
+    date.
+    """
+    __slots__ = ('block', 'data')
+
+    def __init__(self, block, data):
+        self.block = block
+        # weak reference, so blocks do not keep their data alive
+        self.data = weakref.ref(data)
+
+    def set_link(self, ref, value):
+        """Called by C{ref} before it is set to C{value}."""
+        data = self.data()
+        if data is not None:
+            data._set_link(self.block, ref, value)
+
+    def resized(self, links):
+        """Called by the array C{links} after its length changed."""
+        data = self.data()
+        if data is not None:
+            data._links_resized(self.block, links)
+
+    def set_name(self, name):
+        """Called by the name of the block after it is set."""
+        data = self.data()
+        if data is not None:
+            data._set_name(self.block)
+
+
+class _RefIndex(object):
+    """Reverse reference index of the tree at the roots of a
+    L{NifFormat.Data}: maps every block to the references
+    (L{NifFormat.Ref} and L{NifFormat.Ptr} instances) which point to
+    it, for L{NifFormat.Data.replace_global_node}. Like that method, it
+    covers all blocks which can be reached from the roots through
+    references, but not through pointers.
+
+    Every block in the index gets a L{_BlockObserver}, so the index is
+    updated whenever one of its references is set, or one of its
+    arrays of links is resized. Blocks are counted by the number of
+    references to them: when no reference is left, the block has left
+    the tree, and it is removed from the index along with its
+    references.
+
+    If a block is also in the index of another data, then the index
+    of that data is no longer valid, and must be built again.
+    """
+
+    def __init__(self, data):
+        self.roots = list(data.roots)
+        self.valid = True
+        self.data = weakref.ref(data)
+        # observer of every block in the index, by id of the block
+        self._observers = {}
+        # link slots of every block in the index, by id of the block
+        self._slots = {}
+        # number of roots and references (but not pointers) which are
+        # in the index and refer to a block, by id of the block
+        self._counts = {}
+        # references to every block, by id of the block and of the
+        # reference
+        self._refs = {}
+        for root in self.roots:
+            if root is not None:
+                self._acquire(root)
+
+    def _acquire(self, block):
+        """Count a new reference to C{block}, and add the tree at
+        C{block} if it is not in the index yet."""
+        self._counts[id(block)] = self._counts.get(id(block), 0) + 1
+        if id(block) not in self._observers:
+            self._add_tree(block)
+
+    def _release(self, block):
+        """Count a reference to C{block} less, and remove the part of
+        the tree at C{block} which is no longer referred to."""
+        count = self._counts[id(block)] - 1
+        if count:
+            self._counts[id(block)] = count
+        else:
+            self._remove_tree(block)
+
+    def _add_tree(self, root):
+        data = self.data()
+        stack = [root]
+        while stack:
+            block = stack.pop()
+            if id(block) in self._observers:
+                continue
+            # the block leaves the index of any other data
+            other = block._link_observer
+            other_data = other.data() if other is not None else None
+            if other_data is not None and other_data is not data:
+                other_data._ref_index = None
+                other_data._block_index = None
+            slots = block.get_link_slots()
+            observer = self._observers[id(block)] = _BlockObserver(
+                block, data)
+            block.set_link_observer(observer)
+            self._slots[id(block)] = slots
+            for slot in slots:
+                target = slot.get_value()
+                if target is None:
+                    continue
+                self._refs.setdefault(id(target), {})[id(slot)] = slot
+                if slot._has_refs:
+                    self._counts[id(target)] = (
+                        self._counts.get(id(target), 0) + 1)
+                    if id(target) not in self._observers:
+                        stack.append(target)
+
+    def _remove_tree(self, root):
+        stack = [root]
+        while stack:
+            block = stack.pop()
+            del self._counts[id(block)]
+            observer = self._observers.pop(id(block))
+            slots = self._slots.pop(id(block))
+            if block._link_observer is observer:
+                block.set_link_observer(None)
+            for slot in slots:
+                target = slot.get_value()
+                if target is None:
+                    continue
+                self._refs.get(id(target), {}).pop(id(slot), None)
+                if slot._has_refs:
+                    count = self._counts[id(target)] - 1
+                    if count:
+                        self._counts[id(target)] = count
+                    else:
+                        stack.append(target)
+
+    def is_indexed(self, block):
+        """Whether C{block} is in the index."""
+        observer = self._observers.get(id(block))
+        return observer is not None and observer.block is block
+
+    def set_root(self, index, root):
+        """Update the index for the root at C{index} about to be set
+        to C{root}."""
+        oldroot = self.roots[index]
+        self.roots[index] = root
+        if root is not None:
+            self._acquire(root)
+        if oldroot is not None:
+            self._release(oldroot)
+
+    def set_link(self, block, ref, value):
+        """Update the index for C{ref} of C{block} about to be set to
+        C{value}. The block must be in the index."""
+        target = ref.get_value()
+        if target is value:
+            return
+        if value is not None:
+            self._refs.setdefault(id(value), {})[id(ref)] = ref
+            # pointers are not followed
+            if ref._has_refs:
+                self._acquire(value)
+        if target is not None:
+            self._refs.get(id(target), {}).pop(id(ref), None)
+            if ref._has_refs:
+                self._release(target)
+
+    def update_block(self, block):
+        """Update the index for the link slots of C{block}, as an
+        array of links of C{block} changed length. The block must be
+        in the index."""
+        observer = self._observers[id(block)]
+        old_slots = self._slots[id(block)]
+        slots = self._slots[id(block)] = block.get_link_slots()
+        block.set_link_observer(observer)
+        old_ids = set(id(slot) for slot in old_slots)
+        new_ids = set(id(slot) for slot in slots)
+        for slot in slots:
+            target = slot.get_value()
+            if target is None or id(slot) in old_ids:
+                continue
+            self._refs.setdefault(id(target), {})[id(slot)] = slot
+            if slot._has_refs:
+                self._acquire(target)
+        for slot in old_slots:
+            if id(slot) in new_ids:
+                continue
+            # the slot is no longer in the block
+            slot.set_link_observer(None)
+            target = slot.get_value()
+            if target is None:
+                continue
+            self._refs.get(id(target), {}).pop(id(slot), None)
+            if slot._has_refs:
+                self._release(target)
+
+    def replace(self, oldbranch, newbranch):
+        """Set all references to C{oldbranch} to C{newbranch}."""
+        if oldbranch is newbranch:
+            return
+        # references in blocks which are added to the index along with
+        # newbranch are replaced as well, hence the loop
+        while True:
+            refs = self._refs.pop(id(oldbranch), None)
+            if not refs:
+                break
+            for ref in list(refs.values()):
+                # skip references in blocks which left the tree, and
+                # pointers to blocks which no longer exist
+                observer = ref._link_observer
+                if (observer is None or not self.is_indexed(observer.block)
+                    or ref.get_value() is not oldbranch):
+                    continue
+                # the block is modified
+                observer.block._source_bytes = None
+                ref.set_value(newbranch)
+
+
+class _BlockIndex(object):
+    """Index of the tree at a list of roots, for L{NifFormat.Data.find}:
+    lists all blocks which can be reached from the roots through
+    references, in the order in which L{NifFormat.NiObject.tree} first
+    finds them, and maps every block type and every block name to its
+    blocks, and every block to its parents.
+
+    For every block, the blocks which are first found in its tree
+    follow it directly, so the tree of the block is a slice of the
+    list, provided that it contains all blocks which can be reached
+    from the block. This is the case, unless the tree contains a
+    block which was found earlier, through another parent (see
+    L{is_closed}).
+
+    The index is valid until the data which owns it sees a reference
+    in the tree being set, or an array of references in the tree
+    changing length, see L{invalidate}.
+    """
+
+    def __init__(self, roots):
+        self.roots = list(roots)
+        self.valid = False
+        # all blocks, in tree order
+        self.blocks = []
+        # position of every block, by id
+        self.positions = {}
+        # end of the tree of every block, by id
+        self._ends = {}
+        # lowest position of any block in the tree of every block, by id
+        self._lows = {}
+        # parent through which every block was first found, by id
+        self._first_parents = {}
+        # all parents of every block, by id
+        self._parents = {}
+        # positions of all blocks of a type, by type
+        self._type_positions = {}
+        # positions of all blocks with a name, by name, or None
+        self._name_positions = None
+        self._build()
+        self.valid = True
+
+    def _build(self):
+        blocks = self.blocks
+        positions = self.positions
+        lows = self._lows
+        parents = self._parents
+        stack = []
+        for root in self.roots:
+            if root is None or id(root) in positions:
+                continue
+            positions[id(root)] = lows[id(root)] = len(blocks)
+            blocks.append(root)
+            self._first_parents[id(root)] = None
+            stack.append((root, iter(root.get_refs())))
+            while stack:
+                block, children = stack[-1]
+                for child in children:
+                    child_parents = parents.setdefault(id(child), [])
+                    if all(parent is not block for parent in child_parents):
+                        child_parents.append(block)
+                    if id(child) in positions:
+                        # found earlier
+                        lows[id(block)] = min(lows[id(block)],
+                                              lows[id(child)])
+                        continue
+                    positions[id(child)] = lows[id(child)] = len(blocks)
+                    blocks.append(child)
+                    self._first_parents[id(child)] = block
+                    stack.append((child, iter(child.get_refs())))
+                    break
+                else:
+                    stack.pop()
+                    self._ends[id(block)] = len(blocks)
+                    if stack:
+                        parent = stack[-1][0]
+                        lows[id(parent)] = min(lows[id(parent)],
+                                               lows[id(block)])
+
+    def invalidate(self):
+        """Mark the index as no longer valid."""
+        self.valid = False
+
+    def invalidate_names(self):
+        """Forget the names of the blocks, as one may have changed."""
+        self._name_positions = None
+
+    def contains(self, block):
+        """Whether C{block} is in the index."""
+        position = self.positions.get(id(block))
+        return position is not None and self.blocks[position] is block
+
+    def is_closed(self, block):
+        """Whether the tree of C{block} is a slice of the block list,
+        that is, whether no block in the tree was found earlier."""
+        return self._lows[id(block)] >= self.positions[id(block)]
+
+    def _get_type_positions(self, block_type):
+        try:
+            return self._type_positions[block_type]
+        except KeyError:
+            type_positions = self._type_positions[block_type] = [
+                position for position, block in enumerate(self.blocks)
+                if isinstance(block, block_type)]
+            return type_positions
+
+    def _get_name_positions(self, block_name):
+        if self._name_positions is None:
+            self._name_positions = {}
+            for position, block in enumerate(self.blocks):
+                try:
+                    name = block.name
+                except AttributeError:
+                    continue
+                self._name_positions.setdefault(name, []).append(position)
+        return self._name_positions.get(block_name, [])
+
+    def find_all(self, block_name, block_type, root=None):
+        """Iterate over all blocks in the tree of C{root}, or of all
+        roots, with the given name and/or of the given type. The tree
+        of C{root} must be closed (see L{is_closed})."""
+        if root is None:
+            start, end = 0, len(self.blocks)
+        else:
+            start = self.positions[id(root)]
+            end = self._ends[id(root)]
+        if block_name is not None:
+            positions = self._get_name_positions(block_name)
+        elif block_type is not None:
+            positions = self._get_type_positions(block_type)
+        else:
+            return iter(self.blocks[start:end])
+        blocks = (self.blocks[position] for position in positions[
+            bisect.bisect_left(positions, start):
+            bisect.bisect_left(positions, end)])
+        if block_name is not None and block_type is not None:
+            return (block for block in blocks if isinstance(block, block_type))
+        return blocks
+
+    def find_chain(self, root, block):
+        """Find the chain of blocks from C{root} to C{block}, through
+        the parents through which every block was first found. The
+        tree of C{root} must be closed (see L{is_closed})."""
+        if (not self.contains(block) or not self.positions[id(root)]
+            < self.positions[id(block)] < self._ends[id(root)]):
+            return []
+        chain = [block]
+        while block is not root:
+            block = self._first_parents[id(block)]
+            chain.append(block)
+        chain.reverse()
+        return chain
+
+    def get_parents(self, block):
+        """Get the parents of C{block}, in tree order."""
+        return sorted(self._parents.get(id(block), ()),
+                      key=lambda parent: self.positions[id(parent)])
+
+
 if __name__=='__main__':
     import doctest
     doctest.testmod()
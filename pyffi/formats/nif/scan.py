@@ -0,0 +1,234 @@
+"""Scan the headers of many nif files at once.
+
+Reading just the header of a nif file (see
+:meth:`NifFormat.Data.inspect <pyffi.formats.nif.NifFormat.Data.inspect>`)
+is enough to answer most questions about a collection of files, such as
+which files contain a particular block type, how many files there are of
+every version, or how large their string tables are. This module reads
+the headers of all nif files in a directory tree, in a pool of processes
+or threads, and summarizes every file in a dictionary, which can be
+written as JSON or CSV.
+
+>>> summary = summarize("tests/spells/nif/files/test_check_tangentspace2.nif")
+>>> print("0x%08X" % summary["version"])
+0x14020007
+>>> summary["block_types"]["NiTriStrips"], summary["num_strings"]
+(1, 3)
+>>> files = [summary["file"] for summary in scan("tests/spells/nif/files",
+...                                                jobs=1)
+...          if "bhkMoppBvTreeShape" in (summary["block_types"] or ())]
+>>> for filename in files:
+...     print(filename.replace("\\\\", "/"))
+tests/spells/nif/files/test_mopp.nif
+tests/spells/nif/files/test_opt_collision_complex_mopp.nif
+tests/spells/nif/files/test_opt_collision_mopp.nif
+tests/spells/nif/files/test_opt_collision_to_boxshape_notabox.nif
+"""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, NIF File Format Library and Tools.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import collections
+import concurrent.futures
+import csv
+import itertools
+import json
+import os
+
+import pyffi.utils
+from pyffi.formats.nif import NifFormat
+
+FIELDS = ("file", "file_size", "version", "user_version", "user_version_2",
+          "num_blocks", "block_types", "block_sizes", "num_strings",
+          "max_string_length", "error")
+"""Keys of every summary, in the order of the CSV columns."""
+
+
+def summarize(filename):
+    """Read the header of a nif file, and summarize it.
+
+    Fields which are not stored in the header of the file's version
+    are ``None``, as are all fields from the version on if the header
+    cannot be read, in which case ``error`` describes why.
+
+    :param filename: The name of the file.
+    :type filename: ``str``
+    :return: The summary of the file, with keys :data:`FIELDS`.
+        Block types and block sizes map the name of every block type
+        to the number of blocks of that type, and to the total size of
+        these blocks, respectively.
+    :rtype: ``dict``
+    """
+    summary = dict.fromkeys(FIELDS)
+    summary["file"] = filename
+    data = NifFormat.Data()
+    try:
+        summary["file_size"] = os.path.getsize(filename)
+        with open(filename, "rb") as stream:
+            data.inspect(stream)
+    except Exception as exc:
+        summary["error"] = "%s: %s" % (exc.__class__.__name__, exc)
+        return summary
+    header = data.header
+    summary["version"] = data.version
+    summary["user_version"] = data.user_version
+    summary["user_version_2"] = data.user_version_2
+    if data.version >= 0x0303000D:
+        summary["num_blocks"] = header.num_blocks
+    if data.version >= 0x0A000100:
+        # note the 0xfff mask: required for the NiPhysX blocks
+        block_types = []
+        for block_type_index in header.block_type_index:
+            block_type = header.block_types[block_type_index & 0xfff]
+            block_type = block_type.decode("ascii")
+            # NiDataStreams are special
+            if block_type.startswith("NiDataStream\x01"):
+                block_type = "NiDataStream"
+            block_types.append(block_type)
+        summary["block_types"] = counts = {}
+        for block_type in block_types:
+            counts[block_type] = counts.get(block_type, 0) + 1
+        if data.version >= 0x14020007:
+            summary["block_sizes"] = sizes = {}
+            for block_type, block_size in zip(block_types,
+                                              header.block_size):
+                sizes[block_type] = sizes.get(block_type, 0) + block_size
+    if data.version >= 0x14010003:
+        summary["num_strings"] = header.num_strings
+        summary["max_string_length"] = header.max_string_length
+    return summary
+
+
+def _summarize_chunk(filenames):
+    """Summarize a chunk of files, in a process of :func:`scan`."""
+    return [summarize(filename) for filename in filenames]
+
+
+def scan(top, jobs=None, use_threads=False, chunksize=16):
+    """A generator which summarizes every nif file in directory top,
+    as found by :func:`pyffi.utils.walk`, in that order. The argument
+    top can also be a file instead of a directory. The headers are read
+    in a pool of processes (or threads).
+
+    :param top: The top folder, or a file.
+    :type top: ``str``
+    :param jobs: The number of processes (or threads) to use. Use
+        ``None`` for the number of processors, and 1 to read all headers
+        in the current thread.
+    :type jobs: ``int``
+    :param use_threads: Whether to use threads rather than processes.
+        Threads help only if reading the files is slow, for instance on
+        a network drive.
+    :type use_threads: ``bool``
+    :param chunksize: The number of files handed to a process at once.
+        Threads are handed one file at a time.
+    :type chunksize: ``int``
+    :return: The summary of every file, see :func:`summarize`.
+    """
+    filenames = pyffi.utils.walk(top, re_filename=NifFormat.RE_FILENAME)
+    if jobs == 1:
+        for filename in filenames:
+            yield summarize(filename)
+        return
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if use_threads:
+        executor_class = concurrent.futures.ThreadPoolExecutor
+        chunksize = 1
+    else:
+        executor_class = concurrent.futures.ProcessPoolExecutor
+    # chunks are submitted as files are walked, and as chunks finish, so
+    # the pool keeps busy even if a file is slow to read, and memory use
+    # does not grow with the number of files; summaries are yielded in
+    # order, from the chunks at the front which have finished
+    max_running = 4 * jobs
+    pending = collections.deque()
+    running = set()
+    with executor_class(max_workers=jobs) as executor:
+        while True:
+            while len(running) < max_running:
+                chunk = list(itertools.islice(filenames, chunksize))
+                if not chunk:
+                    break
+                future = executor.submit(_summarize_chunk, chunk)
+                pending.append(future)
+                running.add(future)
+            while pending and pending[0].done():
+                for summary in pending.popleft().result():
+                    yield summary
+            if not pending:
+                break
+            done, not_done = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            running -= done
+
+
+def write_json(summaries, stream):
+    """Write summaries to a text stream, as JSON lines, that is, one
+    JSON object per line.
+
+    >>> import io
+    >>> stream = io.StringIO()
+    >>> write_json([dict(file="a.nif", version=0x14020007)], stream)
+    >>> print(stream.getvalue().strip())
+    {"file": "a.nif", "version": 335675399}
+    """
+    for summary in summaries:
+        stream.write(json.dumps(summary, sort_keys=True))
+        stream.write("\n")
+
+
+def write_csv(summaries, stream):
+    """Write summaries to a text stream, as CSV with columns
+    :data:`FIELDS`. Block types and block sizes are written as
+    space separated ``name:value`` pairs.
+
+    >>> import io
+    >>> stream = io.StringIO()
+    >>> write_csv([summarize("tests/spells/nif/files/test.nif")], stream)
+    >>> print(stream.getvalue().splitlines()[1])
+    tests/spells/nif/files/test.nif,519,335609859,0,0,3,NiNode:1 NiTriShape:1 NiTriShapeData:1,,2,4,
+    """
+    writer = csv.DictWriter(stream, FIELDS, lineterminator="\n")
+    writer.writeheader()
+    for summary in summaries:
+        row = dict(summary)
+        for key in ("block_types", "block_sizes"):
+            if row[key] is not None:
+                row[key] = " ".join("%s:%i" % item
+                                    for item in sorted(row[key].items()))
+        writer.writerow(row)
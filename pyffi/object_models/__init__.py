@@ -179,6 +179,20 @@ class FileFormat(object):
         user_version = None
         """User version (additional version field) of the data."""
 
+        use_codecs = False
+        """Set to ``True`` to read and write structs through compiled
+        codecs, see :mod:`pyffi.object_models.xml.codec`. Faster, and
+        gives identical results, but each struct class compiles a codec
+        for every version on first use.
+        """
+
+        use_packed_arrays = False
+        """Set to ``True`` to store arrays of plain integers and floats
+        as ``array.array`` values on read, rather than as one instance
+        per element, and to read and write them in bulk. See
+        :class:`~pyffi.object_models.xml.array.Array`.
+        """
+
         def inspect(self, stream):
             """Quickly checks whether the stream appears to contain
             data of a particular format. Resets stream to original position.
@@ -84,6 +84,22 @@ def _as_str(value):
     else:
         raise TypeError("expected bytes")
 
+def _get_structs(fmt):
+    """Helper function which compiles a struct format for both byte
+    orders, so values can be read and written without parsing the
+    format every time.
+
+    :param fmt: The struct format, without byte order.
+    :type fmt: ``str``
+    :return: The compiled formats, by byte order (``'<'`` or ``'>'``).
+    :rtype: ``dict``
+
+    >>> _get_structs('H')['>'].pack(1)
+    b'\\x00\\x01'
+    """
+    return dict((byte_order, struct.Struct(byte_order + fmt))
+                for byte_order in "<>")
+
 class Int(BasicBase, EditableSpinBox):
     """Basic implementation of a 32-bit signed integer type. Also serves as a
     base class for all other integer types. Follows specified byte order.
@@ -118,11 +134,19 @@ class Int(BasicBase, EditableSpinBox):
     >>> hex(i.get_value())
     '0x44332211'
     """
+    __slots__ = ()
 
     _min = -0x80000000 #: Minimum value.
     _max = 0x7fffffff  #: Maximum value.
     _struct = 'i'      #: Character used to represent type in struct.
     _size = 4          #: Number of bytes.
+    _structs = _get_structs(_struct) #: Compiled struct, by byte order.
+
+    def __init_subclass__(cls, **kwargs):
+        """Compile the struct format of subclasses."""
+        super(Int, cls).__init_subclass__(**kwargs)
+        if "_struct" in cls.__dict__:
+            cls._structs = _get_structs(cls._struct)
 
     def __init__(self, **kwargs):
         """Initialize the integer."""
@@ -163,8 +187,8 @@ class Int(BasicBase, EditableSpinBox):
         :param stream: The stream to read from.
         :type stream: file
         """
-        self._value = struct.unpack(data._byte_order + self._struct,
-                                    stream.read(self._size))[0]
+        self._value, = self._structs[data._byte_order].unpack(
+            stream.read(self._size))
 
     def write(self, stream, data):
         """Write value to stream.
@@ -172,7 +196,7 @@ class Int(BasicBase, EditableSpinBox):
         :param stream: The stream to write to.
         :type stream: file
         """
-        stream.write(struct.pack(data._byte_order + self._struct, self._value))
+        stream.write(self._structs[data._byte_order].pack(self._value))
 
     def __str__(self):
         return str(self.get_value())
@@ -185,6 +209,8 @@ class Int(BasicBase, EditableSpinBox):
         """
         return cls._size
 
+    _get_static_size = get_size
+
     def get_hash(self, data=None):
         """Return a hash value for this value.
 
@@ -208,6 +234,7 @@ class Int(BasicBase, EditableSpinBox):
 
 class UInt(Int):
     """Implementation of a 32-bit unsigned integer type."""
+    __slots__ = ()
     _min = 0
     _max = 0xffffffff
     _struct = 'I'
@@ -215,6 +242,7 @@ class UInt(Int):
 
 class Int64(Int):
     """Implementation of a 64-bit signed integer type."""
+    __slots__ = ()
     _min = -0x8000000000000000
     _max = 0x7fffffffffffffff
     _struct = 'q'
@@ -222,6 +250,7 @@ class Int64(Int):
 
 class UInt64(Int):
     """Implementation of a 64-bit unsigned integer type."""
+    __slots__ = ()
     _min = 0
     _max = 0xffffffffffffffff
     _struct = 'Q'
@@ -229,6 +258,7 @@ class UInt64(Int):
 
 class Byte(Int):
     """Implementation of a 8-bit signed integer type."""
+    __slots__ = ()
     _min = -0x80
     _max = 0x7f
     _struct = 'b'
@@ -236,6 +266,7 @@ class Byte(Int):
 
 class UByte(Int):
     """Implementation of a 8-bit unsigned integer type."""
+    __slots__ = ()
     _min = 0
     _max = 0xff
     _struct = 'B'
@@ -243,6 +274,7 @@ class UByte(Int):
 
 class Short(Int):
     """Implementation of a 16-bit signed integer type."""
+    __slots__ = ()
     _min = -0x8000
     _max = 0x7fff
     _struct = 'h'
@@ -250,6 +282,7 @@ class Short(Int):
 
 class UShort(UInt):
     """Implementation of a 16-bit unsigned integer type."""
+    __slots__ = ()
     _min = 0
     _max = 0xffff
     _struct = 'H'
@@ -259,14 +292,15 @@ class ULittle32(UInt):
     """Little endian 32 bit unsigned integer (ignores specified data
     byte order).
     """
+    __slots__ = ()
+
     def read(self, stream, data):
         """Read value from stream.
 
         :param stream: The stream to read from.
         :type stream: file
         """
-        self._value = struct.unpack('<' + self._struct,
-                                    stream.read(self._size))[0]
+        self._value, = self._structs['<'].unpack(stream.read(self._size))
 
     def write(self, stream, data):
         """Write value to stream.
@@ -274,10 +308,11 @@ class ULittle32(UInt):
         :param stream: The stream to write to.
         :type stream: file
         """
-        stream.write(struct.pack('<' + self._struct, self._value))
+        stream.write(self._structs['<'].pack(self._value))
 
 class Bool(UByte, EditableBoolComboBox):
     """Simple bool implementation."""
+    __slots__ = ()
 
     def get_value(self):
         """Return stored value.
@@ -296,6 +331,7 @@ class Bool(UByte, EditableBoolComboBox):
 
 class Char(BasicBase, EditableLineEdit):
     """Implementation of an (unencoded) 8-bit character."""
+    __slots__ = ()
 
     def __init__(self, **kwargs):
         """Initialize the character."""
@@ -345,6 +381,10 @@ class Char(BasicBase, EditableLineEdit):
         """
         return 1
 
+    @classmethod
+    def _get_static_size(cls, data=None):
+        return 1
+
     def get_hash(self, data=None):
         """Return a hash value for this value.
 
@@ -354,6 +394,9 @@ class Char(BasicBase, EditableLineEdit):
 
 class Float(BasicBase, EditableFloatSpinBox):
     """Implementation of a 32-bit float."""
+    __slots__ = ()
+
+    _structs = _get_structs('f') #: Compiled struct, by byte order.
 
     def __init__(self, **kwargs):
         """Initialize the float."""
@@ -381,8 +424,8 @@ class Float(BasicBase, EditableFloatSpinBox):
         :param stream: The stream to read from.
         :type stream: file
         """
-        self._value = struct.unpack(data._byte_order + 'f',
-                                    stream.read(4))[0]
+        self._value, = self._structs[data._byte_order].unpack(
+            stream.read(4))
 
     def write(self, stream, data):
         """Write value to stream.
@@ -391,8 +434,7 @@ class Float(BasicBase, EditableFloatSpinBox):
         :type stream: file
         """
         try:
-            stream.write(struct.pack(data._byte_order + 'f',
-                                     self._value))
+            stream.write(self._structs[data._byte_order].pack(self._value))
         except OverflowError:
             logger = logging.getLogger("pyffi.object_models")
             logger.warn("float value overflow, writing NaN")
@@ -406,6 +448,10 @@ class Float(BasicBase, EditableFloatSpinBox):
         """
         return 4
 
+    @classmethod
+    def _get_static_size(cls, data=None):
+        return 4
+
     def get_hash(self, data=None):
         """Return a hash value for this value. Currently implemented
         with precision 1/200.
@@ -434,6 +480,7 @@ class ZString(BasicBase, EditableLineEdit):
     >>> str(m)
     'Hi There!'
     """
+    __slots__ = ()
     _maxlen = 1000 #: The maximum length.
 
     def __init__(self, **kwargs):
@@ -529,6 +576,7 @@ class FixedString(BasicBase, EditableLineEdit):
     >>> str(m)
     'Hi There'
     """
+    __slots__ = ()
     _len = 0
 
     def __init__(self, **kwargs):
@@ -584,6 +632,10 @@ class FixedString(BasicBase, EditableLineEdit):
         """
         return self._len
 
+    @classmethod
+    def _get_static_size(cls, data=None):
+        return cls._len
+
     def get_hash(self, data=None):
         """Return a hash value for this string.
 
@@ -614,6 +666,7 @@ class SizedString(BasicBase, EditableLineEdit):
     >>> str(m)
     'Hi There'
     """
+    __slots__ = ()
 
     def __init__(self, **kwargs):
         """Initialize the string."""
@@ -661,8 +714,7 @@ class SizedString(BasicBase, EditableLineEdit):
         :param stream: The stream to read from.
         :type stream: file
         """
-        length, = struct.unpack(data._byte_order + 'I',
-                                stream.read(4))
+        length, = UInt._structs[data._byte_order].unpack(stream.read(4))
         if length > 10000:
             raise ValueError('string too long (0x%08X at 0x%08X)'
                              % (length, stream.tell()))
@@ -674,12 +726,13 @@ class SizedString(BasicBase, EditableLineEdit):
         :param stream: The stream to write to.
         :type stream: file
         """
-        stream.write(struct.pack(data._byte_order + 'I',
-                                 len(self._value)))
+        stream.write(UInt._structs[data._byte_order].pack(len(self._value)))
         stream.write(self._value)
 
 class UndecodedData(BasicBase):
     """Basic type for undecoded data trailing at the end of a file."""
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         BasicBase.__init__(self, **kwargs)
         self._value = b''
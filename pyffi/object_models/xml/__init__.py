@@ -39,6 +39,9 @@ file, and xml handler for converting the xml description into Python classes.
 #
 # ***** END LICENSE BLOCK *****
 
+import bisect
+import copy
+import io
 import logging
 import time # for timing stuff
 import types
@@ -47,6 +50,7 @@ import sys
 import xml.etree.ElementTree as ET
 
 import pyffi.object_models
+import pyffi.object_models.xml.cache
 from pyffi.object_models.xml.struct_    import StructBase
 from pyffi.object_models.xml.basic      import BasicBase
 from pyffi.object_models.xml.bit_struct import BitStructBase
@@ -94,19 +98,52 @@ class MetaFileFormat(pyffi.object_models.MetaFileFormat):
             # open XML file
             start = time.time()
             xml_file = cls.openfile(xml_file_name, cls.xml_file_path)
-            xmlp = XmlParser(cls)
             try:
-                xmlp.load_xml(xml_file)
+                xml_text = xml_file.read()
             finally:
                 xml_file.close()
+            xmlp = XmlParser(cls, lazy=cls.xml_lazy)
+            if cls.xml_lazy:
+                # keep the parser, to generate classes on first access
+                cls._xml_parser = xmlp
+            # use the records of the parsed XML file from the cache,
+            # if available
+            key = pyffi.object_models.xml.cache.get_key(name, xml_text)
+            records = pyffi.object_models.xml.cache.load(key)
+            if records is not None:
+                cls.logger.debug("Using cached %s." % xml_file_name)
+                xmlp.load_records(records)
+            else:
+                xmlp.load_root(ET.parse(io.StringIO(xml_text)).getroot())
+                pyffi.object_models.xml.cache.save(key, xmlp.records)
+            xmlp.final_cleanup()
 
             cls.logger.debug("Parsing finished in %.3f seconds." % (time.time() - start))
 
+    def __getattr__(cls, name):
+        """Generate the class *name* on first access, if the classes
+        of the format are generated lazily (see
+        :attr:`FileFormat.xml_lazy`)."""
+        for base in cls.__mro__:
+            xmlp = base.__dict__.get("_xml_parser")
+            if xmlp is not None:
+                return xmlp.generate_class(name)
+        raise AttributeError(
+            "type object '%s' has no attribute '%s'" % (cls.__name__, name))
+
 class FileFormat(pyffi.object_models.FileFormat, metaclass=MetaFileFormat):
     """This class can be used as a base class for file formats
     described by an xml file."""
     xml_file_name = None #: Override.
     xml_file_path = None #: Override.
+    xml_lazy = False
+    """Whether to generate the classes of the xml file on first
+    access, rather than all of them when the format class is created.
+    A class is generated along with the classes which it depends on.
+    This reduces start up time and memory for scripts which need only
+    a few of the classes. Note that the :attr:`xml_struct`, etc. lists
+    only contain the classes generated so far, until
+    :meth:`generate_classes` is called."""
     logger = logging.getLogger("pyffi.object_models.xml")
 
     # We also keep an ordered list of all classes that have been created.
@@ -123,6 +160,16 @@ class FileFormat(pyffi.object_models.FileFormat, metaclass=MetaFileFormat):
     xml_bit_struct = []
     xml_struct = []
 
+    # parser which generates the remaining classes, if xml_lazy is set
+    _xml_parser = None
+
+    @classmethod
+    def generate_classes(cls):
+        """Generate all classes which have not been generated yet
+        (see :attr:`xml_lazy`)."""
+        if cls._xml_parser is not None:
+            cls._xml_parser.generate_classes()
+
 class StructAttribute(object):
     """Helper class to collect attribute data of struct add tags."""
 
@@ -250,8 +297,13 @@ class XmlError(Exception):
 class XmlParser:
     struct_types = ("compound", "niobject", "struct")
     bitstruct_types = ("bitfield", "bitflags", "bitstruct")
-    def __init__(self, cls):
-        """Set up the xml parser."""
+    class_record_kinds = ("bitstruct", "struct", "enum", "alias")
+    def __init__(self, cls, lazy=False):
+        """Set up the xml parser.
+
+        :param cls: The format class, where all classes are generated.
+        :param lazy: Whether to generate classes on first access only.
+        """
 
         # initialize dictionaries
         # map each supported version string to a version number
@@ -275,12 +327,142 @@ class XmlParser:
         self.tokens = [ ]
         self.versions = [ ([], ("versions", "until", "since")), ]
 
+        # intermediate representation of the xml file: one record for
+        # every element which results in versions or classes, in order;
+        # a record is a tuple whose first item is the kind of record,
+        # and whose other items are the arguments of the corresponding
+        # apply_<kind> method; types of struct attributes are stored by
+        # name, so records can be pickled (see
+        # pyffi.object_models.xml.cache)
+        self.records = []
+        # index of the record which is being applied
+        self.index = -1
+        # indices of the records of the classes in the xml_struct,
+        # etc. lists, so classes can be listed in xml order
+        self.list_indices = {}
+        # map name_attribute of struct classes to their class name,
+        # to fix class names in conditions
+        self.struct_names = {}
+
+        # elements for generating classes on first access
+        self.lazy = lazy
+        # map name of each class to the index of its record
+        self.class_indices = {}
+        # map name of each class which is not yet generated to
+        # the index of its record, and its record
+        self.pending = {}
+        # customized classes from cls which are not yet generated
+        self.customized = {}
+        # generated classes which still need final cleanup
+        self.unfinished = []
+        # the recursion depth of generate_class
+        self.generating = 0
+        # whether generating classes on first access is suspended
+        self.suspended = False
+        # whether classes are being cleaned up
+        self.cleaning = False
+        # whether final_cleanup has been called
+        self.finalized = False
+
     def load_xml(self, file):
         """Loads an XML (can be filepath or open file) and does all parsing"""
         tree = ET.parse(file)
         root = tree.getroot()
         self.load_root(root)
         self.final_cleanup()
+
+    def load_records(self, records):
+        """Generate the classes from the records of a previously parsed
+        xml file (see :attr:`records`), without parsing the xml again.
+        Call :meth:`final_cleanup` afterwards."""
+        for record in records:
+            self.add_record(record)
+
+    def add_record(self, record):
+        """Add the record to :attr:`records`, and apply it (or, if
+        classes are generated lazily, postpone the application of
+        records that result in classes until their class is accessed).
+        """
+        self.records.append(record)
+        index = len(self.records) - 1
+        if record[0] not in self.class_record_kinds:
+            self.apply_record(index, record)
+            return
+        class_name = record[2]
+        self.class_indices[class_name] = index
+        if not self.lazy:
+            self.apply_record(index, record)
+            return
+        if record[0] == "struct":
+            for version_string in record[8]:
+                self.cls.versions[version_string] = (
+                    self.cls.version_number(version_string))
+        cls_klass = getattr(self.cls, class_name, None)
+        if cls_klass and issubclass(cls_klass, BasicBase):
+            # create_class would not do anything
+            return
+        if record[0] in self.struct_types:
+            self.struct_names[self.cls.name_attribute(class_name)] = (
+                class_name)
+        self.pending[class_name] = (index, record)
+        if cls_klass:
+            if (class_name not in self.cls.__dict__
+                or issubclass(cls_klass, pyffi.object_models.FileFormat.Data)):
+                # generate it right away, as first access would not
+                # get to generate_class
+                self.generate_class(class_name)
+            else:
+                # remove the customized class until it is generated
+                self.customized[class_name] = cls_klass
+                delattr(self.cls, class_name)
+
+    def apply_record(self, index, record):
+        """Apply the record with given index."""
+        old_index, old_suspended = self.index, self.suspended
+        self.index, self.suspended = index, True
+        try:
+            getattr(self, "apply_" + record[0])(*record[1:])
+        finally:
+            self.index, self.suspended = old_index, old_suspended
+
+    def get_dependencies(self, record):
+        """Names of the types which must be known before the class of
+        the record can be generated (forward declarations excluded)."""
+        if record[0] == "struct":
+            if record[4]:
+                yield record[4]
+            for struct_attr in record[6]:
+                if isinstance(struct_attr.type_, str):
+                    yield struct_attr.type_
+        elif record[0] == "alias":
+            yield record[4]
+
+    def generate_class(self, class_name):
+        """Generate the class of a postponed record, along with the
+        classes which it depends on, and return it."""
+        if self.suspended or class_name not in self.pending:
+            raise AttributeError(
+                "type object '%s' has no attribute '%s'"
+                % (self.cls.__name__, class_name))
+        index, record = self.pending.pop(class_name)
+        self.generating += 1
+        try:
+            # types declared later in the xml are resolved on cleanup,
+            # just like when all classes are generated at once
+            for name in self.get_dependencies(record):
+                if self.class_indices.get(name, -1) < index:
+                    getattr(self.cls, name, None)
+            self.apply_record(index, record)
+        finally:
+            self.generating -= 1
+        self.cleanup_classes()
+        return getattr(self.cls, class_name)
+
+    def generate_classes(self):
+        """Generate the classes of all postponed records."""
+        while self.pending:
+            self.generate_class(min(
+                self.pending, key=lambda name: self.pending[name][0]))
             
     def load_root(self, root):
         """Goes over all children of the root node and calls the appropriate function depending on type of the child"""
@@ -315,10 +497,13 @@ class XmlParser:
         # versions must be in reverse order so don't append but insert at beginning
         if "id" in version.attrib:
             self.versions[0][0].insert( 0, (version.attrib["id"], version.attrib["num"]) )
-        # add to supported versions
-        self.version_string = version.attrib["num"]
+        self.add_record(("version", version.attrib["num"], version.text))
+
+    def apply_version(self, version_string, games_text):
+        """Add version to supported versions, and to the games dictionary"""
+        self.version_string = version_string
         self.cls.versions[self.version_string] = self.cls.version_number(self.version_string)
-        self.update_gamesdict(self.cls.games, version.text)
+        self.update_gamesdict(self.cls.games, games_text)
         self.version_string = None
     
     def read_module(self, module):
@@ -328,12 +513,16 @@ class XmlParser:
 
     def read_basic(self, basic):
         """Maps to a type defined in self.cls"""
-        self.class_name = basic.attrib["name"]
+        self.add_record(
+            ("basic", basic.attrib["name"], self.is_generic(basic.attrib)))
+
+    def apply_basic(self, class_name, is_template):
+        """Maps to a type defined in self.cls"""
+        self.class_name = class_name
         # Each basic type corresponds to a type defined in C{self.cls}.
         # The link between basic types and C{self.cls} types is done via the name of the class.
         basic_class = getattr(self.cls, self.class_name)
         # check the class variables
-        is_template = self.is_generic(basic.attrib)
         if basic_class._is_template != is_template:
             raise XmlError( 'class %s should have _is_template = %s' % (self.class_name, is_template))
 
@@ -344,15 +533,13 @@ class XmlParser:
     def read_bitstruct(self, bitstruct):
         """Create a bitstruct class"""
         attrs = self.replace_tokens(bitstruct.attrib)
-        self.base_class = BitStructBase
-        self.update_class_dict(attrs, bitstruct.text)
+        class_name = attrs["name"]
         try:
             numbytes = int(attrs["numbytes"])
         except KeyError:
             # niftools style: storage attribute
             numbytes = getattr(self.cls, attrs["storage"]).get_size()
-        self.class_dict["_attrs"] = []
-        self.class_dict["_numbytes"] = numbytes
+        bit_attrs_list = []
         for member in bitstruct:
             attrs = self.replace_tokens(member.attrib)
             if member.tag == "bits":
@@ -363,7 +550,7 @@ class XmlParser:
                 # niftools compatibility, we have a bitflags field
                 # so convert value into numbits
                 # first, calculate current bit position
-                bitpos = sum(bitattr.numbits for bitattr in self.class_dict["_attrs"])
+                bitpos = sum(bitattr.numbits for bitattr in bit_attrs_list)
                 # avoid crash
                 if "value" in attrs:
                     # check if extra bits must be inserted
@@ -371,8 +558,8 @@ class XmlParser:
                     if numextrabits < 0:
                         raise XmlError("values of bitflags must be increasing")
                     if numextrabits > 0:
-                        reserved = dict(name="Reserved Bits %i"% len(self.class_dict["_attrs"]), numbits=numextrabits)
-                        self.class_dict["_attrs"].append( BitStructAttribute( self.cls, reserved))
+                        reserved = dict(name="Reserved Bits %i"% len(bit_attrs_list), numbits=numextrabits)
+                        bit_attrs_list.append( BitStructAttribute( self.cls, reserved))
                 # add the actual attribute
                 bit_attrs = dict(name=attrs["name"], numbits=1)
             # new nif xml    
@@ -381,57 +568,102 @@ class XmlParser:
             else:
                 raise XmlError("only bits tags allowed in struct type declaration")
             
-            self.class_dict["_attrs"].append( BitStructAttribute(self.cls, bit_attrs) )
-            self.update_doc(self.class_dict["_attrs"][-1].doc, member.text)
+            bit_attrs_list.append( BitStructAttribute(self.cls, bit_attrs) )
+            self.update_doc(bit_attrs_list[-1].doc, member.text)
 
-        self.create_class(bitstruct.tag)
+        self.add_record(
+            ("bitstruct", bitstruct.tag, class_name,
+             self.get_doc(bitstruct.text), numbytes, bit_attrs_list))
+
+    def apply_bitstruct(self, tag, class_name, doc, numbytes, bit_attrs_list):
+        """Create a bitstruct class"""
+        self.base_class = BitStructBase
+        self.update_class_dict({"name": class_name}, doc)
+        self.class_dict["_attrs"] = list(bit_attrs_list)
+        self.class_dict["_numbytes"] = numbytes
+        self.create_class(tag)
 
     def read_struct(self, struct):
         """Create a struct class"""
         attrs = self.replace_tokens(struct.attrib)
-        self.update_class_dict(attrs, struct.text)
+        class_name = attrs["name"]
+        doc = self.get_doc(struct.text)
         # struct types can be organized in a hierarchy
         # if inherit attribute is defined, look for corresponding base block
         class_basename = attrs.get("inherit")
-        if class_basename:
-            # class_basename must have been assigned to a class
-            try:
-                self.base_class = getattr(self.cls, class_basename)
-            except KeyError:
-                raise XmlError( "typo, or forward declaration of struct %s" % class_basename)
-        else:
-            self.base_class = StructBase
-        # set attributes (see class StructBase)
         # 'generic' attribute is optional- if not set, then the struct is not a template
-        self.class_dict["_is_template" ] = self.is_generic(attrs)
-        self.class_dict["_attrs" ] = []
-        self.class_dict["_games" ] = {}
+        is_template = self.is_generic(attrs)
+        struct_attrs = []
+        games = {}
+        version_strings = []
         for field in struct:
             attrs = self.replace_tokens(field.attrib)
             # the common case
             if field.tag in ("add", "field"):
                 # add attribute to class dictionary
-                self.class_dict["_attrs"].append( StructAttribute(self.cls, attrs) )
-                self.update_doc(self.class_dict["_attrs"][-1].doc, field.text)
+                # (its type is only needed to convert the default value,
+                # so do not generate it if classes are generated lazily)
+                suspended, self.suspended = (
+                    self.suspended, not attrs.get("default"))
+                try:
+                    struct_attr = StructAttribute(self.cls, attrs)
+                finally:
+                    self.suspended = suspended
+                # store type by name, resolved when the class is created
+                struct_attr.type_ = (
+                    attrs["type"] if attrs["type"] != "TEMPLATE"
+                    else type(None))
+                struct_attrs.append(struct_attr)
+                self.update_doc(struct_attrs[-1].doc, field.text)
             # not found in current nifxml
             elif field.tag == "version":
                 # set the version string
                 self.version_string = attrs["num"]
                 self.cls.versions[self.version_string] = self.cls.version_number(self.version_string)
-                self.update_gamesdict(self.class_dict["_games"], field.text)
+                version_strings.append(self.version_string)
+                self.update_gamesdict(games, field.text)
             else:
                 print("only add and version tags allowed in struct declaration")
             # load defaults for this <field>
             for default in field:
                 if default.tag != "default":
                     raise AttributeError("struct children's children must be 'default' tag")
-        self.create_class(struct.tag)
+        self.add_record(
+            ("struct", struct.tag, class_name, doc, class_basename,
+             is_template, struct_attrs, games, version_strings))
+
+    def apply_struct(self, tag, class_name, doc, class_basename, is_template,
+                     struct_attrs, games, version_strings):
+        """Create a struct class"""
+        self.update_class_dict({"name": class_name}, doc)
+        if class_basename:
+            # class_basename must have been assigned to a class
+            try:
+                self.base_class = getattr(self.cls, class_basename)
+            except KeyError:
+                raise XmlError( "typo, or forward declaration of struct %s" % class_basename)
+        else:
+            self.base_class = StructBase
+        # set attributes (see class StructBase)
+        self.class_dict["_is_template" ] = is_template
+        self.class_dict["_attrs" ] = []
+        self.class_dict["_games" ] = dict(
+            (game, versions[:]) for game, versions in games.items())
+        for version_string in version_strings:
+            self.cls.versions[version_string] = self.cls.version_number(version_string)
+        for struct_attr in struct_attrs:
+            struct_attr = copy.copy(struct_attr)
+            if isinstance(struct_attr.type_, str):
+                # forward declarations are resolved in final_cleanup()
+                struct_attr.type_ = getattr(
+                    self.cls, struct_attr.type_, struct_attr.type_)
+            self.class_dict["_attrs"].append(struct_attr)
+        self.create_class(tag)
 
     def read_enum(self, enum):
         """Create an enum class"""
         attrs = self.replace_tokens(enum.attrib)
-        self.base_class = EnumBase
-        self.update_class_dict(attrs, enum.text)
+        class_name = attrs["name"]
         try:
             numbytes = int(attrs["numbytes"])
         except KeyError:
@@ -443,10 +675,8 @@ class XmlParser:
             except AttributeError:
                 raise XmlError("typo, or forward declaration of type %s" % typename)
             numbytes = typ.get_size()
-        # add stuff to classdict
-        self.class_dict["_numbytes"] = numbytes
-        self.class_dict["_enumkeys"] = []
-        self.class_dict["_enumvalues"] = []
+        enumkeys = []
+        enumvalues = []
         for option in enum:
             attrs = self.replace_tokens(option.attrib)
             if option.tag not in ("option",):
@@ -458,19 +688,38 @@ class XmlParser:
                 value = int(value)
             except ValueError:
                 value = int(value, 16)
-            self.class_dict["_enumkeys"].append(attrs["name"])
-            self.class_dict["_enumvalues"].append(value)
-        self.create_class(enum.tag)
+            enumkeys.append(attrs["name"])
+            enumvalues.append(value)
+        self.add_record(
+            ("enum", enum.tag, class_name, self.get_doc(enum.text),
+             numbytes, enumkeys, enumvalues))
+
+    def apply_enum(self, tag, class_name, doc, numbytes, enumkeys, enumvalues):
+        """Create an enum class"""
+        self.base_class = EnumBase
+        self.update_class_dict({"name": class_name}, doc)
+        # add stuff to classdict
+        self.class_dict["_numbytes"] = numbytes
+        self.class_dict["_enumkeys"] = enumkeys[:]
+        self.class_dict["_enumvalues"] = enumvalues[:]
+        # enum values are basic values: keep them free of a dictionary
+        self.class_dict["__slots__"] = ()
+        self.create_class(tag)
 
     def read_alias(self, alias):
         """Create an alias class, ie. one that gives access to another class"""
-        self.update_class_dict(alias.attrib, alias.text)
-        typename = alias.attrib["type"]
+        self.add_record(
+            ("alias", alias.tag, alias.attrib["name"],
+             self.get_doc(alias.text), alias.attrib["type"]))
+
+    def apply_alias(self, tag, class_name, doc, typename):
+        """Create an alias class, ie. one that gives access to another class"""
+        self.update_class_dict({"name": class_name}, doc)
         try:
             self.base_class = getattr(self.cls, typename)
         except AttributeError:
             raise XmlError("typo, or forward declaration of type %s" % typename)
-        self.create_class(alias.tag)
+        self.create_class(tag)
 
 
     # the following are helper functions
@@ -486,12 +735,18 @@ class XmlParser:
                     gamesdict[gamestr].append(self.cls.versions[self.version_string])
                 else:
                     gamesdict[gamestr] = [self.cls.versions[self.version_string]]
+
+    def get_doc(self, doc_text):
+        """Return the doc text, stripped"""
+        return doc_text.strip() if doc_text else ""
         
     def update_class_dict(self, attrs, doc_text):
         """This initializes class_dict, sets the class name and doc text"""
         doc_text = doc_text.strip() if doc_text else ""
         self.class_name = attrs["name"]
-        self.class_dict = {"__doc__": doc_text, "__module__": self.cls.__module__}
+        self.class_dict = {"__doc__": doc_text, "__module__": self.cls.__module__,
+                           "__qualname__": "%s.%s" % (self.cls.__qualname__,
+                                                      self.class_name)}
 
     def update_doc(self, doc, doc_text):
         if doc_text:
@@ -502,7 +757,8 @@ class XmlParser:
         # assign it to cls.<class_name> if it has not been implemented internally
 
         # type(name, bases, dict) returns a new type object, essentially a dynamic form of the class statement
-        cls_klass = getattr(self.cls, self.class_name, None)
+        cls_klass = (self.customized.pop(self.class_name, None)
+                     or getattr(self.cls, self.class_name, None))
         # does the class exist?
         if cls_klass:
             # do nothing if this is a Basic type
@@ -510,11 +766,20 @@ class XmlParser:
                 return
             # it has been created in format's __init__.py
             # create and add to base class of customizer
+            self.class_dict["__qualname__"] = "%s._%s" % (
+                self.cls.__qualname__, self.class_name)
             gen_klass = type("_"+self.class_name, (self.base_class,), self.class_dict)
             setattr(self.cls, "_"+self.class_name, gen_klass)
+            self.unfinished.append(gen_klass)
             # recreate the class, to ensure that the metaclass is called!!
             # (otherwise, cls_klass does not have correct _attribute_list, etc.)
-            cls_klass = type(cls_klass.__name__, (gen_klass,) + cls_klass.__bases__, dict(cls_klass.__dict__))
+            cls_dict = dict(cls_klass.__dict__)
+            # the instance dictionary descriptors of the original class
+            # do not apply to instances of the recreated class
+            cls_dict.pop("__dict__", None)
+            cls_dict.pop("__weakref__", None)
+            cls_dict["__qualname__"] = cls_klass.__qualname__
+            cls_klass = type(cls_klass.__name__, (gen_klass,) + cls_klass.__bases__, cls_dict)
             setattr(self.cls, self.class_name, cls_klass)
             # if the class derives from Data, then make an alias
             if issubclass(cls_klass, pyffi.object_models.FileFormat.Data):
@@ -525,16 +790,27 @@ class XmlParser:
             # does not yet exist: create it and assign to class dict
             gen_klass = type(self.class_name, (self.base_class,), self.class_dict)
             setattr(self.cls, self.class_name, gen_klass)
-        # append class to the appropriate list
+        self.unfinished.append(gen_klass)
+        # add class to the appropriate list
         if tag in self.struct_types:
-            self.cls.xml_struct.append(gen_klass)
+            list_name = "xml_struct"
+            self.struct_names[self.cls.name_attribute(self.class_name)] = (
+                self.class_name)
         elif tag in self.bitstruct_types:
-            self.cls.xml_bit_struct.append(gen_klass)
+            list_name = "xml_bit_struct"
         elif tag == "enum":
-            self.cls.xml_enum.append(gen_klass)
+            list_name = "xml_enum"
         elif tag == "alias":
-            self.cls.xml_alias.append(gen_klass)
-            
+            list_name = "xml_alias"
+        else:
+            return
+        # keep xml order, also if classes are generated lazily
+        xml_list = getattr(self.cls, list_name)
+        indices = self.list_indices.setdefault(list_name, [])
+        pos = bisect.bisect(indices, self.index)
+        xml_list.insert(len(xml_list) - len(indices) + pos, gen_klass)
+        indices.insert(pos, self.index)
+
     def replace_tokens(self, attr_dict):
         """Update attr_dict with content of tokens+versions list."""
         # replace versions after tokens because tokens include versions
@@ -564,24 +840,50 @@ class XmlParser:
         Searches and adds class customized functions.
         Fixes forward declaration of templates.
         """
-        # get 'name_attribute' for all classes
-        # we need this to fix them in cond="..." later
-        klass_filter = {}
-        for klass in self.cls.xml_struct:
-            klass_filter[self.cls.name_attribute(klass.__name__)] = klass
+        self.finalized = True
+        if self.lazy:
+            # classes which are not yet generated are cleaned up
+            # when they are generated
+            self.cleanup_classes()
+            return
+        self.unfinished = []
         for obj in list(self.cls.__dict__.values()):
-            # skip objects that are not generated by the C{type} function
-            # or that do not derive from StructBase
-            if not (isinstance(obj, type) and issubclass(obj, StructBase)):
-                continue
-            # fix templates
-            for attr in obj._attrs:
-                templ = attr.template
-                if isinstance(templ, str):
-                    attr.template =  getattr(self.cls, templ) if templ != "TEMPLATE" else type(None)
-                attrtype = attr.type_
-                if isinstance(attrtype, str):
-                    attr.type_ = getattr(self.cls, attrtype)
-                # fix refs to types in conditions
-                if attr.cond:
-                    attr.cond.map_(lambda x: klass_filter[x] if x in klass_filter else x)
+            self.cleanup_class(obj)
+
+    def cleanup_classes(self):
+        """Clean up all generated classes which still need it,
+        if all classes currently being generated have been applied.
+        """
+        if self.generating or self.cleaning or not self.finalized:
+            return
+        self.cleaning = True
+        try:
+            while self.unfinished:
+                self.cleanup_class(self.unfinished.pop(0))
+        finally:
+            self.cleaning = False
+
+    def cleanup_class(self, obj):
+        """Fixes forward declarations of types and templates,
+        and class names in conditions, of a generated class."""
+        # skip objects that are not generated by the C{type} function
+        # or that do not derive from StructBase
+        if not (isinstance(obj, type) and issubclass(obj, StructBase)):
+            return
+        # fix templates
+        for attr in obj._attrs:
+            templ = attr.template
+            if isinstance(templ, str):
+                attr.template =  getattr(self.cls, templ) if templ != "TEMPLATE" else type(None)
+            attrtype = attr.type_
+            if isinstance(attrtype, str):
+                attr.type_ = getattr(self.cls, attrtype)
+            # fix refs to types in conditions
+            if attr.cond:
+                attr.cond.map_(self.map_class_name)
+
+    def map_class_name(self, name):
+        """Map the name_attribute of a struct class to the class."""
+        if name in self.struct_names:
+            return getattr(self.cls, self.struct_names[name])
+        return name
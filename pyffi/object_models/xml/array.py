@@ -40,15 +40,165 @@
 # --------------------------------------------------------------------------
 
 # note: some imports are defined at the end to avoid problems with circularity
+import array
+import copyreg
 import logging
+import struct
+import sys
 import weakref
 
 from pyffi.utils.graph import DetailNode, EdgeFilter
 
+# cache for _get_packed_format
+_packed_formats = {}
+
+# cache for _get_pod_struct
+_pod_structs = {}
+
+# cache for _get_static_size: whether the static size of a type is reliable
+_static_size_types = {}
+
+# methods which must not be overridden for a type to be stored packed
+_PACKED_METHODS = ('get_value', 'set_value', 'read', 'write',
+                   'get_size', 'get_hash', '__str__')
+
+_NATIVE_BYTE_ORDERS = ('=', '@', '<' if sys.byteorder == 'little' else '>')
+
+
+def _get_packed_format(element_type):
+    """Get the format for storing elements of type C{element_type} in
+    an ``array.array``, rather than as one instance per element. Only
+    plain integer and float types, as defined in
+    :mod:`pyffi.object_models.common`, can be stored packed: types
+    which override how their value is accessed, read, written, or
+    hashed, cannot.
+
+    :param element_type: The element type.
+    :type element_type: ``type``
+    :return: ``(struct character, array typecode, size)``, or ``None``
+        if elements cannot be stored packed.
+    :rtype: ``tuple``
+    """
+    try:
+        return _packed_formats[element_type]
+    except KeyError:
+        pass
+    packed_format = None
+    Int = pyffi.object_models.common.Int
+    Float = pyffi.object_models.common.Float
+    for base in (Int, Float):
+        if not issubclass(element_type, base):
+            continue
+        for name in _PACKED_METHODS:
+            # class which defines the method
+            owner = next(klass for klass in element_type.__mro__
+                         if name in klass.__dict__)
+            if owner not in base.__mro__:
+                break
+        else:
+            if base is Float:
+                # values which are not exact single precision floats
+                # are not stored packed, see _ListWrap.set_packed_item
+                packed_format = ('f', 'f', 4)
+            else:
+                char = element_type._struct
+                size = element_type._size
+                typecodes = 'bhilq' if char.islower() else 'BHILQ'
+                for typecode in typecodes:
+                    if (array.array(typecode).itemsize == size
+                        and struct.calcsize('<' + char) == size):
+                        packed_format = (char, typecode, size)
+                        break
+        break
+    _packed_formats[element_type] = packed_format
+    return packed_format
+
+
+def _get_static_size(element_type, data):
+    """Get the size in bytes of every instance of C{element_type}, for
+    the version of C{data}, if it does not depend on the value of the
+    instance. Types which customize get_size, without customizing
+    _get_static_size accordingly, have no static size.
+
+    :param element_type: The element type.
+    :type element_type: ``type``
+    :param data: The data, or ``None``.
+    :return: The size, or ``None`` if the size depends on the value.
+    :rtype: ``int``
+    """
+    try:
+        has_static_size = _static_size_types[element_type]
+    except KeyError:
+        if not hasattr(element_type, "_get_static_size"):
+            has_static_size = False
+        else:
+            # classes which define the methods
+            owners = [
+                next(klass for klass in element_type.__mro__
+                     if name in klass.__dict__)
+                for name in ("get_size", "_get_static_size")]
+            has_static_size = (owners[0] is owners[1])
+        _static_size_types[element_type] = has_static_size
+    if not has_static_size:
+        return None
+    return element_type._get_static_size(data)
+
+
+def _read_packed(stream, data, packed_format, count):
+    """Read C{count} values of the given packed format with a single
+    read from C{stream}, into an ``array.array``."""
+    char, typecode, size = packed_format
+    buf = stream.read(count * size)
+    if len(buf) != count * size:
+        raise struct.error(
+            "unpack requires a buffer of %i bytes" % (count * size))
+    values = array.array(typecode)
+    values.frombytes(buf)
+    if data._byte_order not in _NATIVE_BYTE_ORDERS:
+        values.byteswap()
+    return values
+
+
+def _write_packed(stream, data, elemlist):
+    """Write the packed values of C{elemlist} with a single write to
+    C{stream}."""
+    char, typecode, size = elemlist._packed_format
+    values = elemlist._values
+    if data._byte_order not in _NATIVE_BYTE_ORDERS:
+        values = array.array(typecode, values)
+        values.byteswap()
+    stream.write(values.tobytes())
+
+
+def _get_pod_struct(element_type, data):
+    """Get the ``struct.Struct`` for reading and writing plain-old-data
+    structures of type C{element_type} (see
+    :meth:`StructBase._get_pod_layout
+    <pyffi.object_models.xml.struct_.StructBase._get_pod_layout>`)."""
+    pod_format = data._byte_order + element_type._pod_format
+    try:
+        return _pod_structs[pod_format]
+    except KeyError:
+        pod_struct = _pod_structs[pod_format] = struct.Struct(pod_format)
+        return pod_struct
+
 
 class _ListWrap(list, DetailNode):
     """A wrapper for list, which uses get_value and set_value for
-    getting and setting items of the basic type."""
+    getting and setting items of the basic type.
+
+    Items of plain integer and float types can also be stored packed,
+    in an ``array.array`` of values rather than as element instances,
+    see :meth:`_set_storage`. Element instances are created again when
+    they are needed, for instance by :meth:`get_detail_child_nodes`.
+    """
+
+    # packed values, as array.array, or None if the list stores instances
+    _values = None
+    # format of packed values, see _get_packed_format
+    _packed_format = None
+    # observer of the links in the list, see set_link_observer
+    _link_observer = None
 
     def __init__(self, element_type, parent=None):
         self._parent = weakref.ref(parent) if parent else None
@@ -64,6 +214,26 @@ class _ListWrap(list, DetailNode):
             self._set_item_hook = self.__class__._not_implemented_hook
             self._iter_item_hook = self.__class__.iter_item
 
+    def __reduce_ex__(self, protocol):
+        """Pickle the items as stored, rather than as iterated over,
+        and the parent rather than the weak reference to it. The items
+        are part of the state, so they are restored without calling
+        any of the list methods. The link observer is not pickled: it
+        belongs to the tree which the list is in."""
+        state = self.__dict__.copy()
+        state.pop("_link_observer", None)
+        if self._parent is not None:
+            state["_parent"] = self._parent()
+        return (copyreg.__newobj__, (self.__class__,),
+                (state, list(list.__iter__(self))))
+
+    def __setstate__(self, state):
+        state, items = state
+        parent = state["_parent"]
+        self.__dict__.update(state)
+        self._parent = weakref.ref(parent) if parent is not None else None
+        list.extend(self, items)
+
     def __getitem__(self, index):
         return self._get_item_hook(self, index)
 
@@ -73,6 +243,84 @@ class _ListWrap(list, DetailNode):
     def __iter__(self):
         return self._iter_item_hook(self)
 
+    def __len__(self):
+        if self._values is not None:
+            return len(self._values)
+        return list.__len__(self)
+
+    def __delitem__(self, index):
+        if self._values is not None:
+            del self._values[index]
+        else:
+            list.__delitem__(self, index)
+            self._resized()
+
+    # list methods which act on the element instances: if items are
+    # stored packed, then these first unpack them
+
+    def append(self, elem):
+        self._unpack()
+        list.append(self, elem)
+        self._resized()
+
+    def extend(self, elems):
+        self._unpack()
+        list.extend(self, elems)
+        self._resized()
+
+    def insert(self, index, elem):
+        self._unpack()
+        list.insert(self, index, elem)
+        self._resized()
+
+    def pop(self, *args):
+        self._unpack()
+        elem = list.pop(self, *args)
+        self._resized()
+        return elem
+
+    def remove(self, elem):
+        self._unpack()
+        list.remove(self, elem)
+        self._resized()
+
+    def clear(self):
+        self._unpack()
+        list.clear(self)
+        self._resized()
+
+    def index(self, *args):
+        self._unpack()
+        return list.index(self, *args)
+
+    def count(self, elem):
+        self._unpack()
+        return list.count(self, elem)
+
+    def sort(self, *args, **kwargs):
+        self._unpack()
+        list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._unpack()
+        list.reverse(self)
+
+    def __iadd__(self, elems):
+        self._unpack()
+        result = list.__iadd__(self, elems)
+        self._resized()
+        return result
+
+    def __imul__(self, num):
+        self._unpack()
+        result = list.__imul__(self, num)
+        self._resized()
+        return result
+
+    def __reversed__(self):
+        self._unpack()
+        return list.__reversed__(self)
+
     def __contains__(self, value):
         # ensure that the "in" operator uses self.__iter__() rather than
         # list.__iter__()
@@ -85,6 +333,12 @@ class _ListWrap(list, DetailNode):
         """A hook for members that are not implemented."""
         raise NotImplementedError
 
+    def _resized(self):
+        """Notify the link observer, if any, after the length of the
+        list has changed."""
+        if self._link_observer is not None:
+            self._link_observer.resized(self)
+
     def iter_basic_item(self):
         """Iterator which calls C{get_value()} on all items. Applies when
         the list has BasicBase elements."""
@@ -110,15 +364,87 @@ class _ListWrap(list, DetailNode):
         elements."""
         return list.__getitem__(self, index)
 
+    def iter_packed_item(self):
+        """Iterator over all packed values."""
+        return iter(self._values)
+
+    def get_packed_item(self, index):
+        """Item getter for packed values."""
+        return self._values[index]
+
+    def set_packed_item(self, index, value):
+        """Item setter for packed values. Converts and checks C{value}
+        through C{set_value()} of the element type. Floats which are
+        not exactly single precision (such as 0.1, or values out of
+        range) are kept exactly, as element instances, by unpacking
+        the list first."""
+        elem = self._elementType()
+        elem.set_value(value)
+        value = elem.get_value()
+        if self._packed_format[1] == 'f':
+            if array.array('f', (value,))[0] != value:
+                self._unpack()
+                list.__getitem__(self, index).set_value(value)
+                return
+        self._values[index] = value
+
+    def _set_storage(self, values=None, packed_format=None):
+        """Remove all items, and switch storage: if C{values} is an
+        ``array.array``, then items are stored packed in it, otherwise
+        items are stored as element instances in the list itself.
+
+        :param values: The packed values, or ``None``.
+        :type values: ``array.array``
+        :param packed_format: The format of the packed values, see
+            :func:`_get_packed_format`.
+        :type packed_format: ``tuple``
+        """
+        list.__delitem__(self, slice(None))
+        if values is not None:
+            self._get_item_hook = self.__class__.get_packed_item
+            self._set_item_hook = self.__class__.set_packed_item
+            self._iter_item_hook = self.__class__.iter_packed_item
+        elif self._values is not None:
+            # only basic elements can be packed
+            self._get_item_hook = self.__class__.get_basic_item
+            self._set_item_hook = self.__class__.set_basic_item
+            self._iter_item_hook = self.__class__.iter_basic_item
+        self._values = values
+        self._packed_format = packed_format
+
+    def _unpack(self):
+        """If items are stored packed, then convert them back into
+        element instances."""
+        if self._values is None:
+            return
+        values = self._values
+        self._set_storage()
+        for value in values:
+            elem = self._new_element()
+            elem.set_value(value)
+            list.append(self, elem)
+
+    def _new_element(self):
+        """Create a new element instance."""
+        return self._elementType(parent=self)
+
+    def _iter_elements_or_values(self):
+        """Iterator over the element instances, or over the values if
+        items are stored packed."""
+        if self._values is not None:
+            return iter(self._values)
+        return list.__iter__(self)
+
     # DetailNode
 
     def get_detail_child_nodes(self, edge_filter=EdgeFilter()):
         """Yield children."""
+        self._unpack()
         return (item for item in list.__iter__(self))
 
     def get_detail_child_names(self, edge_filter=EdgeFilter()):
         """Yield child names."""
-        return ("[%i]" % row for row in range(list.__len__(self)))
+        return ("[%i]" % row for row in range(self.__len__()))
 
 
 class Array(_ListWrap):
@@ -134,7 +460,7 @@ class Array(_ListWrap):
             element_type_template=None,
             element_type_argument=None,
             count1=None, count2=None,
-            parent=None):
+            parent=None, populate=True):
         """Initialize the array type.
 
         :param element_type: The class describing the type of each element.
@@ -146,7 +472,10 @@ class Array(_ListWrap):
         :param count2: Either ``None``, or an C{Expression} describing the
             second dimension count.
         :param parent: The parent of this instance, that is, the instance this
-            array is an attribute of."""
+            array is an attribute of.
+        :param populate: Whether to create the elements, according to
+            the counts. Set to ``False`` for arrays which are about to
+            be read."""
         if count2 is None:
             _ListWrap.__init__(self,
                                element_type=element_type, parent=parent)
@@ -160,13 +489,15 @@ class Array(_ListWrap):
         self._count1 = count1
         self._count2 = count2
 
-        if self._count2 is None:
+        if not populate:
+            pass
+        elif self._count2 is None:
             for i in range(self._len1()):
                 elem_instance = self._elementType(
                     template=self._elementTypeTemplate,
                     argument=self._elementTypeArgument,
                     parent=self)
-                self.append(elem_instance)
+                list.append(self, elem_instance)
         else:
             for i in range(self._len1()):
                 elem = _ListWrap(element_type=element_type, parent=self)
@@ -175,8 +506,15 @@ class Array(_ListWrap):
                         template=self._elementTypeTemplate,
                         argument=self._elementTypeArgument,
                         parent=elem)
-                    elem.append(elem_instance)
-                self.append(elem)
+                    list.append(elem, elem_instance)
+                list.append(self, elem)
+
+    def _new_element(self):
+        """Create a new element instance."""
+        return self._elementType(
+            template=self._elementTypeTemplate,
+            argument=self._elementTypeArgument,
+            parent=self)
 
     def _len1(self):
         """The length the array should have, obtained by evaluating the count1 expression."""
@@ -226,7 +564,7 @@ class Array(_ListWrap):
     def __str__(self):
         text = '%s instance at 0x%08X\n' % (self.__class__, id(self))
         if self._count2 is None:
-            for i, element in enumerate(list.__iter__(self)):
+            for i, element in enumerate(self._iter_elements_or_values()):
                 if i > 16:
                     text += "etc...\n"
                     break
@@ -236,7 +574,8 @@ class Array(_ListWrap):
         else:
             k = 0
             for i, elemlist in enumerate(list.__iter__(self)):
-                for j, elem in enumerate(list.__iter__(elemlist)):
+                for j, elem in enumerate(
+                        elemlist._iter_elements_or_values()):
                     if k > 16:
                         text += "etc...\n"
                         break
@@ -257,29 +596,36 @@ class Array(_ListWrap):
         if self._count2 is None:
             if new_size < old_size:
                 del self[new_size:old_size]
-            else:
+            elif self._values is not None:
+                self._values.extend([0] * (new_size - old_size))
+            elif new_size > old_size:
                 for i in range(new_size - old_size):
                     elem = self._elementType(
                         template=self._elementTypeTemplate,
                         argument=self._elementTypeArgument)
-                    self.append(elem)
+                    list.append(self, elem)
+                self._resized()
         else:
             if new_size < old_size:
                 del self[new_size:old_size]
-            else:
+            elif new_size > old_size:
                 for i in range(new_size - old_size):
-                    self.append(_ListWrap(self._elementType))
+                    list.append(self, _ListWrap(self._elementType))
+                self._resized()
             for i, elemlist in enumerate(list.__iter__(self)):
                 old_size_i = len(elemlist)
                 new_size_i = self._len2(i)
                 if new_size_i < old_size_i:
                     del elemlist[new_size_i:old_size_i]
-                else:
+                elif elemlist._values is not None:
+                    elemlist._values.extend([0] * (new_size_i - old_size_i))
+                elif new_size_i > old_size_i:
                     for j in range(new_size_i - old_size_i):
                         elem = self._elementType(
                             template=self._elementTypeTemplate,
                             argument=self._elementTypeArgument)
-                        elemlist.append(elem)
+                        list.append(elemlist, elem)
+                    elemlist._resized()
 
     def read(self, stream, data):
         """Read array from stream."""
@@ -291,31 +637,51 @@ class Array(_ListWrap):
         self.logger.debug("Reading array of size " + str(len1))
         if len1 > 0x10000000:
             raise ValueError('array too long (%i)' % len1)
-        del self[0:self.__len__()]
+        self._set_storage()
+        packed_format = (_get_packed_format(self._elementType)
+                         if data.use_packed_arrays else None)
+
+        is_pod = getattr(self._elementType, "_pod_format", None) is not None
 
         # read array
-        if self._count2 is None:
+        if self._count2 is None and packed_format is not None:
+            self._set_storage(
+                _read_packed(stream, data, packed_format, len1),
+                packed_format)
+        elif self._count2 is None and is_pod:
+            self._read_pod(stream, data, self, len1)
+        elif self._count2 is None:
             for i in range(len1):
                 elem = self._elementType(
                     template=self._elementTypeTemplate,
                     argument=self._elementTypeArgument,
                     parent=self)
                 elem.read(stream, data)
-                self.append(elem)
+                list.append(self, elem)
         else:
             for i in range(len1):
                 len2i = self._len2(i)
                 if len2i > 0x10000000:
                     raise ValueError('array too long (%i)' % len2i)
                 elemlist = _ListWrap(self._elementType, parent=self)
+                if packed_format is not None:
+                    elemlist._set_storage(
+                        _read_packed(stream, data, packed_format, len2i),
+                        packed_format)
+                    list.append(self, elemlist)
+                    continue
+                if is_pod:
+                    self._read_pod(stream, data, elemlist, len2i)
+                    list.append(self, elemlist)
+                    continue
                 for j in range(len2i):
                     elem = self._elementType(
                         template=self._elementTypeTemplate,
                         argument=self._elementTypeArgument,
                         parent=elemlist)
                     elem.read(stream, data)
-                    elemlist.append(elem)
-                self.append(elemlist)
+                    list.append(elemlist, elem)
+                list.append(self, elemlist)
 
     def write(self, stream, data):
         """Write array to stream."""
@@ -326,7 +692,12 @@ class Array(_ListWrap):
                              (self.__len__(), len1))
         if len1 > 0x10000000:
             raise ValueError('array too long (%i)' % len1)
-        if self._count2 is None:
+        is_pod = getattr(self._elementType, "_pod_format", None) is not None
+        if self._count2 is None and self._values is not None:
+            _write_packed(stream, data, self)
+        elif self._count2 is None and is_pod:
+            self._write_pod(stream, data, self)
+        elif self._count2 is None:
             for elem in list.__iter__(self):
                 elem.write(stream, data)
         else:
@@ -337,9 +708,57 @@ class Array(_ListWrap):
                                      (elemlist.__len__(), len2i))
                 if len2i > 0x10000000:
                     raise ValueError('array too long (%i)' % len2i)
+                if elemlist._values is not None:
+                    _write_packed(stream, data, elemlist)
+                    continue
+                if is_pod:
+                    self._write_pod(stream, data, elemlist)
+                    continue
                 for elem in list.__iter__(elemlist):
                     elem.write(stream, data)
 
+    def _read_pod(self, stream, data, elemlist, count):
+        """Read C{count} plain-old-data structures with a single read
+        from C{stream}, and append them to C{elemlist}."""
+        element_type = self._elementType
+        pod_struct = _get_pod_struct(element_type, data)
+        size = count * pod_struct.size
+        buf = stream.read(size)
+        if len(buf) != size:
+            raise struct.error("unpack requires a buffer of %i bytes" % size)
+        names = element_type._pod_names
+        for values in pod_struct.iter_unpack(buf):
+            elem = element_type(
+                template=self._elementTypeTemplate,
+                argument=self._elementTypeArgument,
+                parent=elemlist)
+            instance_dict = elem.__dict__
+            for name, value in zip(names, values):
+                attr_value = instance_dict.get(name)
+                if attr_value is None:
+                    attr_value = elem._create_read_attribute(name)
+                attr_value._value = value
+            list.append(elemlist, elem)
+
+    def _write_pod(self, stream, data, elemlist):
+        """Write the plain-old-data structures of C{elemlist} with a
+        single write to C{stream}."""
+        pod_struct = _get_pod_struct(self._elementType, data)
+        names = self._elementType._pod_names
+        size = pod_struct.size
+        buf = bytearray(size * list.__len__(elemlist))
+        try:
+            for i, elem in enumerate(list.__iter__(elemlist)):
+                pod_struct.pack_into(
+                    buf, i * size,
+                    *[getattr(elem, name)._value for name in names])
+        except OverflowError:
+            # let the elements deal with it
+            for elem in list.__iter__(elemlist):
+                elem.write(stream, data)
+            return
+        stream.write(buf)
+
     def fix_links(self, data):
         """Fix the links in the array by calling C{fix_links} on all elements
         of the array."""
@@ -358,6 +777,30 @@ class Array(_ListWrap):
             links.extend(elem.get_links(data))
         return links
 
+    def get_link_slots(self, data=None):
+        """Return all link instances in the array, by calling
+        C{get_link_slots} on all elements of the array."""
+        slots = []
+        if not self._elementType._has_links:
+            return slots
+        for elem in self._elementList():
+            slots.extend(elem.get_link_slots(data))
+        return slots
+
+    def set_link_observer(self, observer, data=None):
+        """Set the observer which is notified of changes of the links
+        in the array, or ``None``. It is set on all elements, and on
+        the array (and its rows) itself, so it is also notified when
+        the length of the array changes (see :meth:`_ListWrap._resized`)."""
+        if not self._elementType._has_links:
+            return
+        for elemlist in self._lists():
+            elemlist._link_observer = observer
+        if self._count2 is not None:
+            self._link_observer = observer
+        for elem in self._elementList():
+            elem.set_link_observer(observer, data)
+
     def get_strings(self, data):
         """Return all strings in the array by calling C{get_strings} on all
         elements of the array."""
@@ -380,14 +823,31 @@ class Array(_ListWrap):
 
     def get_size(self, data=None):
         """Calculate the sum of the size of all elements in the array."""
-        return sum(
-            (elem.get_size(data) for elem in self._elementList()), 0)
+        size = 0
+        static_size = _get_static_size(self._elementType, data)
+        for elemlist in self._lists():
+            if static_size is not None:
+                size += elemlist.__len__() * static_size
+            elif elemlist._values is not None:
+                size += len(elemlist._values) * elemlist._packed_format[2]
+            else:
+                size += sum(
+                    (elem.get_size(data)
+                     for elem in list.__iter__(elemlist)), 0)
+        return size
 
     def get_hash(self, data=None):
         """Calculate a hash value for the array, as a tuple."""
         hsh = []
-        for elem in self._elementList():
-            hsh.append(elem.get_hash(data))
+        for elemlist in self._lists():
+            if elemlist._values is None:
+                for elem in list.__iter__(elemlist):
+                    hsh.append(elem.get_hash(data))
+            elif elemlist._packed_format[1] == 'f':
+                # as Float.get_hash
+                hsh.extend(int(value * 200) for value in elemlist._values)
+            else:
+                hsh.extend(elemlist._values)
         return tuple(hsh)
 
     def replace_global_node(self, oldbranch, newbranch, **kwargs):
@@ -397,14 +857,20 @@ class Array(_ListWrap):
 
     def _elementList(self, **kwargs):
         """Generator for listing all elements."""
-        if self._count2 is None:
-            for elem in list.__iter__(self):
+        for elemlist in self._lists():
+            elemlist._unpack()
+            for elem in list.__iter__(elemlist):
                 yield elem
+
+    def _lists(self):
+        """The lists which contain the elements: the array itself, or
+        its rows if the array is two dimensional."""
+        if self._count2 is None:
+            return (self,)
         else:
-            for elemlist in list.__iter__(self):
-                for elem in list.__iter__(elemlist):
-                    yield elem
+            return list.__iter__(self)
 
 
+import pyffi.object_models.common
 from pyffi.object_models.xml.basic import BasicBase
 from pyffi.object_models.xml.struct_ import StructBase
@@ -80,7 +80,11 @@ class BasicBase(DetailNode):
     _has_links = False # does the type contain a Ref or a Ptr?
     _has_refs = False # does the type contain a Ref?
     _has_strings = False # does the type contain a string?
-    arg = None # default argument
+
+    # basic values are by far the most numerous objects in a file, so
+    # store their attributes in slots rather than in a dictionary;
+    # subclasses which declare no __slots__ of their own still get one
+    __slots__ = ('arg', '_value')
 
     def __init__(self, template = None, argument = None, parent = None):
         """Initializes the instance.
@@ -92,7 +96,7 @@ class BasicBase(DetailNode):
             instance is an attribute of."""
         # parent disabled for performance
         #self._parent = weakref.ref(parent) if parent else None
-        pass
+        self.arg = None # default argument
 
     # string representation
     def __str__(self):
@@ -125,6 +129,17 @@ class BasicBase(DetailNode):
         object."""
         return []
 
+    def get_link_slots(self, data=None):
+        """Return all link instances (rather than the objects they link
+        to) in this object."""
+        return []
+
+    def set_link_observer(self, observer, data=None):
+        """Set the observer which is notified of changes of the links
+        in this object (see :meth:`get_link_slots`), or ``None``.
+        Types which contain links override this."""
+        pass
+
     def get_value(self):
         """Return object value."""
         raise NotImplementedError
@@ -137,6 +152,13 @@ class BasicBase(DetailNode):
         """Returns size of the object in bytes."""
         raise NotImplementedError
 
+    @classmethod
+    def _get_static_size(cls, data=None):
+        """Returns size of every instance in bytes, if it does not
+        depend on the value of the instance, or ``None`` otherwise.
+        Override together with get_size."""
+        return None
+
     def get_hash(self, data=None):
         """Returns a hash value (an immutable object) that can be used to
         identify the object uniquely."""
@@ -72,6 +72,10 @@ class _MetaBitStructBase(type):
             cls._struct = 'Q'
         else:
             raise RuntimeError("unsupported bitstruct numbytes")
+        # compiled struct, by byte order
+        cls._structs = dict(
+            (byte_order, struct.Struct(byte_order + cls._struct))
+            for byte_order in "<>")
 
         # template type?
         cls._is_template = False
@@ -99,6 +103,8 @@ class _MetaBitStructBase(type):
 
 class Bits(DetailNode, EditableSpinBox):
     """Basic implementation of a n-bit unsigned integer type (without read and write)."""
+    __slots__ = ('_value', '_numbits')
+
     def __init__(self, numbits=1, default=0, parent = None):
         # parent disabled for performance
         #self._parent = weakref.ref(parent) if parent else None
@@ -289,7 +295,8 @@ class BitStructBase(DetailNode, metaclass=_MetaBitStructBase):
     def read(self, stream, data):
         """Read structure from stream."""
         # read all attributes
-        value = struct.unpack(data._byte_order + self._struct, stream.read(self._numbytes))[0]
+        value, = self._structs[data._byte_order].unpack(
+            stream.read(self._numbytes))
 
         # set the structure variables
         self.populate_attribute_values(value, data)
@@ -317,7 +324,8 @@ class BitStructBase(DetailNode, metaclass=_MetaBitStructBase):
 
     def write(self, stream, data):
         """Write structure to stream."""
-        stream.write(struct.pack(data._byte_order + self._struct, self.get_attributes_values(data)))
+        stream.write(self._structs[data._byte_order].pack(
+            self.get_attributes_values(data)))
 
     def fix_links(self, data):
         """Fix links in the structure."""
@@ -342,6 +350,10 @@ class BitStructBase(DetailNode, metaclass=_MetaBitStructBase):
         """Calculate the structure size in bytes."""
         return self._numbytes
 
+    @classmethod
+    def _get_static_size(cls, data=None):
+        return cls._numbytes
+
     def get_hash(self, data=None):
         """Calculate a hash for the structure, as a tuple."""
         # calculate hash
@@ -0,0 +1,209 @@
+"""Persistent cache of parsed xml file format descriptions.
+
+Parsing the xml description of a file format, when its
+:class:`~pyffi.object_models.xml.FileFormat` class is created, results
+in a list of records (see
+:attr:`XmlParser.records <pyffi.object_models.xml.XmlParser.records>`),
+from which the classes of the format are generated. This module stores
+these records in a user cache directory, keyed on the contents of the
+xml file and on the source of the parser and of the classes of the
+records, so later imports can generate the classes without parsing
+the xml again.
+
+The cache directory is taken from the ``PYFFI_CACHE_DIR`` environment
+variable. If this variable is not set, then the platform's user cache
+directory is used. Set it to an empty string to disable the cache.
+
+>>> import tempfile, shutil
+>>> cache_dir = tempfile.mkdtemp()
+>>> key = get_key("Format", "<format/>")
+>>> print(load(key, cache_dir))
+None
+>>> save(key, [("version", "1.0", None)], cache_dir)
+>>> load(key, cache_dir)
+[('version', '1.0', None)]
+>>> load(get_key("Format", "<format></format>"), cache_dir) is None
+True
+>>> shutil.rmtree(cache_dir)
+"""
+
+# --------------------------------------------------------------------------
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+# --------------------------------------------------------------------------
+
+import hashlib
+import importlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+
+import pyffi
+
+#: Modules which define :class:`~pyffi.object_models.xml.XmlParser` and
+#: the classes of the objects in its records. The cache key includes a
+#: hash of their source files, so records are only loaded by the code
+#: which generated them.
+RECORD_MODULES = (
+    "pyffi.object_models.xml",
+    "pyffi.object_models.xml.expression",
+    )
+
+_source_digest = None
+
+
+def get_source_digest():
+    """Return the hash of the source files of :data:`RECORD_MODULES`,
+    or ``None`` if they cannot be read, in which case caching is
+    disabled.
+
+    :return: The hash, as hexadecimal digits.
+    :rtype: ``str``
+    """
+    global _source_digest
+    if _source_digest is None:
+        digest = hashlib.sha1()
+        try:
+            for module_name in RECORD_MODULES:
+                module = importlib.import_module(module_name)
+                with open(module.__file__, "rb") as stream:
+                    digest.update(stream.read())
+        except (AttributeError, TypeError, OSError):
+            return None
+        _source_digest = digest.hexdigest()
+    return _source_digest
+
+
+def get_cache_dir():
+    """Return the directory where parsed xml files are cached, or
+    ``None`` if caching is disabled.
+
+    :return: The cache directory.
+    :rtype: ``str``
+    """
+    cache_dir = os.environ.get("PYFFI_CACHE_DIR")
+    if cache_dir is not None:
+        return cache_dir or None
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser(os.path.join("~", "Library", "Caches"))
+    else:
+        base = (os.environ.get("XDG_CACHE_HOME")
+                or os.path.expanduser(os.path.join("~", ".cache")))
+    return os.path.join(base, "pyffi")
+
+
+def get_key(name, xml_text):
+    """Return the cache key of the xml file C{xml_text} of the format
+    C{name}. The key changes whenever the xml file, the pyffi version,
+    or the source of the parser or of the classes of the records
+    changes (see :func:`get_source_digest`).
+
+    :param name: The name of the format class, for example
+        ``'NifFormat'``.
+    :type name: ``str``
+    :param xml_text: The contents of the xml file.
+    :type xml_text: ``str``
+    :return: The key, usable as file name, or ``None`` if caching is
+        disabled because the source cannot be read.
+    :rtype: ``str``
+    """
+    source_digest = get_source_digest()
+    if source_digest is None:
+        return None
+    digest = hashlib.sha1(xml_text.encode("utf-8"))
+    digest.update(source_digest.encode("ascii"))
+    return "%s-%s-%s" % (name, pyffi.__version__, digest.hexdigest())
+
+
+def load(key, cache_dir=None):
+    """Load the records stored under C{key}.
+
+    :param key: The cache key, see :func:`get_key`.
+    :type key: ``str``
+    :param cache_dir: The cache directory (defaults to
+        :func:`get_cache_dir`).
+    :type cache_dir: ``str``
+    :return: The records, or ``None`` if they are not in the cache.
+    """
+    cache_dir = cache_dir or get_cache_dir()
+    if not cache_dir or key is None:
+        return None
+    try:
+        with open(os.path.join(cache_dir, key + ".pickle"), "rb") as stream:
+            return pickle.load(stream)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # corrupt or incompatible cache file: parse the xml instead
+        logging.getLogger("pyffi.object_models.xml").warning(
+            "ignoring unreadable cache file for %s" % key)
+        return None
+
+
+def save(key, records, cache_dir=None):
+    """Store C{records} under C{key}. Failures are logged and
+    otherwise ignored, as the cache is only an optimization.
+
+    :param key: The cache key, see :func:`get_key`.
+    :type key: ``str``
+    :param records: The records.
+    :param cache_dir: The cache directory (defaults to
+        :func:`get_cache_dir`).
+    :type cache_dir: ``str``
+    """
+    cache_dir = cache_dir or get_cache_dir()
+    if not cache_dir or key is None:
+        return
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first, so concurrent imports never
+        # see a partially written file
+        fd, temp_name = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as stream:
+                pickle.dump(records, stream, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_name, os.path.join(cache_dir, key + ".pickle"))
+        except:
+            os.remove(temp_name)
+            raise
+    except Exception:
+        logging.getLogger("pyffi.object_models.xml").debug(
+            "could not write cache file for %s" % key, exc_info=True)
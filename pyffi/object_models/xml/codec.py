@@ -0,0 +1,235 @@
+"""Compiles specialized read and write functions for struct types.
+
+:meth:`StructBase.read <pyffi.object_models.xml.struct_.StructBase.read>`
+and :meth:`StructBase.write <pyffi.object_models.xml.struct_.StructBase.write>`
+interpret the attribute list of the struct on every call: for each
+attribute, the version interval, the user version, and the version
+condition are checked again, even though these only depend on the
+version of the data. This module resolves these checks once, for every
+struct class and for every (version, user version, user version 2)
+combination, and generates plain Python functions which read and
+write the active attributes in order. Only attribute conditions, which
+depend on the values of the struct itself, are still evaluated at
+runtime.
+
+Compiled codecs are opt-in, through the
+:attr:`~pyffi.object_models.FileFormat.Data.use_codecs` attribute of
+the data, and produce exactly the same results as the interpreted
+methods.
+
+>>> from pyffi.object_models.xml.basic import BasicBase
+>>> from pyffi.object_models.xml.struct_ import StructBase
+>>> from pyffi.object_models.xml import StructAttribute as Attr
+>>> class SimpleFormat(object):
+...     class UInt(BasicBase):
+...         _is_template = False
+...     @staticmethod
+...     def name_attribute(name):
+...         return name
+...     @staticmethod
+...     def version_number(version_str):
+...         return int(version_str)
+>>> class X(StructBase):
+...     _is_template = False
+...     _attrs = [
+...         Attr(SimpleFormat, dict(name='a', type='UInt')),
+...         Attr(SimpleFormat, dict(name='b', type='UInt', ver1='2')),
+...         Attr(SimpleFormat, dict(name='c', type='UInt', cond='a == 3'))]
+>>> class Data(object):
+...     version = 1
+...     user_version = 0
+>>> print(Codec(X, get_version_key(Data())).read_source)
+def read(self, stream, data):
+    instance_dict = self.__dict__
+    value = instance_dict.get('_a_value_')
+    if value is None:
+        value = self._create_read_attribute('_a_value_')
+    value.arg = None
+    value.read(stream, data)
+    if cond_1(self):
+        value = instance_dict.get('_c_value_')
+        if value is None:
+            value = self._create_read_attribute('_c_value_')
+        value.arg = None
+        value.read(stream, data)
+"""
+
+# --------------------------------------------------------------------------
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+# --------------------------------------------------------------------------
+
+import keyword
+
+
+def get_version_key(data):
+    """Return the version key of C{data}: all attributes of the data
+    which determine whether a struct attribute is active, apart from
+    the attribute conditions themselves.
+
+    :param data: The data, or ``None``.
+    :return: A hashable tuple, or ``None`` if C{data} is ``None``.
+    """
+    if data is None:
+        return None
+    return (data.version, data.user_version,
+            getattr(data, "user_version_2", None))
+
+
+def get_codec(cls, data):
+    """Return the codec of the struct class C{cls} for C{data},
+    compiling it on first use.
+
+    :param cls: The struct class.
+    :type cls: ``type``
+    :param data: The data which is read or written.
+    :return: The codec.
+    :rtype: :class:`Codec`
+    """
+    key = get_version_key(data)
+    try:
+        return cls._codecs[key]
+    except KeyError:
+        codec = cls._codecs[key] = Codec(cls, key, data)
+        return codec
+
+
+def _attribute_expr(name):
+    """Python expression to get attribute C{name} of self."""
+    if name.isidentifier() and not keyword.iskeyword(name):
+        return "self.%s" % name
+    else:
+        return "getattr(self, %r)" % name
+
+
+class Codec(object):
+    """Compiled read and write functions of a struct class, for a
+    particular version key.
+
+    The functions take the same arguments as
+    :meth:`StructBase.read <pyffi.object_models.xml.struct_.StructBase.read>`
+    and :meth:`StructBase.write <pyffi.object_models.xml.struct_.StructBase.write>`,
+    that is, C{(self, stream, data)}.
+    """
+
+    def __init__(self, cls, key, data=None):
+        """Compile the codec.
+
+        :param cls: The struct class.
+        :type cls: ``type``
+        :param key: The version key, see :func:`get_version_key`.
+        :param data: Data whose version key is C{key}, used to evaluate
+            version conditions. If ``None``, a stand-in is created from
+            C{key}.
+        """
+        if data is None and key is not None:
+            data = _VersionData(*key)
+        self.cls = cls
+        self.key = key
+        self.namespace = {}
+        self.read_source = self._get_source(cls, data, "read")
+        self.write_source = self._get_source(cls, data, "write")
+        filename = "<codec %s %s>" % (cls.__name__, key)
+        exec(compile(self.read_source, filename, "exec"), self.namespace)
+        exec(compile(self.write_source, filename, "exec"), self.namespace)
+        self.read = self.namespace["read"]
+        self.write = self.namespace["write"]
+
+    def _get_source(self, cls, data, method):
+        """Generate source code of the C{method} (``"read"`` or
+        ``"write"``) function."""
+        attrs = cls._get_static_attribute_list(data)[0]
+        # number of statically active attributes for every name,
+        # to find out which names need tracking at runtime
+        counts = {}
+        for attr in attrs:
+            counts[attr.name] = counts.get(attr.name, 0) + 1
+        # names which are possibly active by now, with their flag
+        flags = {}
+        lines = []
+        for index, attr in enumerate(attrs):
+            tests = []
+            if attr.cond is not None:
+                self.namespace["cond_%i" % index] = attr.cond.compile()
+                tests.append("cond_%i(self)" % index)
+            if attr.name in flags:
+                tests.append("not %s" % flags[attr.name])
+            indent = "    "
+            if tests:
+                lines.append("%sif %s:" % (indent, " and ".join(tests)))
+                indent += "    "
+                if counts[attr.name] > 1:
+                    flag = flags.setdefault(
+                        attr.name, "seen_%i" % len(flags))
+                    lines.append("%s%s = True" % (indent, flag))
+            if attr.is_abstract:
+                if lines and lines[-1].endswith(":"):
+                    lines.append("%spass" % indent)
+                continue
+            if isinstance(attr.arg, (int, type(None))):
+                arg = repr(attr.arg)
+            else:
+                arg = _attribute_expr(attr.arg)
+            value_name = "_%s_value_" % attr.name
+            if method == "read":
+                # attributes are created on first use, see StructBase
+                lines.append("%svalue = instance_dict.get(%r)"
+                             % (indent, value_name))
+                lines.append("%sif value is None:" % indent)
+                lines.append("%s    value = self._create_read_attribute(%r)"
+                             % (indent, value_name))
+            else:
+                lines.append("%svalue = self.%s" % (indent, value_name))
+            lines.append("%svalue.arg = %s" % (indent, arg))
+            lines.append("%svalue.%s(stream, data)" % (indent, method))
+        head = ["def %s(self, stream, data):" % method]
+        if method == "read":
+            head.append("    instance_dict = self.__dict__")
+        head.extend("    %s = False" % flag for flag in sorted(flags.values()))
+        if not lines:
+            lines.append("    pass")
+        return "\n".join(head + lines)
+
+
+class _VersionData(object):
+    """Stand-in for data, providing only the attributes of the
+    version key."""
+
+    def __init__(self, version, user_version, user_version_2):
+        self.version = version
+        self.user_version = user_version
+        self.user_version_2 = user_version_2
@@ -67,6 +67,10 @@ class _MetaEnumBase(type):
             cls._struct = 'I'
         else:
             raise RuntimeError("unsupported enum numbytes")
+        # compiled struct, by byte order
+        cls._structs = dict(
+            (byte_order, struct.Struct(byte_order + cls._struct))
+            for byte_order in "<>")
 
         # template type?
         cls._is_template = False
@@ -122,6 +126,7 @@ class _MetaEnumBase(type):
         return returns
 
 class EnumBase(BasicBase, EditableComboBox, metaclass=_MetaEnumBase):
+    __slots__ = ()
     _enumkeys = []
     _enumvalues = []
     _numbytes = 1 # default width of an enum
@@ -160,13 +165,12 @@ class EnumBase(BasicBase, EditableComboBox, metaclass=_MetaEnumBase):
 
     def read(self, stream, data):
         """Read value from stream."""
-        self._value = struct.unpack(data._byte_order + self._struct,
-                                    stream.read(self._numbytes))[0]
+        self._value, = self._structs[data._byte_order].unpack(
+            stream.read(self._numbytes))
 
     def write(self, stream, data):
         """Write value to stream."""
-        stream.write(struct.pack(data._byte_order + self._struct,
-                                 self._value))
+        stream.write(self._structs[data._byte_order].pack(self._value))
 
     def __str__(self):
         try:
@@ -179,6 +183,10 @@ class EnumBase(BasicBase, EditableComboBox, metaclass=_MetaEnumBase):
         """Return size of this type."""
         return self._numbytes
 
+    @classmethod
+    def _get_static_size(cls, data=None):
+        return cls._numbytes
+
     def get_hash(self, data=None):
         """Return a hash value for this value."""
         return self.get_value()
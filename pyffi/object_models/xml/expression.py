@@ -40,6 +40,7 @@
 # ***** END LICENSE BLOCK *****
 # --------------------------------------------------------------------------
 
+import operator
 import re
 import sys  # stderr (for debugging)
 
@@ -78,6 +79,14 @@ class Expression(object):
     operators = set(('==', '!=', '>=', '<=', '&&', '||', '&', '|', '-', '!',
                      '<', '>', '/', '*', '+', '%'))
 
+    _operator_functions = {
+        '==': operator.eq, '!=': operator.ne,
+        '>=': operator.ge, '<=': operator.le,
+        '>': operator.gt, '<': operator.lt,
+        '&': operator.and_, '|': operator.or_,
+        '-': operator.sub, '+': operator.add,
+        '*': operator.mul, '/': operator.truediv, '%': operator.mod}
+
     def __init__(self, expr_str, name_filter=None):
         try:
             left, self._op, right = self._partition(expr_str)
@@ -88,77 +97,118 @@ class Expression(object):
             raise
 
     def eval(self, data=None):
-        """Evaluate the expression to an integer."""
+        """Evaluate the expression to an integer.
 
-        if isinstance(self._left, Expression):
-            left = self._left.eval(data)
-        elif isinstance(self._left, str):
-            if self._left == '""':
-                left = ""
-            else:
-                left = data
-                for part in self._left.split("."):
-                    left = getattr(left, part)
-        elif isinstance(self._left, type):
-            left = isinstance(data, self._left)
-        elif self._left is None:
-            pass
-        else:
-            assert (isinstance(self._left, int))  # debug
-            left = self._left
+        The expression is compiled on first evaluation, see
+        :meth:`compile`.
+        """
+        return self.compile()(data)
+
+    def compile(self):
+        """Compile the expression into a function which takes the data
+        as single argument, and returns the same value as :meth:`eval`.
+        The function is cached, and replaces :meth:`eval` on the
+        instance, so later calls to :meth:`eval` evaluate the compiled
+        function directly.
+
+        >>> class A(object):
+        ...     x = 3
+        >>> e = Expression('(x + 1) * 2')
+        >>> func = e.compile()
+        >>> func(A())
+        8
+        >>> e.eval is func
+        True
+        """
+        func = self.__dict__.get("eval")
+        if func is None:
+            func = self.eval = self._compile()
+        return func
+
+    def is_constant(self):
+        """Whether the value of the expression does not depend on the
+        data.
+
+        >>> Expression('(1 + 2) * 4').is_constant()
+        True
+        >>> Expression('x + 1').is_constant()
+        False
+        """
+        for operand in (self._left, self._right):
+            if isinstance(operand, Expression):
+                if not operand.is_constant():
+                    return False
+            elif not self._compile_operand(operand)[0]:
+                return False
+        return True
 
+    def _compile(self):
+        """Build the function returned by :meth:`compile`."""
+        left_is_const, left = self._compile_operand(self._left)
         if not self._op:
-            return left
+            if left_is_const:
+                return lambda data=None: left
+            return lambda data=None: left(data)
 
-        if isinstance(self._right, Expression):
-            right = self._right.eval(data)
-        elif isinstance(self._right, str):
-            if (not self._right) or self._right == '""':
-                right = ""
+        right_is_const, right = self._compile_operand(self._right)
+        if self._op == '!':
+            if right_is_const:
+                return lambda data=None: not right
+            return lambda data=None: not right(data)
+        if self._op in ('&&', '||'):
+            if left_is_const:
+                left = self._constant_function(left)
+            if right_is_const:
+                right = self._constant_function(right)
+            if self._op == '&&':
+                return lambda data=None: left(data) and right(data)
             else:
-                right = getattr(data, self._right)
-        elif isinstance(self._right, type):
-            right = isinstance(data, self._right)
-        elif self._right is None:
-            pass
+                return lambda data=None: left(data) or right(data)
+        try:
+            func = self._operator_functions[self._op]
+        except KeyError:
+            raise NotImplementedError("expression syntax error: operator '" + self._op + "' not implemented")
+        if left_is_const and right_is_const:
+            return lambda data=None: func(left, right)
+        elif left_is_const:
+            return lambda data=None: func(left, right(data))
+        elif right_is_const:
+            return lambda data=None: func(left(data), right)
         else:
-            assert (isinstance(self._right, int))  # debug
-            right = self._right
-
-        if self._op == '==':
-            return left == right
-        elif self._op == '!=':
-            return left != right
-        elif self._op == '>=':
-            return left >= right
-        elif self._op == '<=':
-            return left <= right
-        elif self._op == '&&':
-            return left and right
-        elif self._op == '||':
-            return left or right
-        elif self._op == '&':
-            return left & right
-        elif self._op == '|':
-            return left | right
-        elif self._op == '-':
-            return left - right
-        elif self._op == '!':
-            return not (right)
-        elif self._op == '>':
-            return left > right
-        elif self._op == '<':
-            return left < right
-        elif self._op == '/':
-            return left / right
-        elif self._op == '*':
-            return left * right
-        elif self._op == '+':
-            return left + right
-        elif self._op == '%':
-            return left % right
+            return lambda data=None: func(left(data), right(data))
+
+    @staticmethod
+    def _constant_function(value):
+        """Function which ignores its argument and returns C{value}."""
+        return lambda data=None: value
+
+    @staticmethod
+    def _compile_operand(operand):
+        """Compile an operand into a function of the data, or, if the
+        operand does not depend on the data, into a constant.
+
+        :return: A pair ``(is_const, value)``, where value is the
+            constant if C{is_const} is ``True``, and the function
+            otherwise.
+        """
+        if isinstance(operand, Expression):
+            return False, operand.compile()
+        elif isinstance(operand, str):
+            if (not operand) or operand == '""':
+                return True, ""
+            # attrgetter follows dotted names
+            return False, operator.attrgetter(operand)
+        elif isinstance(operand, type):
+            return False, lambda data: isinstance(data, operand)
         else:
-            raise NotImplementedError("expression syntax error: operator '" + self._op + "' not implemented")
+            assert (operand is None or isinstance(operand, int))  # debug
+            return True, operand
+
+    def __getstate__(self):
+        """Drop the compiled function, which cannot be pickled."""
+        state = self.__dict__.copy()
+        state.pop("eval", None)
+        return state
 
     def __str__(self):
         """Reconstruct the expression to a string."""
@@ -341,6 +391,8 @@ class Expression(object):
         return start_pos, end_pos
 
     def map_(self, func):
+        # operands change, so drop the compiled function
+        self.__dict__.pop("eval", None)
         if isinstance(self._left, Expression):
             self._left.map_(func)
         else:
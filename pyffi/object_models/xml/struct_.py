@@ -45,6 +45,7 @@ from functools import partial
 
 
 from pyffi.utils.graph import DetailNode, GlobalNode, EdgeFilter
+from pyffi.object_models.xml.codec import get_codec, get_version_key
 import pyffi.object_models.common
 
 class _MetaStructBase(type):
@@ -134,6 +135,27 @@ class _MetaStructBase(type):
         # precalculate the attribute name list
         cls._names = cls._get_names()
 
+        # attribute of every _<name>_value_ instance variable, for
+        # creating attribute instances on first access; if names are
+        # duplicated, then the first attribute is used (for this to work
+        # properly, duplicates must have the same type, template,
+        # argument, arr1, and arr2)
+        cls._lazy_attributes = {}
+        for attr in reversed(cls._attribute_list):
+            cls._lazy_attributes["_%s_value_" % attr.name] = attr
+
+        # plain-old-data layout, for reading and writing arrays in bulk
+        cls._pod_format, cls._pod_names = cls._get_pod_layout()
+
+        # statically filtered attribute lists, by version key
+        cls._static_attribute_lists = {}
+
+        # compiled codecs, by version key (see pyffi.object_models.xml.codec)
+        cls._codecs = {}
+
+        # static sizes, by version key
+        cls._static_sizes = {}
+
     def __repr__(cls):
         return "<struct '%s'>"%(cls.__name__)
 
@@ -225,8 +247,41 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
     _attrs = []
     _games = {}
     arg = None
+    _template = None
     logger = logging.getLogger("pyffi.nif.data.struct")
 
+    _source_bytes = None
+    """The bytes from which the structure was read, as ``bytes`` or as a
+    ``memoryview`` into the bytes of the whole file, if the file format
+    keeps them for writing unmodified structures back as they are, or
+    ``None``. Reset to ``None`` as soon as the structure may be modified,
+    that is, when one of its attributes is set, or when a non-basic
+    attribute or any child node is accessed.
+    """
+
+    _read_on_access = None
+    """If the file format reads the structure only when one of its
+    attributes is first accessed, then the function which reads it,
+    else ``None``. Removed from the instance once called. Only
+    applies to instances created by :meth:`_create_lazy`.
+    """
+
+    _link_observer = None
+    """The observer which is notified of changes of the links in the
+    structure, see :meth:`set_link_observer`, or ``None``.
+    """
+
+    use_lazy_attributes = False
+    """Set to ``True``, on this class or on a particular struct class
+    (and so its subclasses), to create the attribute instances of new
+    structures only on first access or read (see :meth:`__getattr__`),
+    rather than all at once in the constructor. Attributes which are
+    not active for the version of a file are then never created, which
+    saves memory. Note that an array which is first accessed outside
+    of :meth:`read` is then sized from the counts at the time of that
+    access, rather than from the counts at construction time.
+    """
+
     # initialize all attributes
     def __init__(self, template = None, argument = None, parent = None):
         """The constructor takes a tempate: any attribute whose type,
@@ -234,67 +289,141 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
         TEMPLATE in the xml description - will be replaced by this
         type. The argument is what the ARG xml tags will be replaced with.
 
+        If :attr:`use_lazy_attributes` is set, then the attribute
+        instances themselves are only created on first access.
+
         :param template: If the class takes a template type
             argument, then this argument describes the template type.
         :param argument: If the class takes a type argument, then
             it is described here.
         :param parent: The parent of this instance, that is, the instance this
             array is an attribute of."""
-        # used to track names of attributes that have already been added
-        # is faster than self.__dict__.has_key(...)
-        names = set()
         # initialize argument
         self.arg = argument
         # save parent (note: disabled for performance)
         #self._parent = weakref.ref(parent) if parent else None
-        # initialize item list
-        # this list is used for instance by qskope to display the structure
-        # in a tree view
-        self._items = []
+        # save template, if any, for creating the attributes
+        if template is not None:
+            self._template = template
         # initialize attributes
-        for attr in self._attribute_list:
-            # skip attributes with dupiclate names
-            # (for this to work properly, duplicates must have the same
-            # type, template, argument, arr1, and arr2)
-            if attr.name in names:
-                continue
-            names.add(attr.name)
+        if not self.use_lazy_attributes:
+            for name in self._names:
+                value_name = "_%s_value_" % name
+                setattr(self, value_name,
+                        self._create_attribute(
+                            self._lazy_attributes[value_name]))
 
-            # things that can only be determined at runtime (rt_xxx)
-            rt_type = attr.type_ if attr.type_ != type(None) \
-                      else template
-            rt_template = attr.template if attr.template != type(None) \
-                          else template
-            rt_arg = attr.arg if isinstance(attr.arg, (int, type(None))) \
-                     else getattr(self, attr.arg)
+    @classmethod
+    def _create_lazy(cls, template=None, argument=None):
+        """Create an instance whose attributes are created on first
+        access, whatever :attr:`use_lazy_attributes` is set to; used
+        for instance for structures which are read on first access.
+        """
+        self = cls.__new__(cls)
+        self.arg = argument
+        if template is not None:
+            self._template = template
+        return self
 
-            # instantiate the class, handling arrays at the same time
-            if attr.arr1 == None:
-                attr_instance = rt_type(
-                    template = rt_template, argument = rt_arg,
-                    parent = self)
-                if attr.default != None:
-                    attr_instance.set_value(attr.default)
-            elif attr.arr2 == None:
-                attr_instance = Array(
-                    element_type = rt_type,
-                    element_type_template = rt_template,
-                    element_type_argument = rt_arg,
-                    count1 = attr.arr1,
-                    parent = self)
-            else:
-                attr_instance = Array(
-                    element_type = rt_type,
-                    element_type_template = rt_template,
-                    element_type_argument = rt_arg,
-                    count1 = attr.arr1, count2 = attr.arr2,
-                    parent = self)
+    def __getattr__(self, name):
+        """Create the instance of an attribute, on first access to its
+        _<name>_value_ instance variable.
+
+        Only called if the instance variable does not exist yet.
+        If the structure has not been read yet (see
+        :attr:`_read_on_access`), then it is read first.
+        """
+        try:
+            attr = self._lazy_attributes[name]
+        except KeyError:
+            raise AttributeError("'%s' object has no attribute '%s'"
+                                 % (self.__class__.__name__, name))
+        read_on_access = self.__dict__.pop("_read_on_access", None)
+        if read_on_access is not None:
+            read_on_access()
+            try:
+                return self.__dict__[name]
+            except KeyError:
+                # not read, so not active for this version
+                pass
+        attr_instance = self._create_attribute(attr)
+        setattr(self, name, attr_instance)
+        return attr_instance
+
+    def __getstate__(self):
+        """Get the instance variables for pickling. Source bytes which
+        are a view into the bytes of the whole file are pickled as
+        ``bytes``, as views cannot be pickled. The link observer is
+        not pickled: it belongs to the tree which the structure is in."""
+        state = self.__dict__
+        if (isinstance(state.get("_source_bytes"), memoryview)
+            or "_link_observer" in state):
+            state = state.copy()
+            state.pop("_link_observer", None)
+            if isinstance(state.get("_source_bytes"), memoryview):
+                state["_source_bytes"] = bytes(state["_source_bytes"])
+        return state
+
+    def __setstate__(self, state):
+        """Restore the instance variables when unpickling. Defined
+        only so unpickling does not look it up through
+        :meth:`__getattr__`, which is slow for missing attributes."""
+        self.__dict__.update(state)
+
+    def _create_read_attribute(self, name):
+        """Create the instance of an attribute which is about to be
+        read, from the name of its _<name>_value_ instance variable.
+        """
+        attr_instance = self._create_attribute(
+            self._lazy_attributes[name], populate=False)
+        setattr(self, name, attr_instance)
+        return attr_instance
 
-            # assign attribute value
-            setattr(self, "_%s_value_" % attr.name, attr_instance)
+    def _create_attribute(self, attr, populate=True):
+        """Create an instance of the attribute C{attr}.
 
-            # add instance to item list
-            self._items.append(attr_instance)
+        :param populate: Whether to create the elements of arrays
+            (set to ``False`` if the attribute is about to be read).
+        """
+        template = self._template
+        # things that can only be determined at runtime (rt_xxx)
+        rt_type = attr.type_ if attr.type_ != type(None) \
+                  else template
+        rt_template = attr.template if attr.template != type(None) \
+                      else template
+        rt_arg = attr.arg if isinstance(attr.arg, (int, type(None))) \
+                 else getattr(self, attr.arg)
+
+        # instantiate the class, handling arrays at the same time
+        if attr.arr1 == None:
+            attr_instance = rt_type(
+                template = rt_template, argument = rt_arg,
+                parent = self)
+            if attr.default != None:
+                attr_instance.set_value(attr.default)
+        elif attr.arr2 == None:
+            attr_instance = Array(
+                element_type = rt_type,
+                element_type_template = rt_template,
+                element_type_argument = rt_arg,
+                count1 = attr.arr1,
+                parent = self, populate = populate)
+        else:
+            attr_instance = Array(
+                element_type = rt_type,
+                element_type_template = rt_template,
+                element_type_argument = rt_arg,
+                count1 = attr.arr1, count2 = attr.arr2,
+                parent = self, populate = populate)
+        return attr_instance
+
+    @property
+    def _items(self):
+        """List of all attribute instances, in order. This list is used
+        for instance by qskope to display the structure in a tree view."""
+        if self._source_bytes is not None:
+            self._source_bytes = None
+        return [getattr(self, "_%s_value_" % name) for name in self._names]
 
     def deepcopy(self, block):
         """Copy attributes from a given block (one block class must be a
@@ -356,7 +485,11 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
 
     def read(self, stream, data):
         """Read structure from stream."""
+        if data.use_codecs:
+            get_codec(self.__class__, data).read(self, stream, data)
+            return
         # read all attributes
+        instance_dict = self.__dict__
         for attr in self._get_filtered_attribute_list(data):
             # skip abstract attributes
             if attr.is_abstract:
@@ -364,8 +497,11 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
             # get attribute argument (can only be done at runtime)
             rt_arg = attr.arg if isinstance(attr.arg, (int, type(None))) \
                 else getattr(self, attr.arg)
-            # read the attribute
-            attr_value = getattr(self, "_%s_value_" % attr.name)
+            # read the attribute, creating it on first use
+            value_name = "_%s_value_" % attr.name
+            attr_value = instance_dict.get(value_name)
+            if attr_value is None:
+                attr_value = self._create_read_attribute(value_name)
             attr_value.arg = rt_arg
             # if hasattr(attr, "type_"):
             #     attr_value._elementType = attr.type_
@@ -375,6 +511,9 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
 
     def write(self, stream, data):
         """Write structure to stream."""
+        if data.use_codecs:
+            get_codec(self.__class__, data).write(self, stream, data)
+            return
         # write all attributes
         for attr in self._get_filtered_attribute_list(data):
             # skip abstract attributes
@@ -429,6 +568,28 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
         # return the list of all strings in all attributes
         return strings
 
+    def get_link_slots(self, data=None):
+        """Get list of all link instances in the structure, rather than
+        the objects they link to."""
+        slots = []
+        for attr in self._get_filtered_attribute_list(data):
+            if not attr.type_._has_links:
+                continue
+            slots.extend(
+                getattr(self, "_" + attr.name + "_value_").get_link_slots(data))
+        return slots
+
+    def set_link_observer(self, observer, data=None):
+        """Set the observer which is notified of changes of the links
+        in all attributes of the structure, or ``None``. The observer
+        is kept as :attr:`_link_observer`."""
+        self._link_observer = observer
+        for attr in self._get_filtered_attribute_list(data):
+            if not attr.type_._has_links:
+                continue
+            getattr(self, "_%s_value_" % attr.name).set_link_observer(
+                observer, data)
+
     def get_refs(self, data=None):
         """Get list of all references in the structure. Refs are
         links that point down the tree. For instance, if you need to parse
@@ -449,6 +610,10 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
 
     def get_size(self, data=None):
         """Calculate the structure size in bytes."""
+        # fixed layout: no need to visit the attributes
+        size = self._get_static_size(data)
+        if size is not None:
+            return size
         # calculate size
         size = 0
         for attr in self._get_filtered_attribute_list(data):
@@ -468,6 +633,9 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
         return tuple(hsh)
 
     def replace_global_node(self, oldbranch, newbranch, **kwargs):
+        if self._source_bytes is not None:
+            if any(link is oldbranch for link in self.get_links()):
+                self._source_bytes = None
         for attr in self._get_filtered_attribute_list():
             # check if there are any links at all
             # (this speeds things up considerably)
@@ -517,71 +685,187 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
                 names.append(attr.name)
         return names
 
-    def _get_filtered_attribute_list(self, data=None):
-        """Generator for listing all 'active' attributes, that is,
-        attributes whose condition evaluates ``True``, whose version
-        interval contains C{version}, and whose user version is
-        C{user_version}. ``None`` for C{version} or C{user_version} means
-        that these checks are ignored. Duplicate names are skipped as
-        well.
+    @classmethod
+    def _get_pod_layout(cls):
+        """Get the layout of the structure, if it is plain-old-data,
+        that is, if all its attributes are plain integers or floats,
+        which are present regardless of version and conditions, and if
+        reading and writing are not customized. Arrays of such
+        structures are read and written in bulk, with a single
+        ``struct.Struct``.
+
+        :return: The struct format (without byte order), and the names
+            of the instance variables which store the attribute values,
+            in order; or ``(None, None)`` if the structure is not
+            plain-old-data.
+        :rtype: ``tuple``
+        """
+        attrs = cls._attribute_list
+        if not attrs or len(cls._names) != len(attrs):
+            return None, None
+        for name in ("read", "write"):
+            owner = next(klass for klass in cls.__mro__
+                         if name in klass.__dict__)
+            if owner is not StructBase:
+                return None, None
+        pod_format = ""
+        for attr in attrs:
+            if (attr.arr1 is not None or attr.cond is not None
+                or attr.vercond is not None or attr.ver1 is not None
+                or attr.ver2 is not None or attr.userver is not None
+                or attr.arg is not None or attr.is_abstract
+                or isinstance(attr.type_, str)):
+                return None, None
+            packed_format = _get_packed_format(attr.type_)
+            if packed_format is None:
+                return None, None
+            pod_format += packed_format[0]
+        return pod_format, tuple("_%s_value_" % attr.name for attr in attrs)
 
-        Note: version and user_version arguments are deprecated, use
-        the data argument instead.
+    @classmethod
+    def _get_static_size(cls, data=None):
+        """Get the size of the structure in bytes, for the version of
+        C{data}, if it does not depend on the values of the structure,
+        that is, if it has no conditional attributes, no template
+        attributes, and no arrays of variable size, and if the sizes of
+        all attribute types are static as well.
+
+        :return: The size, or ``None`` if the size depends on the values.
+        :rtype: ``int``
+        """
+        key = get_version_key(data)
+        try:
+            return cls._static_sizes[key]
+        except KeyError:
+            pass
+        size = 0
+        for attr in cls._get_static_attribute_list(data)[0]:
+            # skip abstract attributes
+            if attr.is_abstract:
+                continue
+            if (attr.cond is not None
+                or isinstance(attr.type_, str)
+                or attr.type_ is type(None)):
+                size = None
+                break
+            attr_size = _get_static_size(attr.type_, data)
+            if attr_size is None:
+                size = None
+                break
+            for count in (attr.arr1, attr.arr2):
+                if count is None:
+                    continue
+                if not count.is_constant():
+                    size = None
+                    break
+                attr_size *= count.eval()
+            if size is None:
+                break
+            size += attr_size
+        cls._static_sizes[key] = size
+        return size
+
+    @classmethod
+    def _get_static_attribute_list(cls, data=None):
+        """Get all attributes which are active for the version of
+        C{data}, that is, all attributes whose version interval contains
+        the version, whose user version is the user version, and whose
+        version condition evaluates ``True``. Attributes whose name
+        is already taken by an earlier attribute without condition are
+        skipped. The result is cached per version key (see
+        :func:`~pyffi.object_models.xml.codec.get_version_key`).
+
+        :return: The list of attributes, and whether the list still
+            has duplicate names, which can only be resolved by
+            evaluating the conditions.
+        :rtype: ``tuple``
         """
+        key = get_version_key(data)
+        try:
+            return cls._static_attribute_lists[key]
+        except KeyError:
+            pass
         if data is not None:
             version = data.version
             user_version = data.user_version
         else:
             version = None
             user_version = None
+        attrs = []
         names = set()
-        for attr in self._attribute_list:
-            #print(attr.name, version, attr.ver1, attr.ver2) # debug
-
+        uncond_names = set()
+        has_duplicates = False
+        for attr in cls._attribute_list:
             # check version
             if version is not None:
                 if attr.ver1 is not None and version < attr.ver1:
                     continue
                 if attr.ver2 is not None and version > attr.ver2:
                     continue
-            #print("version check passed") # debug
-
             # check user version
             if (attr.userver is not None and user_version is not None
                 and user_version != attr.userver):
                 continue
-            #print("user version check passed") # debug
-
-            # check conditions
-            if attr.cond is not None and not attr.cond.eval(self):
-                continue
-
+            # check version condition
             if (version is not None and user_version is not None
                 and attr.vercond is not None):
                 if not attr.vercond.eval(data):
                     continue
-
-            #print("condition passed") # debug
-
-            # skip dupiclate names
-
-            if attr.name in names:
+            # skip duplicate names, unless the attribute might be
+            # active anyway, depending on conditions
+            if attr.name in uncond_names:
                 continue
-            #print("duplicate check passed") # debug
-
+            if attr.name in names:
+                has_duplicates = True
             names.add(attr.name)
-            # passed all tests
-            # so yield the attribute
-            yield attr
+            if attr.cond is None:
+                uncond_names.add(attr.name)
+            attrs.append(attr)
+        result = cls._static_attribute_lists[key] = (attrs, has_duplicates)
+        return result
+
+    def _get_filtered_attribute_list(self, data=None):
+        """Generator for listing all 'active' attributes, that is,
+        attributes whose condition evaluates ``True``, whose version
+        interval contains C{version}, and whose user version is
+        C{user_version}. ``None`` for C{version} or C{user_version} means
+        that these checks are ignored. Duplicate names are skipped as
+        well.
+
+        Note: version and user_version arguments are deprecated, use
+        the data argument instead.
+        """
+        attrs, has_duplicates = self._get_static_attribute_list(data)
+        if not has_duplicates:
+            for attr in attrs:
+                # check conditions
+                if attr.cond is not None and not attr.cond.eval(self):
+                    continue
+                yield attr
+        else:
+            names = set()
+            for attr in attrs:
+                # check conditions
+                if attr.cond is not None and not attr.cond.eval(self):
+                    continue
+                # skip dupiclate names
+                if attr.name in names:
+                    continue
+                names.add(attr.name)
+                yield attr
 
     def get_attribute(self, name):
         """Get a (non-basic) attribute."""
+        if self._source_bytes is not None:
+            self._source_bytes = None
         return getattr(self, "_" + name + "_value_")
 
     # important note: to apply partial(set_attribute, name = 'xyz') the
     # name argument must be last
     def set_attribute(self, value, name):
         """Set a (non-basic) attribute."""
+        if self._source_bytes is not None:
+            self._source_bytes = None
         # check class
         attr = getattr(self, "_" + name + "_value_")
         if attr.__class__ is not value.__class__:
@@ -599,6 +883,8 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
     # name argument must be last
     def set_basic_attribute(self, value, name):
         """Set the value of a basic attribute."""
+        if self._source_bytes is not None:
+            self._source_bytes = None
         getattr(self, "_" + name + "_value_").set_value(value)
 
     def get_template_attribute(self, name):
@@ -628,7 +914,9 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
 
     def get_detail_child_nodes(self, edge_filter=EdgeFilter()):
         """Yield children of this structure."""
-        return (item for item in self._items)
+        if self._source_bytes is not None:
+            self._source_bytes = None
+        return (getattr(self, "_%s_value_" % name) for name in self._names)
 
     def get_detail_child_names(self, edge_filter=EdgeFilter()):
         """Yield names of the children of this structure."""
@@ -648,4 +936,5 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
             yield branch
 
 from pyffi.object_models.xml.basic import BasicBase
-from pyffi.object_models.xml.array import Array
+from pyffi.object_models.xml.array import (
+    Array, _get_packed_format, _get_static_size)
@@ -139,8 +139,8 @@ from configparser import ConfigParser
 from copy import deepcopy
 import gc
 
+import concurrent.futures  # ProcessPoolExecutor, wait
 import logging  # Logger
-import concurrent.futures  # ProcessPoolExecutor
 import multiprocessing  # current_process, cpu_count
 import optparse
 import os  # remove
@@ -148,6 +148,7 @@ import os.path  # getsize, split, join
 import re  # for regex parsing (--skip, --only)
 import shlex  # shlex.split for parsing option lists in ini files
 import subprocess
+import sys  # version_info
 import tempfile
 
 import pyffi  # for pyffi.__version__
@@ -388,6 +389,35 @@ class Spell(object):
         """
         pass
 
+    @classmethod
+    def toastresult(cls, toaster):
+        """Called in a worker process, when toasting with more than one
+        job, after every file that it processed. If the spell aggregates
+        statistics from files in the toaster (usually set up in
+        :meth:`toastentry`), then it must return what was aggregated
+        for this file, and reset the toaster's statistics, so they can
+        be merged in the main process with :meth:`toastmerge`. The
+        default implementation returns ``None``.
+
+        :param toaster: The toaster of the worker process.
+        :type toaster: :class:`Toaster`
+        :return: A picklable object.
+        """
+        return None
+
+    @classmethod
+    def toastmerge(cls, toaster, result):
+        """Called in the main process, when toasting with more than one
+        job, to merge the result of :meth:`toastresult` of every file
+        into the toaster, before :meth:`toastexit` is called. The
+        default implementation does nothing.
+
+        :param toaster: The toaster this spell is called from.
+        :type toaster: :class:`Toaster`
+        :param result: The result of :meth:`toastresult`.
+        """
+        pass
+
     @classmethod
     def get_toast_stream(cls, toaster, filename, test_exists=False):
         """Returns the stream that the toaster will write to. The
@@ -455,6 +485,16 @@ class SpellGroupBase(Spell):
         for spellclass in cls.ACTIVESPELLCLASSES:
             spellclass.toastexit(toaster)
 
+    @classmethod
+    def toastresult(cls, toaster):
+        return [spellclass.toastresult(toaster)
+                for spellclass in cls.ACTIVESPELLCLASSES]
+
+    @classmethod
+    def toastmerge(cls, toaster, result):
+        for spellclass, spellresult in zip(cls.ACTIVESPELLCLASSES, result):
+            spellclass.toastmerge(toaster, spellresult)
+
 
 class SpellGroupSeriesBase(SpellGroupBase):
     """Base class for running spells in series."""
@@ -604,10 +644,30 @@ class fake_logger:
         cls.level = level
 
 
-def _toaster_job(args):
-    """For multiprocessing. This function creates a new toaster, with the
-    given options and spells, and calls the toaster on filename.
+_toaster = None
+"""The toaster of a worker process, see :func:`_toaster_job_init`."""
+
+class _ToasterJobResult(object):
+    """The result of toasting a single file in a worker process, see
+    :func:`_toaster_job`: the file name, its status (one of ``"done"``,
+    ``"skipped"``, ``"failed"``, or ``None`` if the file was not
+    toasted), the reports of the spell if the file was done, and the
+    result of :meth:`Spell.toastresult`.
+    """
+    __slots__ = ("filename", "status", "reports", "spellresult")
+
+    def __init__(self, filename, status, reports, spellresult):
+        self.filename = filename
+        self.status = status
+        self.reports = reports
+        self.spellresult = spellresult
+
+def _toaster_job_init(toasterclass, options, spellnames):
+    """For multiprocessing. This function creates the toaster of a worker
+    process, with the given options and spells. The toaster is created
+    only once, and is then used for every file that the worker toasts.
     """
+    global _toaster
 
     class multiprocessing_fake_logger(fake_logger):
         """Simple logger which works well along with multiprocessing on all platforms."""
@@ -619,7 +679,6 @@ def _toaster_job(args):
                       % (multiprocessing.current_process().pid,
                          level_str, msg))
 
-    toasterclass, filename, options, spellnames = args
     toaster = toasterclass(options=options, spellnames=spellnames,
                            logger=multiprocessing_fake_logger)
 
@@ -627,13 +686,41 @@ def _toaster_job(args):
     if not toaster.spellclass.toastentry(toaster):
         print("pyffi.toaster:%s" % "Spell does not apply! quiting early...")
         return
+    _toaster = toaster
 
-    # toast single file
-    stream = open(filename, mode='rb' if toaster.spellclass.READONLY else 'r+b')
-    toaster._toast(stream)
+def _toaster_job(filename):
+    """For multiprocessing. This function calls the toaster of the
+    worker process on filename.
 
-    # toast exit code
-    toaster.spellclass.toastexit(toaster)
+    :return: The result, to be merged in the main process by
+        :meth:`Toaster._merge_job_result`.
+    :rtype: :class:`_ToasterJobResult`
+    """
+    if _toaster is None:
+        # spell does not apply
+        return None
+
+    # toast single file
+    with open(filename,
+              mode='rb' if _toaster.spellclass.READONLY else 'r+b') as stream:
+        _toaster._toast(stream)
+    if _toaster.options["gccollect"]:
+        # force free memory (helps when parsing many files)
+        gc.collect()
+
+    # collect the result, and clear it from the toaster
+    status, reports = None, None
+    if filename in _toaster.files_done:
+        status, reports = "done", _toaster.files_done.pop(filename)
+    elif filename in _toaster.files_skipped:
+        status = "skipped"
+        _toaster.files_skipped.remove(filename)
+    elif filename in _toaster.files_failed:
+        status = "failed"
+        _toaster.files_failed.remove(filename)
+    return _ToasterJobResult(
+        filename, status, reports,
+        _toaster.spellclass.toastresult(_toaster))
 
 # CPU_COUNT is used for default number of jobs
 if multiprocessing:
@@ -1027,8 +1114,8 @@ class Toaster(object):
             "--refresh", dest="refresh",
             type="int",
             metavar="REFRESH",
-            help="start new process pool every JOBS * REFRESH files"
-                 " if JOBS is 2 or more"
+            help="start a new process after every REFRESH files toasted"
+                 " by a process if JOBS is 2 or more, on Python 3.11 and up"
                  " (when processing a large number of files, this prevents"
                  " leaking memory on some operating systems) [default: %default]")
         parser.add_option(
@@ -1255,22 +1342,91 @@ class Toaster(object):
                     # force free memory (helps when parsing many files)
                     gc.collect()
         else:
-            chunksize = self.options["refresh"] * self.options["jobs"]
-            self.msg("toasting with %i threads in chunks of %i files"
-                     % (jobs, chunksize))
-            for file_pool in file_pools(chunksize):
-                self.logger.debug("process file pool:")
-                for filename in file_pool:
-                    self.logger.debug("  " + filename)
-                with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
-                    list(executor.map(
-                        _toaster_job,
-                        ((self.__class__, filename, self.options, self.spellnames)
-                         for filename in file_pool)))
+            chunksize = self.options["refresh"] * jobs
+            self.msg("toasting with %i processes" % jobs)
+            # a single pool for all files; every process creates its
+            # toaster once, and is replaced after toasting refresh files
+            # where supported; if a process dies, then the pool is broken
+            # and the error is raised rather than waiting forever
+            pool_options = dict(
+                max_workers=jobs, initializer=_toaster_job_init,
+                initargs=(self.__class__, self.options, self.spellnames))
+            if sys.version_info >= (3, 11):
+                pool_options["max_tasks_per_child"] = self.options["refresh"]
+                # processes cannot be replaced if they are forked from
+                # this process; forking them from a server process which
+                # has imported the toaster, its file format and its
+                # spells is still much faster than starting them afresh
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context("forkserver")
+                    context.set_forkserver_preload(
+                        [self.__class__.__module__,
+                         self.FILEFORMAT.__module__]
+                        + [spellclass.__module__
+                           for spellclass in self.SPELLS])
+                    pool_options["mp_context"] = context
+            # index of the file of every job which is not finished yet
+            pending = {}
+            # results of the workers, by index of the file, which are
+            # merged in the order that the files were submitted
+            results = {}
+            num_submitted = 0
+            num_merged = 0
+
+            def wait_for_jobs(max_pending):
+                """Wait until at most max_pending jobs are not finished,
+                and merge the results which are next in order."""
+                nonlocal num_merged
+                while len(pending) > max_pending:
+                    done, not_done = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        # raises the error of the job, if any
+                        results[pending.pop(future)] = future.result()
+                while num_merged in results:
+                    self._merge_job_result(results.pop(num_merged))
+                    num_merged += 1
+
+            with concurrent.futures.ProcessPoolExecutor(
+                    **pool_options) as pool:
+                try:
+                    for file_pool in file_pools(chunksize):
+                        self.logger.debug("process file pool:")
+                        for filename in file_pool:
+                            self.logger.debug("  " + filename)
+                            # at most two files per process are queued
+                            wait_for_jobs(2 * jobs - 1)
+                            future = pool.submit(_toaster_job, filename)
+                            pending[future] = num_submitted
+                            num_submitted += 1
+                    wait_for_jobs(0)
+                except:
+                    for future in pending:
+                        future.cancel()
+                    raise
 
         # toast exit code
         self.spellclass.toastexit(self)
 
+    def _merge_job_result(self, result):
+        """Merge the result of toasting a file in a worker process into
+        this toaster.
+
+        :param result: The result, as returned by :func:`_toaster_job`.
+        :type result: :class:`_ToasterJobResult`
+        """
+        if result is None:
+            # spell does not apply
+            return
+        if result.status == "done":
+            self.files_done[result.filename] = result.reports
+        elif result.status == "skipped":
+            self.files_skipped.add(result.filename)
+        elif result.status == "failed":
+            self.files_failed.add(result.filename)
+        self.spellclass.toastmerge(self, result.spellresult)
+
     def toast_archives(self, top):
         """Toast all files in all archives."""
         if not self.FILEFORMAT.ARCHIVE_CLASSES:
@@ -113,6 +113,17 @@ class SpellNodeNamesByFlag(pyffi.spells.nif.NifSpell):
         for flag, names in toaster.flagdict.items():
             toaster.msg("%s %s" % (flag, names))
 
+    @classmethod
+    def toastresult(cls, toaster):
+        result, toaster.flagdict = toaster.flagdict, {}
+        return result
+
+    @classmethod
+    def toastmerge(cls, toaster, result):
+        for flag, names in result.items():
+            flagnames = toaster.flagdict.setdefault(flag, [])
+            flagnames.extend(name for name in names if name not in flagnames)
+
     def datainspect(self):
         return self.inspectblocktype(NifFormat.NiNode)
 
@@ -702,6 +713,15 @@ class SpellCheckTriStrip(pyffi.spells.nif.NifSpell):
                     % (sum(toaster.striplengths)
                        / float(len(toaster.striplengths))))
 
+    @classmethod
+    def toastresult(cls, toaster):
+        result, toaster.striplengths = toaster.striplengths, []
+        return result
+
+    @classmethod
+    def toastmerge(cls, toaster, result):
+        toaster.striplengths.extend(result)
+
     def datainspect(self):
         return self.inspectblocktype(NifFormat.NiTriBasedGeomData)
 
@@ -814,6 +834,29 @@ class SpellCheckVersion(pyffi.spells.nif.NifSpell):
             toaster.msg("user version2: %s" % toaster.user_version_2s[version])
             toaster.msgblockend()
 
+    @classmethod
+    def toastresult(cls, toaster):
+        result = (toaster.versions, toaster.user_versions,
+                  toaster.user_version_2s)
+        cls.toastentry(toaster)
+        return result
+
+    @classmethod
+    def toastmerge(cls, toaster, result):
+        versions, user_versions, user_version_2s = result
+        for version, num_nifs in versions.items():
+            if version not in toaster.versions:
+                toaster.versions[version] = 0
+                toaster.user_versions[version] = []
+                toaster.user_version_2s[version] = []
+            toaster.versions[version] += num_nifs
+            for user_version in user_versions[version]:
+                if user_version not in toaster.user_versions[version]:
+                    toaster.user_versions[version].append(user_version)
+            for user_version_2 in user_version_2s[version]:
+                if user_version_2 not in toaster.user_version_2s[version]:
+                    toaster.user_version_2s[version].append(user_version_2)
+
     def datainspect(self):
         # some shortcuts
         version = self.data.version
@@ -908,6 +951,15 @@ class SpellCheckTriangles(pyffi.spells.nif.NifSpell):
     def toastexit(cls, toaster):
         toaster.msg("found {0} geometries".format(len(toaster.geometries)))
 
+    @classmethod
+    def toastresult(cls, toaster):
+        result, toaster.geometries = toaster.geometries, []
+        return result
+
+    @classmethod
+    def toastmerge(cls, toaster, result):
+        toaster.geometries.extend(result)
+
 try:
     import numpy
     import scipy.optimize
@@ -66,15 +66,15 @@ def dumpArray(arr):
     """
     text = ""
     if arr._count2 == None:
-        for i, element in enumerate(list.__iter__(arr)):
+        for i, element in enumerate(arr.get_detail_child_nodes()):
             if i > 16:
                 text += "etc...\n"
                 break
             text += "%i: %s\n" % (i, dumpAttr(element))
     else:
         k = 0
-        for i, elemlist in enumerate(list.__iter__(arr)):
-            for j, elem in enumerate(list.__iter__(elemlist)):
+        for i, elemlist in enumerate(arr.get_detail_child_nodes()):
+            for j, elem in enumerate(elemlist.get_detail_child_nodes()):
                 if k > 16:
                     text += "etc...\n"
                     break
@@ -273,6 +273,21 @@ class SpellHtmlReport(NifSpell):
         else:
             toaster.msg('No Report Generated')
 
+    @classmethod
+    def toastresult(cls, toaster):
+        result, toaster.reports_per_blocktype = (
+            toaster.reports_per_blocktype, {})
+        return result
+
+    @classmethod
+    def toastmerge(cls, toaster, result):
+        for blocktype, reports in result.items():
+            if blocktype in toaster.reports_per_blocktype:
+                # skip the header row
+                toaster.reports_per_blocktype[blocktype].extend(reports[1:])
+            else:
+                toaster.reports_per_blocktype[blocktype] = reports
+
     @classmethod
     def browser(cls, htmlstr):
         """Display html in the default web browser without creating a
@@ -443,14 +458,14 @@ class SpellDumpPython(NifSpell):
             if _value:
                 self.print_("%s.update_size()" % name)
                 if _value._count2 is None:
-                    for i, elem in enumerate(list.__iter__(_value)):
+                    for i, elem in enumerate(_value.get_detail_child_nodes()):
                         if self.print_instance(
                             "%s[%i]" % (name, i), elem):
 
                             result = True
                 else:
-                    for i, elemlist in enumerate(list.__iter__(_value)):
-                        for j, elem in enumerate(list.__iter__(elemlist)):
+                    for i, elemlist in enumerate(_value.get_detail_child_nodes()):
+                        for j, elem in enumerate(elemlist.get_detail_child_nodes()):
                             if self.print_instance(
                                 "%s[%i][%i]" % (name, i, j), elem):
 
@@ -72,6 +72,60 @@ http://doc.trolltech.com/4.4/itemviews-simpletreemodel.html
 from itertools import repeat
 from operator import itemgetter
 
+def walk(root, get_children, unique=False, accept=None):
+    """Iterate over C{root}, all its children, all grandchildren, and so
+    on, in depth first pre-order. The walk keeps its own stack, so it
+    is not limited by the Python recursion limit, however deep the
+    graph is.
+
+    >>> graph = {1: [2, 3], 2: [4], 3: [4], 4: []}
+    >>> list(walk(1, graph.__getitem__))
+    [1, 2, 4, 3, 4]
+    >>> list(walk(1, graph.__getitem__, unique=True))
+    [1, 2, 4, 3]
+    >>> list(walk(1, graph.__getitem__, accept=lambda node: node != 2))
+    [1, 3, 4]
+
+    :param root: The node to start from.
+    :param get_children: Function which returns an iterable of the
+        children of a node.
+    :param unique: Whether to yield each node only once. Nodes are
+        compared by identity, and the children of a node which was
+        already visited are not walked again.
+    :type unique: ``bool``
+    :param accept: If not ``None``, a function taking a node; nodes for
+        which it returns ``False`` are neither yielded nor followed.
+    :return: Generator for nodes.
+    :raise ValueError: If C{unique} is ``False`` and a node is its own
+        descendant, as the walk would never end.
+    """
+    visited = set() if unique else None
+    # nodes from the root to the current node, and their ids, if not
+    # unique; the nodes are kept so their ids cannot be reused
+    path = []
+    on_path = set()
+    stack = [iter((root,))]
+    while stack:
+        for node in stack[-1]:
+            if accept is not None and not accept(node):
+                continue
+            if visited is not None:
+                if id(node) in visited:
+                    continue
+                visited.add(id(node))
+            else:
+                if id(node) in on_path:
+                    raise ValueError('cyclic references detected')
+                path.append(node)
+                on_path.add(id(node))
+            yield node
+            stack.append(iter(get_children(node)))
+            break
+        else:
+            stack.pop()
+            if path:
+                on_path.discard(id(path.pop()))
+
 class EdgeType(tuple):
     """Represents all possible edge types. By default, there are four
     types: any edge can be part of the acyclic graph or not, and can
@@ -113,6 +167,9 @@ class DetailNode(object):
     implemented.
     """
 
+    # no instance dictionary needed: allows subclasses to use __slots__
+    __slots__ = ()
+
     def get_detail_child_nodes(self, edge_filter=EdgeFilter()):
         """Generator which yields all children of this item in the
         detail view (by default, all acyclic and active ones).
@@ -159,10 +216,9 @@ class DetailNode(object):
         """Iterate over self, all children, all grandchildren, and so
         on (only given edge type is followed). Do not override.
         """
-        yield self
-        for child in self.get_detail_child_nodes(edge_filter=edge_filter):
-            for branch in child.get_detail_iterator(edge_filter=edge_filter):
-                yield branch
+        return walk(
+            self, lambda node: node.get_detail_child_nodes(
+                edge_filter=edge_filter))
 
     def replace_global_node(self, oldnode, newnode, edge_filter=EdgeFilter()):
         """Replace a particular branch in the graph."""
@@ -199,11 +255,15 @@ class GlobalNode(DetailNode):
         """
         return repeat(EdgeType())
 
-    def get_global_iterator(self, edge_filter=EdgeFilter()):
+    def get_global_iterator(self, edge_filter=EdgeFilter(), unique=False):
         """Iterate over self, all children, all grandchildren, and so
         on (only given edge_filter is followed). Do not override.
+
+        :param unique: Whether to yield every node only once, even if
+            it can be reached along several paths.
+        :type unique: ``bool``
         """
-        yield self
-        for child in self.get_global_child_nodes(edge_filter=edge_filter):
-            for branch in child.get_global_iterator(edge_filter=edge_filter):
-                yield branch
+        return walk(
+            self, lambda node: node.get_global_child_nodes(
+                edge_filter=edge_filter),
+            unique=unique)
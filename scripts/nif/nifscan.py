@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+
+"""Summarize the headers of all NIF files in a folder, as JSON lines
+or CSV. This script is a wrapper around L{pyffi.formats.nif.scan}."""
+
+# --------------------------------------------------------------------------
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, NIF File Format Library and Tools.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+# --------------------------------------------------------------------------
+
+import argparse
+import sys
+
+import pyffi.formats.nif.scan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'top', nargs='+',
+        help="folder or file to scan")
+    parser.add_argument(
+        '-f', '--format', choices=('json', 'csv'), default='json',
+        help="output format [default: %(default)s]")
+    parser.add_argument(
+        '-o', '--output', metavar="FILE",
+        help="write to FILE rather than to standard output")
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help="read JOBS headers at once [default: number of processors]")
+    parser.add_argument(
+        '--threads', action='store_true',
+        help="use threads rather than processes")
+    args = parser.parse_args()
+    summaries = (
+        summary
+        for top in args.top
+        for summary in pyffi.formats.nif.scan.scan(
+            top, jobs=args.jobs, use_threads=args.threads))
+    write = (pyffi.formats.nif.scan.write_json if args.format == 'json'
+             else pyffi.formats.nif.scan.write_csv)
+    if args.output:
+        with open(args.output, 'w', newline='') as stream:
+            write(summaries, stream)
+    else:
+        write(summaries, sys.stdout)
+
+if __name__ == '__main__':
+    main()
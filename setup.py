@@ -59,6 +59,7 @@ PACKAGE_DATA = {'': ['*.xml', '*.xsd', '*.dll', '*.exe'],
                 'pyffi': ['VERSION'],
                 }
 SCRIPTS = ['scripts/nif/nifmakehsl.py',
+           'scripts/nif/nifscan.py',
            'scripts/nif/niftoaster.py',
            'scripts/cgf/cgftoaster.py',
            'scripts/kfm/kfmtoaster.py',
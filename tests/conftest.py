@@ -0,0 +1,8 @@
+"""Configuration of the test suite."""
+
+import os
+
+# do not write parsed xml files to the user cache directory when testing
+# (see pyffi.object_models.xml.cache); tests of the cache set their own
+# cache directory
+os.environ["PYFFI_CACHE_DIR"] = ""
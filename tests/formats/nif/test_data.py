@@ -0,0 +1,621 @@
+import io
+import os.path
+import pickle
+import unittest
+
+from nose.tools import assert_equals, assert_true
+
+from pyffi.formats.nif import NifFormat
+from pyffi.utils.graph import EdgeFilter, walk
+from tests.utils import test_root
+
+
+class TestBlockSizeCheck(unittest.TestCase):
+    """Regression tests for the block size check of NifFormat.Data.read"""
+
+    def setUp(self):
+        file_name = os.path.join(
+            test_root, 'spells', 'nif', 'files',
+            'test_check_tangentspace2.nif')
+        with open(file_name, 'rb') as stream:
+            self.raw = stream.read()
+
+    def read(self, raw, check_block_sizes=True):
+        data = NifFormat.Data()
+        data.check_block_sizes = check_block_sizes
+        data.read(io.BytesIO(raw))
+        return [block.get_hash(data) for block in data.blocks]
+
+    def test_no_check(self):
+        assert_equals(self.read(self.raw, check_block_sizes=False),
+                      self.read(self.raw))
+
+    def test_skip_extra_bytes(self):
+        # insert extra bytes at the end of the first block
+        data = NifFormat.Data()
+        stream = io.BytesIO(self.raw)
+        data.inspect_version_only(stream)
+        data.header.read(stream, data)
+        start = stream.tell()
+        end = start + data.header.block_size[0]
+        data.header.block_size[0] += 3
+        header = io.BytesIO()
+        data.header.write(header, data)
+        assert_equals(len(header.getvalue()), start)
+        raw = (header.getvalue() + self.raw[start:end] + b'\x00\x01\x02'
+               + self.raw[end:])
+        assert_equals(self.read(raw), self.read(self.raw))
+
+
+class TestLinks(unittest.TestCase):
+    """Tests for the resolution of block references after reading."""
+
+    def setUp(self):
+        self.file_name = os.path.join(
+            test_root, 'spells', 'nif', 'files',
+            'test_check_tangentspace2.nif')
+        self.data = NifFormat.Data()
+        with open(self.file_name, 'rb') as stream:
+            self.data.read(stream)
+
+    def test_link_list_cleared(self):
+        assert_equals(self.data._link_list, [])
+
+    def test_links_resolved(self):
+        blocks = set(self.data.blocks)
+        root = self.data.roots[0]
+        assert_equals(root, self.data.blocks[0])
+        assert_equals(root.children[0], self.data.blocks[1])
+        for block in self.data.blocks:
+            for link in block.get_links(self.data):
+                assert_true(link in blocks)
+        # the footer links
+        assert_equals(self.data.roots, [self.data.blocks[0]])
+
+    def test_fix_links(self):
+        # read the first block again, and resolve its links the old way
+        with open(self.file_name, 'rb') as stream:
+            self.data.inspect_version_only(stream)
+            self.data.header.read(stream, self.data)
+            block = NifFormat.NiNode()
+            block.read(stream, self.data)
+        assert_true(self.data._link_list)
+        block.fix_links(self.data)
+        assert_equals(self.data._link_list, [])
+        assert_true(block.children[0] is self.data.blocks[1])
+        assert_equals(block.get_hash(self.data),
+                      self.data.blocks[0].get_hash(self.data))
+
+
+class TestStringTable(unittest.TestCase):
+    """Tests for the string table which is built when writing."""
+
+    def setUp(self):
+        file_name = os.path.join(
+            test_root, 'spells', 'nif', 'files',
+            'test_check_tangentspace2.nif')
+        with open(file_name, 'rb') as stream:
+            self.raw = stream.read()
+        self.data = NifFormat.Data()
+        self.data.read(io.BytesIO(self.raw))
+
+    def write(self):
+        stream = io.BytesIO()
+        self.data.write(stream)
+        return stream.getvalue()
+
+    def test_unchanged(self):
+        # strings are written in the original order
+        assert_equals(self.write(), self.raw)
+
+    def test_block_sizes_from_bytes_written(self):
+        # block sizes do not depend on get_size
+        block_sizes = list(self.data.header.block_size)
+        self.data.blocks[0].get_size = lambda data=None: 0
+        assert_equals(self.write(), self.raw)
+        assert_equals(list(self.data.header.block_size), block_sizes)
+
+    def test_first_seen_order(self):
+        self.data.roots[0].name = b'NewRoot'
+        raw = self.write()
+        strings = list(self.data.header.strings)
+        assert_equals(strings[0], b'NewRoot')
+        assert_equals(len(set(strings)), len(strings))
+        assert_equals(self.write(), raw)
+        data = NifFormat.Data()
+        data.read(io.BytesIO(raw))
+        assert_equals(data.roots[0].name, b'NewRoot')
+
+    def test_duplicate_header_strings(self):
+        # same number of strings, but not the same set of strings
+        self.data.header.strings[1] = self.data.header.strings[0]
+        raw = self.write()
+        assert_equals(len(raw), len(self.raw))
+        data = NifFormat.Data()
+        data.read(io.BytesIO(raw))
+        assert_equals([block.get_hash(data) for block in data.blocks],
+                      [block.get_hash(self.data)
+                       for block in self.data.blocks])
+
+
+class TestBlockList(unittest.TestCase):
+    """Tests for the block list which is built when writing."""
+
+    def test_shared_blocks(self):
+        root = NifFormat.NiNode()
+        shape = NifFormat.NiTriShape()
+        shape.data = NifFormat.NiTriShapeData()
+        root.num_children = 3
+        root.children.update_size()
+        root.children[0] = shape
+        root.children[1] = NifFormat.NiNode()
+        root.children[2] = shape
+        data = NifFormat.Data()
+        data.roots = [root]
+        data.write(io.BytesIO())
+        assert_equals([block.__class__.__name__ for block in data.blocks],
+                      ['NiNode', 'NiTriShape', 'NiTriShapeData', 'NiNode'])
+        assert_equals(list(data.header.block_types),
+                      [b'NiNode', b'NiTriShape', b'NiTriShapeData'])
+        assert_equals(list(data.header.block_type_index), [0, 1, 2, 0])
+
+
+class TestCopyUnmodifiedBlocks(unittest.TestCase):
+    """Tests for writing unmodified blocks from their source bytes."""
+
+    def setUp(self):
+        file_name = os.path.join(
+            test_root, 'spells', 'nif', 'files',
+            'test_check_tangentspace2.nif')
+        with open(file_name, 'rb') as stream:
+            self.raw = stream.read()
+
+    def read(self, copy_unmodified_blocks=True):
+        data = NifFormat.Data()
+        data.copy_unmodified_blocks = copy_unmodified_blocks
+        data.read(io.BytesIO(self.raw))
+        return data
+
+    def write(self, data):
+        stream = io.BytesIO()
+        data.write(stream)
+        return stream.getvalue()
+
+    def test_not_kept_by_default(self):
+        data = self.read(copy_unmodified_blocks=False)
+        assert_true(all(block._source_bytes is None
+                         for block in data.blocks))
+
+    def test_unmodified(self):
+        data = self.read()
+        assert_true(all(block._source_bytes is not None
+                         for block in data.blocks))
+        assert_equals(self.write(data), self.raw)
+
+    def test_source_not_copied(self):
+        data = self.read()
+        # all blocks refer to the bytes of the file
+        sources = set(id(block._source_bytes.obj) for block in data.blocks)
+        assert_equals(len(sources), 1)
+        block = pickle.loads(pickle.dumps(data.blocks[-1]))
+        assert_equals(block._source_bytes, bytes(data.blocks[-1]._source_bytes))
+
+    def test_modified(self):
+        data = self.read()
+        root = data.roots[0]
+        shape = root.children[0]
+        # basic attributes can be read without marking the block
+        assert_equals(root.num_children, 1)
+        assert_true(shape._source_bytes is not None)
+        shape.flags = 12
+        shape.data.vertices[0].x = 1.5
+        assert_true(root._source_bytes is None)
+        assert_true(shape._source_bytes is None)
+        assert_true(shape.data._source_bytes is None)
+        other = self.read(copy_unmodified_blocks=False)
+        other.roots[0].children[0].flags = 12
+        other.roots[0].children[0].data.vertices[0].x = 1.5
+        assert_equals(self.write(data), self.write(other))
+
+    def test_replace_global_node(self):
+        data = self.read()
+        shape = data.roots[0].children[0]
+        shape_data = shape.data.__class__().deepcopy(shape.data)
+        assert_true(shape._source_bytes is not None)
+        data.replace_global_node(shape.data, shape_data)
+        assert_true(shape._source_bytes is None)
+        assert_true(shape.data is shape_data)
+        data.read(io.BytesIO(self.write(data)))
+        assert_equals(data.roots[0].children[0].data.get_hash(),
+                      shape_data.get_hash())
+
+
+class TestLazyBlocks(unittest.TestCase):
+    """Tests for reading blocks on first access."""
+
+    def setUp(self):
+        file_name = os.path.join(
+            test_root, 'spells', 'nif', 'files',
+            'test_check_tangentspace2.nif')
+        with open(file_name, 'rb') as stream:
+            self.raw = stream.read()
+
+    def read(self, lazy_blocks=True, copy_unmodified_blocks=False):
+        data = NifFormat.Data()
+        data.lazy_blocks = lazy_blocks
+        data.copy_unmodified_blocks = copy_unmodified_blocks
+        data.read(io.BytesIO(self.raw))
+        return data
+
+    def write(self, data):
+        stream = io.BytesIO()
+        data.write(stream)
+        return stream.getvalue()
+
+    def is_read(self, block):
+        return "_read_on_access" not in block.__dict__
+
+    def test_not_read(self):
+        data = self.read()
+        assert_equals(len(data.blocks), data.header.num_blocks)
+        assert_true(not any(self.is_read(block) for block in data.blocks))
+        assert_true(data.roots[0] is data.blocks[0])
+
+    def test_get_blocks(self):
+        data = self.read()
+        shape_data, = data.get_blocks(NifFormat.NiTriStripsData)
+        assert_true(not self.is_read(shape_data))
+        assert_equals(shape_data.num_vertices, 4)
+        assert_true(self.is_read(shape_data))
+        assert_equals(sum(self.is_read(block) for block in data.blocks), 1)
+
+    def test_same_as_read(self):
+        data = self.read()
+        other = self.read(lazy_blocks=False)
+        shape = data.roots[0].children[0]
+        # links refer to blocks which are read on first access
+        assert_true(shape is data.blocks[1])
+        assert_true(shape.data is data.blocks[5])
+        assert_equals([block.get_hash() for block in data.blocks],
+                      [block.get_hash() for block in other.blocks])
+        assert_equals(self.write(data), self.raw)
+
+    def test_copy_unmodified_blocks(self):
+        data = self.read(copy_unmodified_blocks=True)
+        data.roots[0].children[0].data.vertices[0].x = 1.5
+        other = self.read(lazy_blocks=False)
+        other.roots[0].children[0].data.vertices[0].x = 1.5
+        assert_equals(self.write(data), self.write(other))
+
+    def test_version_change(self):
+        # blocks are read with the version of the file
+        data = self.read()
+        data.version = 0x14000005
+        other = self.read(lazy_blocks=False)
+        other.version = 0x14000005
+        raw = self.write(data)
+        assert_equals(raw, self.write(other))
+        assert_equals(data.version, 0x14000005)
+        data = NifFormat.Data()
+        data.read(io.BytesIO(raw))
+        assert_equals(data.version, 0x14000005)
+        assert_equals([block.get_hash(data) for block in data.blocks],
+                      [block.get_hash(other) for block in other.blocks])
+
+
+class TestReadJobs(unittest.TestCase):
+    """Tests for reading blocks in several processes."""
+
+    def setUp(self):
+        self.file_name = os.path.join(
+            test_root, 'spells', 'nif', 'files',
+            'test_check_tangentspace2.nif')
+        with open(self.file_name, 'rb') as stream:
+            self.raw = stream.read()
+
+    def read(self, stream, read_jobs=2, copy_unmodified_blocks=False):
+        data = NifFormat.Data()
+        data.read_jobs = read_jobs
+        data.read_jobs_min_size = 0
+        data.copy_unmodified_blocks = copy_unmodified_blocks
+        data.read(stream)
+        return data
+
+    def write(self, data):
+        stream = io.BytesIO()
+        data.write(stream)
+        return stream.getvalue()
+
+    def test_same_as_read(self):
+        other = self.read(io.BytesIO(self.raw), read_jobs=1)
+        with open(self.file_name, 'rb') as stream:
+            data = self.read(stream)
+        assert_equals(len(data.blocks), data.header.num_blocks)
+        shape = data.roots[0].children[0]
+        assert_true(shape is data.blocks[1])
+        assert_true(shape.data is data.blocks[5])
+        assert_equals([block.get_hash() for block in data.blocks],
+                      [block.get_hash() for block in other.blocks])
+        assert_equals(self.write(data), self.raw)
+
+    def test_stream(self):
+        data = self.read(io.BytesIO(self.raw), copy_unmodified_blocks=True)
+        assert_true(all(block._source_bytes for block in data.blocks))
+        assert_equals(self.write(data), self.raw)
+
+
+class TestReplaceGlobalNode(unittest.TestCase):
+    """Tests for replacing blocks through the reverse reference index."""
+
+    def setUp(self):
+        self.data = NifFormat.Data()
+        self.root = NifFormat.NiNode()
+        self.shape = NifFormat.NiTriShape()
+        self.shape.data = NifFormat.NiTriShapeData()
+        self.root.add_child(self.shape)
+        self.data.roots = [self.root]
+
+    def test_index_kept(self):
+        self.data.replace_global_node(self.shape.data, None)
+        ref_index = self.data._ref_index
+        # new blocks linked through indexed references are indexed too
+        new_data = NifFormat.NiTriShapeData()
+        self.shape.data = new_data
+        other_data = NifFormat.NiTriShapeData()
+        self.data.replace_global_node(new_data, other_data)
+        assert_true(self.shape.data is other_data)
+        assert_true(self.data._ref_index is ref_index)
+        assert_true(ref_index.valid)
+
+    def test_new_references(self):
+        self.data.replace_global_node(NifFormat.NiNode(), None)
+        ref_index = self.data._ref_index
+        # the references of a resized array are added to the index
+        other_shape = NifFormat.NiTriShape()
+        other_shape.data = self.shape.data
+        self.root.add_child(other_shape)
+        other_data = NifFormat.NiTriShapeData()
+        self.data.replace_global_node(self.shape.data, other_data)
+        assert_true(self.shape.data is other_data)
+        assert_true(other_shape.data is other_data)
+        assert_true(self.data._ref_index is ref_index)
+        assert_true(ref_index.valid)
+
+    def test_detached(self):
+        self.data.replace_global_node(NifFormat.NiNode(), None)
+        shape_data = self.shape.data
+        # the shape leaves the tree, and so its references do too
+        self.root.remove_child(self.shape)
+        self.data.replace_global_node(shape_data, None)
+        assert_true(self.shape.data is shape_data)
+        # as it does if the reference to it is set
+        self.root.add_child(self.shape)
+        self.data.replace_global_node(NifFormat.NiNode(), None)
+        self.root.children[0] = NifFormat.NiNode()
+        self.data.replace_global_node(shape_data, None)
+        assert_true(self.shape.data is shape_data)
+
+    def test_edge_filter(self):
+        self.data.replace_global_node(
+            self.shape.data, None, edge_filter=EdgeFilter(None, None))
+        assert_equals(self.shape.data, None)
+        assert_equals(self.data._ref_index, None)
+
+    def test_other_data(self):
+        self.data.replace_global_node(NifFormat.NiNode(), None)
+        ref_index = self.data._ref_index
+        other_data = NifFormat.Data()
+        other_root = NifFormat.NiNode()
+        other_data.roots = [other_root]
+        other_data.replace_global_node(NifFormat.NiNode(), None)
+        # setting references in the tree of the other data only
+        # updates the index of the other data
+        other_root.add_child(NifFormat.NiNode())
+        assert_equals(len(other_data._ref_index._counts), 2)
+        assert_equals(len(ref_index._counts), 3)
+        # a block which is added to the tree of both data is only
+        # indexed by the last one
+        other_root.add_child(self.shape)
+        assert_equals(self.data._ref_index, None)
+        self.data.replace_global_node(self.shape.data, None)
+        assert_equals(self.shape.data, None)
+        assert_equals(other_data._ref_index, None)
+
+    def test_pickle(self):
+        self.data.replace_global_node(NifFormat.NiNode(), None)
+        shape = pickle.loads(pickle.dumps(self.shape))
+        assert_equals(shape._data_value_._link_observer, None)
+        assert_equals(shape.data.__class__, NifFormat.NiTriShapeData)
+
+    def test_new_roots(self):
+        self.data.replace_global_node(NifFormat.NiNode(), None)
+        other_shape = NifFormat.NiTriShape()
+        other_shape.data = self.shape.data
+        self.data.roots.append(other_shape)
+        self.data.replace_global_node(self.shape.data, None)
+        assert_equals(other_shape.data, None)
+
+    def test_modified(self):
+        self.data.replace_global_node(NifFormat.NiNode(), None)
+        self.shape._source_bytes = b"shape"
+        self.root._source_bytes = b"root"
+        self.data.replace_global_node(self.shape.data, None)
+        assert_equals(self.shape._source_bytes, None)
+        assert_equals(self.root._source_bytes, b"root")
+
+
+def walk_chain(block, other):
+    """The chain of blocks from C{block} to C{other}, found by walking
+    the tree of C{block}."""
+    if block is other:
+        return [block]
+    for child in block.get_refs():
+        chain = walk_chain(child, other)
+        if chain:
+            return [block] + chain
+    return []
+
+
+class TestBlockIndex(unittest.TestCase):
+    """Tests for finding blocks through the block index."""
+
+    def setUp(self):
+        self.data = NifFormat.Data()
+        self.root = NifFormat.NiNode()
+        self.root.name = "Scene Root"
+        self.node = NifFormat.NiNode()
+        self.node.name = "Bip01"
+        self.shape = NifFormat.NiTriShape()
+        self.shape.name = "Shape"
+        self.root.add_child(self.node)
+        self.root.add_child(self.shape)
+        # the shape has two parents
+        self.node.add_child(self.shape)
+        self.data.roots = [self.root]
+
+    def test_find(self):
+        assert_true(self.data.find(block_name=b"Shape") is self.shape)
+        assert_true(
+            self.data.find(block_name=b"Bip01", block_type=NifFormat.NiNode)
+            is self.node)
+        assert_equals(self.data.find(block_name=b"Bip01",
+                                     block_type=NifFormat.NiTriShape), None)
+        assert_equals(self.data.find_all(block_type=NifFormat.NiAVObject),
+                      [self.root, self.node, self.shape])
+        assert_equals(self.data.get_parents(self.shape),
+                      [self.root, self.node])
+
+    def test_tree(self):
+        self.data.find()
+        assert_equals(list(self.root.tree(unique=True)),
+                      [self.root, self.node, self.shape])
+        assert_equals(list(self.node.tree(unique=True)),
+                      [self.node, self.shape])
+        # the tree of the node contains a block found earlier
+        self.root.children[0] = self.shape
+        self.root.children[1] = self.node
+        self.data.find()
+        assert_equals(list(self.node.tree(unique=True)),
+                      [self.node, self.shape])
+        assert_equals(self.node.find_chain(self.shape),
+                      [self.node, self.shape])
+        assert_true(self.node.find(block_type=NifFormat.NiTriShape)
+                    is self.shape)
+
+    def test_invalidate(self):
+        block_index = self.data._get_block_index()
+        self.shape.name = "Other Shape"
+        assert_true(block_index.valid)
+        assert_true(self.data.find(block_name=b"Other Shape") is self.shape)
+        assert_equals(self.data.find(block_name=b"Shape"), None)
+        other_shape = NifFormat.NiTriShape()
+        self.node.children[0] = other_shape
+        assert_true(not block_index.valid)
+        assert_equals(self.node.find_chain(other_shape),
+                      [self.node, other_shape])
+        assert_equals(self.data.get_parents(self.shape), [self.root])
+
+    def test_remove_child(self):
+        assert_true(self.data.find(block_name=b"Bip01") is self.node)
+        self.root.remove_child(self.node)
+        assert_equals(self.data.find(block_name=b"Bip01"), None)
+        assert_equals(self.data.find_all(block_type=NifFormat.NiAVObject),
+                      [self.root, self.shape])
+        assert_equals(self.data.get_parents(self.shape), [self.root])
+
+    def test_set_children(self):
+        assert_true(self.data.find(block_name=b"Shape") is self.shape)
+        self.root.set_children([])
+        assert_equals(self.data.find(block_name=b"Shape"), None)
+        assert_equals(self.data.find_all(), [self.root])
+        self.root.set_children([self.shape])
+        assert_equals(self.data.find_all(), [self.root, self.shape])
+
+    def check_walk(self):
+        """Check that the blocks in the tree find what a walk of their
+        tree finds, while the index is valid."""
+        self.data.find()
+        get_refs = lambda block: block.get_refs()
+        for block in walk(self.root, get_refs, unique=True):
+            blocks = list(walk(block, get_refs, unique=True))
+            assert_equals(list(block.tree(unique=True)), blocks)
+            assert_equals(
+                list(block.tree(block_type=NifFormat.NiTriShape,
+                                unique=True)),
+                [other for other in blocks
+                 if isinstance(other, NifFormat.NiTriShape)])
+            for name in (b"Bip01", b"Shape", b"Other"):
+                assert_true(block.find(block_name=name) is next(
+                    (other for other in blocks if other.name == name), None))
+            for other in blocks + [self.root]:
+                assert_equals(block.find_chain(other),
+                              walk_chain(block, other))
+        assert_true(self.data._block_index.valid)
+
+    def test_walk(self):
+        self.check_walk()
+        self.shape.name = "Bip01"
+        self.check_walk()
+        other = NifFormat.NiNode()
+        other.name = "Other"
+        other.add_child(self.shape)
+        self.node.add_child(other)
+        self.check_walk()
+        self.root.remove_child(self.shape)
+        self.check_walk()
+        self.root.children[0] = other
+        self.check_walk()
+        other.set_children([])
+        self.check_walk()
+
+    def test_index_used(self):
+        self.data.find()
+        # the tree is not walked
+        self.node.get_refs = self.root.get_refs = None
+        assert_true(self.root.find(block_name=b"Shape") is self.shape)
+        assert_true(self.node.find(block_type=NifFormat.NiTriShape)
+                    is self.shape)
+        assert_equals(self.root.find_chain(self.shape),
+                      [self.root, self.node, self.shape])
+        assert_equals(list(self.root.tree(unique=True)),
+                      [self.root, self.node, self.shape])
+
+    def test_other_data(self):
+        block_index = self.data._get_block_index()
+        assert_true(self.data.find(block_name=b"Shape") is self.shape)
+        other_data = NifFormat.Data()
+        other_root = NifFormat.NiNode()
+        other_data.roots = [other_root]
+        other_data.find()
+        # changes to the tree of the other data leave the index alone
+        other_root.add_child(NifFormat.NiNode())
+        other_root.name = "Other"
+        assert_true(block_index.valid)
+        assert_true(block_index._name_positions is not None)
+        assert_true(other_data.find(block_name=b"Other") is other_root)
+
+
+class TestTree(unittest.TestCase):
+    """Tests for walking the tree of a block."""
+
+    def setUp(self):
+        self.root = NifFormat.NiNode()
+        node = self.root
+        for i in range(5000):
+            child = NifFormat.NiNode()
+            node.add_child(child)
+            node = child
+        self.leaf = node
+
+    def test_deep(self):
+        assert_equals(len(list(self.root.tree())), 5001)
+        assert_equals(len(list(self.root.tree(unique=True))), 5001)
+        assert_equals(
+            list(self.root.tree(block_type=NifFormat.NiTriShape)), [])
+
+    def test_cycle(self):
+        self.root._validateTree()
+        self.leaf.add_child(self.root)
+        self.assertRaises(ValueError, self.root._validateTree)
+        self.assertRaises(ValueError, list, self.root.tree())
+        assert_equals(len(list(self.root.tree(unique=True))), 5001)
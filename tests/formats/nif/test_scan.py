@@ -0,0 +1,81 @@
+import io
+import json
+import os
+import threading
+
+from nose.tools import assert_equals, assert_true
+
+import pyffi.formats.nif.scan
+from tests.utils import BaseFileTestCase
+
+
+class TestScan(BaseFileTestCase):
+    """Tests for the nif header scanner."""
+
+    FORMAT = "nif"
+
+    def setUp(self):
+        super(TestScan, self).setUp()
+        self.top = self.input_files
+
+    def test_summarize(self):
+        summary = pyffi.formats.nif.scan.summarize(
+            os.path.join(self.top, "nds.nif"))
+        assert_equals(summary["version"], 0x14020008)
+        assert_equals(summary["num_blocks"], 3)
+        assert_equals(summary["block_sizes"],
+                      {"NiNode": 86, "NiTriShape": 91, "NiTriShapeData": 212})
+        assert_equals(summary["error"], None)
+
+    def test_summarize_error(self):
+        filename = os.path.join(self.out, "invalid.nif")
+        with open(filename, "wb") as stream:
+            stream.write(b"not a nif file")
+        summary = pyffi.formats.nif.scan.summarize(filename)
+        assert_equals(summary["file_size"], 14)
+        assert_equals(summary["version"], None)
+        assert_true(summary["error"].startswith("ValueError"))
+
+    def test_scan_jobs(self):
+        serial = list(pyffi.formats.nif.scan.scan(self.top, jobs=1))
+        assert_true(len(serial) > 10)
+        assert_equals(
+            list(pyffi.formats.nif.scan.scan(self.top, jobs=2, chunksize=3)),
+            serial)
+        assert_equals(
+            list(pyffi.formats.nif.scan.scan(self.top, jobs=2,
+                                             use_threads=True)),
+            serial)
+
+    def test_scan_slow_file(self):
+        # other files are summarized while the first file is slow
+        serial = list(pyffi.formats.nif.scan.scan(self.top, jobs=1))
+        summarize = pyffi.formats.nif.scan.summarize
+        others_done = threading.Semaphore(0)
+        first_done = threading.Event()
+
+        def slow_summarize(filename):
+            if filename == serial[0]["file"]:
+                if all(others_done.acquire(timeout=10)
+                       for i in range(len(serial) - 1)):
+                    first_done.set()
+            else:
+                others_done.release()
+            return summarize(filename)
+
+        pyffi.formats.nif.scan.summarize = slow_summarize
+        try:
+            summaries = list(pyffi.formats.nif.scan.scan(
+                self.top, jobs=2, use_threads=True, chunksize=1))
+        finally:
+            pyffi.formats.nif.scan.summarize = summarize
+        assert_true(first_done.is_set())
+        assert_equals(summaries, serial)
+
+    def test_write_json(self):
+        summaries = list(pyffi.formats.nif.scan.scan(self.top, jobs=1))
+        stream = io.StringIO()
+        pyffi.formats.nif.scan.write_json(summaries, stream)
+        assert_equals(
+            [json.loads(line) for line in stream.getvalue().splitlines()],
+            summaries)
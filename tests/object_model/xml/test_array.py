@@ -0,0 +1,248 @@
+import io
+import re
+import struct
+import unittest
+
+from nose.tools import assert_equals, assert_true, raises
+
+from pyffi.object_models import FileFormat
+from pyffi.object_models.common import Bool, Float, UInt, UShort, Short
+from pyffi.object_models.xml.array import (
+    _get_packed_format, _get_static_size)
+from pyffi.object_models.xml.struct_ import StructBase
+from pyffi.object_models.xml import StructAttribute as Attr
+
+
+class SimpleFormat(object):
+    Bool = Bool
+    Float = Float
+    UInt = UInt
+    UShort = UShort
+    Short = Short
+
+    @staticmethod
+    def name_attribute(name):
+        return name
+
+
+class X(StructBase):
+    _is_template = False
+    _attrs = [
+        Attr(SimpleFormat, dict(name='num', type='UInt')),
+        Attr(SimpleFormat, dict(name='floats', type='Float', arr1='num')),
+        Attr(SimpleFormat, dict(name='shorts', type='Short', arr1='num')),
+        Attr(SimpleFormat, dict(name='bools', type='Bool', arr1='num')),
+        Attr(SimpleFormat, dict(name='lengths', type='UShort', arr1='num')),
+        Attr(SimpleFormat, dict(name='rows', type='UShort', arr1='num',
+                                arr2='lengths')),
+        ]
+
+
+class V(StructBase):
+    _is_template = False
+    _attrs = [
+        Attr(SimpleFormat, dict(name='x', type='Float')),
+        Attr(SimpleFormat, dict(name='i', type='Short')),
+        ]
+
+SimpleFormat.V = V
+
+
+class W(StructBase):
+    _is_template = False
+    _attrs = [
+        Attr(SimpleFormat, dict(name='num', type='UInt')),
+        Attr(SimpleFormat, dict(name='vs', type='V', arr1='num')),
+        Attr(SimpleFormat, dict(name='rows', type='V', arr1='num',
+                                arr2='num')),
+        ]
+
+
+class Data(FileFormat.Data):
+    def __init__(self, use_packed_arrays, byte_order='<'):
+        self.use_packed_arrays = use_packed_arrays
+        self._byte_order = byte_order
+
+
+class TestPackedArray(unittest.TestCase):
+
+    def setUp(self):
+        x = X()
+        x.num = 3
+        for arr in (x.floats, x.shorts, x.bools, x.lengths, x.rows):
+            arr.update_size()
+        for i, value in enumerate((0.5, -1.25, 1e10)):
+            x.floats[i] = value
+        for i, value in enumerate((-3, 0, 7)):
+            x.shorts[i] = value
+        x.bools[1] = True
+        for i in range(3):
+            x.lengths[i] = i
+        x.rows.update_size()
+        x.rows[2][1] = 65535
+        self.x = x
+
+    def read(self, use_packed_arrays, byte_order='<'):
+        stream = io.BytesIO()
+        self.x.write(stream, Data(False, byte_order))
+        y = X()
+        stream.seek(0)
+        y.read(stream, Data(use_packed_arrays, byte_order))
+        assert_equals(stream.tell(), len(stream.getvalue()))
+        return y
+
+    def write(self, y, byte_order='<'):
+        stream = io.BytesIO()
+        y.write(stream, Data(False, byte_order))
+        return stream.getvalue()
+
+    def test_packed_format(self):
+        assert_equals(_get_packed_format(Float), ('f', 'f', 4))
+        assert_equals(_get_packed_format(UShort)[0], 'H')
+        # get_value is overridden
+        assert_equals(_get_packed_format(Bool), None)
+
+    def test_read_write(self):
+        for byte_order in ('<', '>'):
+            x = self.read(False, byte_order)
+            y = self.read(True, byte_order)
+            assert_true(y.floats._values is not None)
+            assert_true(y.bools._values is None)
+            assert_true(y.rows._values is None)
+            assert_true(list.__getitem__(y.rows, 2)._values is not None)
+            assert_equals(self.write(x, byte_order),
+                          self.write(y, byte_order))
+            assert_equals(x.get_hash(), y.get_hash())
+            assert_equals(x.get_size(), y.get_size())
+            assert_equals(re.sub('0x[0-9A-F]+', '', str(x)),
+                          re.sub('0x[0-9A-F]+', '', str(y)))
+
+    def test_get_set_value(self):
+        y = self.read(True)
+        assert_equals(list(y.floats), [0.5, -1.25, 1e10])
+        assert_equals(y.shorts[0], -3)
+        assert_equals(y.rows[2][1], 65535)
+        assert_true(7 in y.shorts)
+        y.shorts[1] = "0x10"
+        assert_equals(y.shorts[1], 16)
+        y.floats[1] = 2.5
+        assert_true(y.floats._values is not None)
+        # not a single precision float: kept exactly, unpacked
+        y.floats[0] = 0.1
+        assert_equals(y.floats[0], 0.1)
+        assert_true(y.floats._values is None)
+        assert_equals(list(y.floats), [0.1, 2.5, 1e10])
+
+    def test_list_methods(self):
+        y = self.read(True)
+        elem = Short()
+        elem.set_value(5)
+        y.shorts.append(elem)
+        assert_true(y.shorts._values is None)
+        assert_equals(len(y.shorts), 4)
+        assert_equals(list(y.shorts), [-3, 0, 7, 5])
+        y.floats.pop()
+        assert_equals(list(y.floats), [0.5, -1.25])
+        y.lengths.reverse()
+        assert_equals(list(y.lengths), [2, 1, 0])
+
+    @raises(ValueError)
+    def test_set_value_range(self):
+        y = self.read(True)
+        y.shorts[0] = 0x8000
+
+    def test_update_size(self):
+        y = self.read(True)
+        y.num = 4
+        y.lengths.update_size()
+        y.lengths[3] = 3
+        y.rows.update_size()
+        assert_equals(len(y.lengths), 4)
+        assert_equals(list(y.rows[2]), [0, 65535])
+        assert_equals(list(y.rows[3]), [0, 0, 0])
+        y.num = 1
+        y.shorts.update_size()
+        assert_equals(list(y.shorts), [-3])
+
+    def test_unpack(self):
+        y = self.read(True)
+        data = self.write(y)
+        elems = list(y.floats.get_detail_child_nodes())
+        assert_true(all(isinstance(elem, Float) for elem in elems))
+        assert_true(y.floats._values is None)
+        assert_equals(list(y.floats), [0.5, -1.25, 1e10])
+        assert_equals(self.write(y), data)
+
+    def test_float_overflow(self):
+        y = self.read(True)
+        y.floats[2] = 1e300
+        x = self.read(False)
+        x.floats[2] = 1e300
+        assert_equals(self.write(x), self.write(y))
+        assert_equals(self.write(y)[12:16], struct.pack('<I', 0x7fc00000))
+
+
+class TestPodArray(unittest.TestCase):
+
+    def setUp(self):
+        w = W()
+        w.num = 2
+        w.vs.update_size()
+        w.rows.update_size()
+        w.vs[0].x = 0.5
+        w.vs[1].i = -2
+        w.rows[1][0].x = 3.25
+        self.w = w
+
+    def write(self, w, byte_order='<'):
+        stream = io.BytesIO()
+        w.write(stream, Data(False, byte_order))
+        return stream.getvalue()
+
+    def test_pod_layout(self):
+        assert_equals(V._pod_format, 'fh')
+        assert_equals(V._pod_names, ('_x_value_', '_i_value_'))
+        # has arrays
+        assert_equals(W._pod_format, None)
+
+    def test_read_write(self):
+        for byte_order in ('<', '>'):
+            expected = b''.join(
+                struct.pack(byte_order + 'fh', x, i)
+                for x, i in ((0.5, 0), (0, -2),
+                             (0, 0), (0, 0), (3.25, 0), (0, 0)))
+            data = self.write(self.w, byte_order)
+            assert_equals(data[4:], expected)
+            w = W()
+            w.read(io.BytesIO(data), Data(False, byte_order))
+            assert_equals(w.vs[1].i, -2)
+            assert_equals(w.rows[1][0].x, 3.25)
+            assert_equals(self.write(w, byte_order), data)
+
+    def test_float_overflow(self):
+        self.w.vs[0].x = 1e300
+        data = self.write(self.w)
+        assert_equals(data[4:8], struct.pack('<I', 0x7fc00000))
+
+
+class TestStaticSize(unittest.TestCase):
+
+    def test_static_size(self):
+        assert_equals(_get_static_size(UShort, None), 2)
+        assert_equals(_get_static_size(V, None), 6)
+        assert_equals(_get_static_size(W, None), None)
+
+    def test_get_size_override(self):
+        class Z(UShort):
+            def get_size(self, data=None):
+                return 3
+        assert_equals(_get_static_size(Z, None), None)
+
+    def test_get_size(self):
+        w = W()
+        w.num = 3
+        w.vs.update_size()
+        w.rows.update_size()
+        assert_equals(w.vs.get_size(), 18)
+        assert_equals(w.rows.get_size(), 54)
+        assert_equals(w.get_size(), 4 + 18 + 54)
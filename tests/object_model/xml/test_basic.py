@@ -0,0 +1,94 @@
+import copy
+import io
+import pickle
+import unittest
+
+from nose.tools import assert_equals, assert_false, assert_true, raises
+
+from pyffi.object_models.common import (
+    Bool, Float, Int, SizedString, UInt, ULittle32, UShort)
+from pyffi.object_models.xml.basic import BasicBase
+
+
+class TestSlots(unittest.TestCase):
+
+    def test_no_dict(self):
+        for cls in (Int, UInt, Bool, Float, SizedString):
+            assert_false(hasattr(cls(), '__dict__'))
+
+    @raises(AttributeError)
+    def test_no_new_attributes(self):
+        UInt().foo = 1
+
+    def test_arg(self):
+        x = UInt()
+        assert_equals(x.arg, None)
+        x.arg = 5
+        assert_equals(x.arg, 5)
+
+    def test_editor(self):
+        x = Bool()
+        x.set_editor_value(1)
+        assert_true(x.get_value())
+        assert_equals(x.get_editor_keys(), ("False", "True"))
+        y = Float()
+        y.set_editor_value(0.5)
+        assert_equals(y.get_editor_value(), 0.5)
+
+    def test_copy_pickle(self):
+        x = UInt()
+        x.set_value(7)
+        x.arg = 3
+        for y in (copy.deepcopy(x), pickle.loads(pickle.dumps(x))):
+            assert_equals(y.get_value(), 7)
+            assert_equals(y.arg, 3)
+
+    def test_subclass_without_slots(self):
+        class X(BasicBase):
+            def __init__(self, **kwargs):
+                BasicBase.__init__(self, **kwargs)
+                self.extra = 1
+        x = X()
+        assert_equals(x.extra, 1)
+        assert_equals(x.arg, None)
+
+
+class Data(object):
+    def __init__(self, byte_order):
+        self._byte_order = byte_order
+
+
+class TestByteOrder(unittest.TestCase):
+
+    def write(self, x, byte_order):
+        stream = io.BytesIO()
+        x.write(stream, Data(byte_order))
+        return stream.getvalue()
+
+    def test_read_write(self):
+        for cls, value, raw in ((UShort, 1, b'\x00\x01'),
+                                (Int, -2, b'\xff\xff\xff\xfe'),
+                                (Float, 0.5, b'\x3f\x00\x00\x00'),
+                                (SizedString, b'ab', b'\x00\x00\x00\x02ab')):
+            x = cls()
+            x.set_value(value)
+            assert_equals(self.write(x, '>'), raw)
+            y = cls()
+            y.read(io.BytesIO(raw), Data('>'))
+            assert_equals(y.get_value(), value)
+            z = cls()
+            z.read(io.BytesIO(self.write(x, '<')), Data('<'))
+            assert_equals(z.get_value(), value)
+
+    def test_little_endian(self):
+        x = ULittle32()
+        x.set_value(1)
+        assert_equals(self.write(x, '>'), b'\x01\x00\x00\x00')
+
+    def test_subclass_struct(self):
+        class X(Int):
+            _struct = 'h'
+            _size = 2
+        x = X()
+        x.set_value(-1)
+        assert_equals(self.write(x, '<'), b'\xff\xff')
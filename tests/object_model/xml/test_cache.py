@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import assert_equals, assert_false, assert_true
+
+import pyffi.object_models.common
+import pyffi.object_models.xml
+import pyffi.object_models.xml.cache
+
+
+XML = """<?xml version="1.0" ?>
+<fileformat>
+    <version num="1.2">Some Game</version>
+    <basic name="uint" />
+    <enum name="Color" numbytes="1">
+        A color.
+        <option value="0" name="Red" />
+        <option value="1" name="Green" />
+    </enum>
+    <bitstruct name="Flags" numbytes="2">
+        <bits name="Hidden" numbits="1" />
+        <bits name="Mode" numbits="3" default="2" />
+    </bitstruct>
+    <struct name="Point">
+        <add name="Next" type="Link" cond="Num Links &gt; 0" />
+        <add name="Num Links" type="uint" ver1="1.2" />
+        <add name="Color" type="Color" default="1" />
+        <add name="Flags" type="Flags" />
+    </struct>
+    <struct name="Link">
+        <add name="Points" type="Point" arr1="2" />
+    </struct>
+    <alias name="Count" type="uint" />
+</fileformat>
+"""
+
+
+def describe(fmt):
+    """Everything generated from the xml, as plain values."""
+    result = [sorted(fmt.versions.items()), sorted(fmt.games.items())]
+    for classes in (fmt.xml_enum, fmt.xml_alias, fmt.xml_bit_struct,
+                    fmt.xml_struct):
+        for cls in classes:
+            result.append((cls.__name__, cls.__doc__,
+                           [base.__name__ for base in cls.__mro__],
+                           getattr(cls, "_enumvalues", None),
+                           getattr(cls, "_numbytes", None)))
+            for attr in getattr(cls, "_attrs", []):
+                result.append(sorted(
+                    (name, value.__name__ if isinstance(value, type)
+                     else str(value))
+                    for name, value in vars(attr).items()))
+    return result
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.xml_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.xml_dir, "cache")
+        with open(os.path.join(self.xml_dir, "simple.xml"), "w") as stream:
+            stream.write(XML)
+        self.old_cache_dir = os.environ.get("PYFFI_CACHE_DIR")
+        os.environ["PYFFI_CACHE_DIR"] = self.cache_dir
+
+    def tearDown(self):
+        if self.old_cache_dir is None:
+            del os.environ["PYFFI_CACHE_DIR"]
+        else:
+            os.environ["PYFFI_CACHE_DIR"] = self.old_cache_dir
+        shutil.rmtree(self.xml_dir)
+
+    def create_format(self):
+        class SimpleFormat(pyffi.object_models.xml.FileFormat):
+            xml_file_name = "simple.xml"
+            xml_file_path = [self.xml_dir]
+            uint = pyffi.object_models.common.UInt
+
+            class Point:
+                # points link to points
+                use_lazy_attributes = True
+        return SimpleFormat
+
+    def test_cache(self):
+        fmt1 = self.create_format()
+        assert_equals(len(os.listdir(self.cache_dir)), 1)
+        fmt2 = self.create_format()
+        assert_equals(describe(fmt1), describe(fmt2))
+        # forward declarations and conditions are resolved
+        assert_true(fmt2.Point._attrs[0].type_ is fmt2.Link)
+        point = fmt2.Point()
+        assert_equals(point.color, 1)
+        assert_equals(point.flags.mode, 2)
+        assert_true(issubclass(fmt2.Count, fmt2.uint))
+
+    def test_disabled(self):
+        os.environ["PYFFI_CACHE_DIR"] = ""
+        self.create_format()
+        assert_false(os.path.exists(self.cache_dir))
+
+    def test_corrupt(self):
+        fmt1 = self.create_format()
+        file_name, = os.listdir(self.cache_dir)
+        with open(os.path.join(self.cache_dir, file_name), "wb") as stream:
+            stream.write(b"garbage")
+        fmt2 = self.create_format()
+        assert_equals(describe(fmt1), describe(fmt2))
+
+    def test_key(self):
+        key = pyffi.object_models.xml.cache.get_key("SimpleFormat", XML)
+        assert_equals(
+            key, pyffi.object_models.xml.cache.get_key("SimpleFormat", XML))
+        assert_true(
+            key != pyffi.object_models.xml.cache.get_key("SimpleFormat",
+                                                         XML + " "))
+        assert_true(
+            key != pyffi.object_models.xml.cache.get_key("OtherFormat", XML))
+
+    def test_key_source(self):
+        # the key depends on the source of the parser
+        key = pyffi.object_models.xml.cache.get_key("SimpleFormat", XML)
+        source_digest = pyffi.object_models.xml.cache._source_digest
+        assert_true(source_digest)
+        try:
+            pyffi.object_models.xml.cache._source_digest = "0" * 40
+            assert_true(
+                key != pyffi.object_models.xml.cache.get_key(
+                    "SimpleFormat", XML))
+        finally:
+            pyffi.object_models.xml.cache._source_digest = source_digest
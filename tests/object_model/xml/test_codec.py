@@ -0,0 +1,89 @@
+import io
+import unittest
+
+from nose.tools import assert_equals, assert_true
+
+from pyffi.object_models import FileFormat
+from pyffi.object_models.common import UInt, UShort
+from pyffi.object_models.xml.struct_ import StructBase
+from pyffi.object_models.xml.codec import Codec, get_codec
+from pyffi.object_models.xml import StructAttribute as Attr
+
+
+class SimpleFormat(object):
+    UInt = UInt
+    UShort = UShort
+
+    @staticmethod
+    def name_attribute(name):
+        return name
+
+    @staticmethod
+    def version_number(version_str):
+        return int(version_str)
+
+
+class X(StructBase):
+    _is_template = False
+    _attrs = [
+        Attr(SimpleFormat, dict(name='a', type='UInt')),
+        Attr(SimpleFormat, dict(name='b', type='UInt', ver1='2')),
+        Attr(SimpleFormat, dict(name='c', type='UShort', ver2='1')),
+        Attr(SimpleFormat, dict(name='d', type='UInt', cond='a == 1')),
+        Attr(SimpleFormat, dict(name='d', type='UInt', cond='a == 2')),
+        Attr(SimpleFormat, dict(name='e', type='UInt', userver='5')),
+        Attr(SimpleFormat, dict(name='d', type='UInt')),
+        Attr(SimpleFormat, dict(name='f', type='UInt', vercond='version == 2')),
+        ]
+
+class Data(FileFormat.Data):
+    def __init__(self, version, user_version, use_codecs):
+        self.version = version
+        self.user_version = user_version
+        self.use_codecs = use_codecs
+
+
+class TestCodec(unittest.TestCase):
+
+    def check_write_read(self, version, user_version, a):
+        x = X()
+        x.a = a
+        x.b = 7
+        x.c = 8
+        x.d = 9
+        x.e = 10
+        x.f = 11
+        streams = []
+        for use_codecs in (False, True):
+            stream = io.BytesIO()
+            x.write(stream, Data(version, user_version, use_codecs))
+            streams.append(stream.getvalue())
+        assert_equals(streams[0], streams[1])
+        for use_codecs in (False, True):
+            y = X()
+            data = Data(version, user_version, use_codecs)
+            stream = io.BytesIO(streams[0])
+            y.read(stream, data)
+            assert_equals(stream.tell(), len(streams[0]))
+            assert_equals(y.get_hash(data), x.get_hash(data))
+
+    def test_write_read(self):
+        for version in (1, 2, 3):
+            for user_version in (0, 5):
+                for a in (0, 1, 2):
+                    self.check_write_read(version, user_version, a)
+
+    def test_duplicates(self):
+        source = Codec(X, (1, 0, None)).write_source
+        # last d is unconditional, but only if neither of the others was
+        assert_true("if not seen_0:" in source)
+        # no e, no f
+        assert_true("_e_value_" not in source)
+        assert_true("_f_value_" not in source)
+
+    def test_cache(self):
+        data = Data(2, 0, True)
+        codec = get_codec(X, data)
+        assert_true(get_codec(X, data) is codec)
+        data.version = 3
+        assert_true(get_codec(X, data) is not codec)
@@ -1,3 +1,4 @@
+import pickle
 import unittest
 
 from pyffi.object_models.xml.expression import Expression
@@ -54,6 +55,39 @@ class TestExpression(unittest.TestCase):
         self.a.x = B()
         assert_equals(Expression('x * 10').eval(self.a), 70)
 
+    def test_dotted_names(self):
+        self.a.b = A()
+        self.a.b.x = 5
+        assert_equals(Expression('b.x').eval(self.a), 5)
+        assert_true(Expression('b.x == 5').eval(self.a))
+
+    def test_compile(self):
+        e = Expression('(x + 1) * 2')
+        func = e.compile()
+        self.a.x = 3
+        assert_equals(func(self.a), 8)
+        assert_true(e.compile() is func)
+        assert_true(e.eval is func)
+        assert_equals(e.eval(self.a), 8)
+
+    def test_map(self):
+        e = Expression('x == y')
+        assert_false(e.eval(self.a))
+        e.map_(lambda x: 1 if x in ('x', 'y') else x)
+        assert_true(e.eval(self.a))
+
+    def test_is_constant(self):
+        assert_true(Expression('4').is_constant())
+        assert_true(Expression('(1 + 2) * 4').is_constant())
+        assert_false(Expression('x').is_constant())
+        assert_false(Expression('2 * (x + 1)').is_constant())
+
+    def test_pickle(self):
+        e = Expression('x || y')
+        e.eval(self.a)
+        e = pickle.loads(pickle.dumps(e))
+        assert_equals(e.eval(self.a), 1)
+
 class TestPartition:
 
     def test_partition_empty(self):
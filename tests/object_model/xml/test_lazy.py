@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import assert_equals, assert_false, assert_true, raises
+
+import pyffi.object_models.common
+import pyffi.object_models.xml
+
+
+XML = """<?xml version="1.0" ?>
+<fileformat>
+    <version num="1.2">Some Game</version>
+    <basic name="uint" />
+    <enum name="Color" numbytes="1">
+        <option value="0" name="Red" />
+        <option value="1" name="Green" />
+    </enum>
+    <struct name="Base">
+        <add name="Color" type="Color" default="1" />
+    </struct>
+    <struct name="Point" inherit="Base">
+        <add name="Next" type="Link" cond="Num Links &gt; 0" />
+        <add name="Num Links" type="uint" />
+    </struct>
+    <struct name="Link">
+        <add name="Points" type="Point" arr1="2" />
+    </struct>
+    <struct name="Unused">
+        <add name="Value" type="uint" />
+    </struct>
+    <alias name="Count" type="uint" />
+</fileformat>
+"""
+
+
+class TestLazy(unittest.TestCase):
+
+    def setUp(self):
+        self.xml_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.xml_dir, "lazy.xml"), "w") as stream:
+            stream.write(XML)
+        self.old_cache_dir = os.environ.get("PYFFI_CACHE_DIR")
+        os.environ["PYFFI_CACHE_DIR"] = ""
+
+    def tearDown(self):
+        if self.old_cache_dir is None:
+            del os.environ["PYFFI_CACHE_DIR"]
+        else:
+            os.environ["PYFFI_CACHE_DIR"] = self.old_cache_dir
+        shutil.rmtree(self.xml_dir)
+
+    def create_format(self, lazy):
+        class LazyFormat(pyffi.object_models.xml.FileFormat):
+            xml_file_name = "lazy.xml"
+            xml_file_path = [self.xml_dir]
+            xml_lazy = lazy
+            uint = pyffi.object_models.common.UInt
+
+            class Point:
+                # points link to points
+                use_lazy_attributes = True
+
+                def has_next(self):
+                    return self.num_links > 0
+        return LazyFormat
+
+    def test_generate_on_access(self):
+        fmt = self.create_format(True)
+        assert_false("Point" in fmt.__dict__)
+        assert_false("Link" in fmt.__dict__)
+        assert_equals(fmt.xml_struct, [])
+        point = fmt.Point()
+        # base class and attribute types are generated along
+        for name in ("Base", "Color", "Link"):
+            assert_true(name in fmt.__dict__)
+        assert_false("Unused" in fmt.__dict__)
+        assert_true(issubclass(fmt.Point, fmt.Base))
+        assert_true(fmt.Point._attrs[0].type_ is fmt.Link)
+        assert_true(fmt.Link._attrs[0].type_ is fmt.Point)
+        assert_equals(point.color, 1)
+        # customized classes are kept
+        assert_false(point.has_next())
+        # classes are listed in xml order
+        assert_equals(fmt.xml_struct, [fmt.Base, fmt.Point, fmt.Link])
+
+    def test_generate_classes(self):
+        eager = self.create_format(False)
+        lazy = self.create_format(True)
+        lazy.Link
+        lazy.generate_classes()
+        for name in ("xml_enum", "xml_alias", "xml_struct"):
+            assert_equals(
+                [cls.__name__ for cls in getattr(eager, name)],
+                [cls.__name__ for cls in getattr(lazy, name)])
+        assert_true(issubclass(lazy.Count, lazy.uint))
+
+    @raises(AttributeError)
+    def test_missing(self):
+        self.create_format(True).Missing
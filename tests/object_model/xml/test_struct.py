@@ -0,0 +1,141 @@
+import io
+import unittest
+
+from nose.tools import assert_equals, assert_false, assert_true
+
+from pyffi.object_models import FileFormat
+from pyffi.object_models.common import UInt
+from pyffi.object_models.xml.struct_ import StructBase
+from pyffi.object_models.xml import StructAttribute as Attr
+
+
+class SimpleFormat(object):
+    UInt = UInt
+
+    @staticmethod
+    def name_attribute(name):
+        return name
+
+    @staticmethod
+    def version_number(version_str):
+        return int(version_str)
+
+
+class X(StructBase):
+    _is_template = False
+    _attrs = [
+        Attr(SimpleFormat, dict(name='a', type='UInt')),
+        Attr(SimpleFormat, dict(name='b', type='UInt', ver1='2')),
+        Attr(SimpleFormat, dict(name='c', type='UInt', cond='a == 1')),
+        Attr(SimpleFormat, dict(name='c', type='UInt', userver='5')),
+        Attr(SimpleFormat, dict(name='d', type='UInt', ver2='1')),
+        Attr(SimpleFormat, dict(name='d', type='UInt')),
+        ]
+
+SimpleFormat.X = X
+
+
+class Y(StructBase):
+    _is_template = False
+    use_lazy_attributes = True
+    _attrs = [
+        Attr(SimpleFormat, dict(name='n', type='UInt')),
+        Attr(SimpleFormat, dict(name='x', type='X', ver1='2')),
+        Attr(SimpleFormat, dict(name='arr', type='UInt', arr1='n')),
+        ]
+
+
+class Z(StructBase):
+    _is_template = False
+    _attrs = [
+        Attr(SimpleFormat, dict(name='a', type='UInt', ver1='2')),
+        Attr(SimpleFormat, dict(name='b', type='UInt', arr1='3', arr2='2')),
+        ]
+
+
+class Data(FileFormat.Data):
+    def __init__(self, version, user_version):
+        self.version = version
+        self.user_version = user_version
+
+
+class TestFilteredAttributeList(unittest.TestCase):
+
+    def get_names(self, x, data):
+        return [attr.name for attr in x._get_filtered_attribute_list(data)]
+
+    def test_filtered_attribute_list(self):
+        x = X()
+        assert_equals(self.get_names(x, Data(1, 0)), ['a', 'd'])
+        assert_equals(self.get_names(x, Data(2, 0)), ['a', 'b', 'd'])
+        assert_equals(self.get_names(x, Data(2, 5)), ['a', 'b', 'c', 'd'])
+        assert_equals(self.get_names(x, None), ['a', 'b', 'c', 'd'])
+        x.a = 1
+        assert_equals(self.get_names(x, Data(1, 0)), ['a', 'c', 'd'])
+        assert_equals(self.get_names(x, Data(2, 5)), ['a', 'b', 'c', 'd'])
+        # first c must win
+        assert_true(
+            list(x._get_filtered_attribute_list(Data(2, 5)))[2]
+            is X._attrs[2])
+
+    def test_static_attribute_list(self):
+        attrs, has_duplicates = X._get_static_attribute_list(Data(1, 0))
+        assert_equals([attr.name for attr in attrs], ['a', 'c', 'd'])
+        assert_equals(has_duplicates, False)
+        attrs, has_duplicates = X._get_static_attribute_list(Data(2, 5))
+        assert_equals([attr.name for attr in attrs], ['a', 'b', 'c', 'c', 'd'])
+        assert_equals(has_duplicates, True)
+        # cached
+        assert_true(X._get_static_attribute_list(Data(2, 5))[0] is attrs)
+
+
+class TestLazyAttributes(unittest.TestCase):
+
+    def test_read(self):
+        y = Y()
+        assert_equals(y.__dict__, {'arg': None})
+        y.read(io.BytesIO(b'\x02\x00\x00\x00\x05\x00\x00\x00'
+                          b'\x06\x00\x00\x00'), Data(1, 0))
+        assert_equals(list(y.arr), [5, 6])
+        # inactive for this version, so never created
+        assert_false('_x_value_' in y.__dict__)
+        assert_equals(y.x.a, 0)
+        assert_true('_x_value_' in y.__dict__)
+
+    def test_items(self):
+        y = Y()
+        assert_equals(list(y.get_detail_child_names()), ['n', 'x', 'arr'])
+        items = list(y.get_detail_child_nodes())
+        assert_true(items[1] is y.x)
+        assert_true(items[2] is y.arr)
+        assert_equals(y._items, items)
+
+    def test_array_size(self):
+        y = Y()
+        y.n = 3
+        # arrays are created according to the current count
+        assert_equals(list(y.arr), [0, 0, 0])
+
+    def test_eager(self):
+        y = Y._create_lazy()
+        assert_equals(y.__dict__, {'arg': None})
+        # not lazy by default
+        x = X()
+        assert_true('_a_value_' in x.__dict__)
+        assert_true('_d_value_' in x.__dict__)
+
+
+class TestStaticSize(unittest.TestCase):
+
+    def test_static_size(self):
+        assert_equals(Z._get_static_size(Data(1, 0)), 24)
+        assert_equals(Z._get_static_size(Data(2, 0)), 28)
+        assert_equals(Z._get_static_size(None), 28)
+        z = Z()
+        assert_equals(z.get_size(Data(1, 0)), 24)
+
+    def test_no_static_size(self):
+        # c is conditional
+        assert_equals(X._get_static_size(Data(1, 0)), None)
+        # arr has variable size
+        assert_equals(Y._get_static_size(Data(1, 0)), None)
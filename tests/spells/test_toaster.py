@@ -1,18 +1,49 @@
 """Tests for pyffi."""
+from concurrent.futures.process import BrokenProcessPool
 import tempfile
 import os
 import shutil
 
-from nose.tools import assert_true, assert_false
+from nose.tools import assert_equal, assert_true, assert_false, raises
 
 from pyffi.formats.nif import NifFormat
 from pyffi.spells import Toaster
+import pyffi.spells.nif
+import pyffi.spells.nif.check
 
 
 class MyToaster(Toaster):
     FILEFORMAT = NifFormat
 
 
+class SpellFail(pyffi.spells.nif.NifSpell):
+    """Spell which fails on every file."""
+    SPELLNAME = "test_fail"
+
+    def datainspect(self):
+        raise RuntimeError("failed on %s" % self.stream.name)
+
+
+class SpellCrash(pyffi.spells.nif.NifSpell):
+    """Spell which ends the process on every file."""
+    SPELLNAME = "test_crash"
+
+    def datainspect(self):
+        os._exit(1)
+
+
+class FailToaster(pyffi.spells.nif.NifToaster):
+    SPELLS = [SpellFail]
+
+
+class CrashToaster(pyffi.spells.nif.NifToaster):
+    SPELLS = [SpellCrash]
+
+
+class VersionToaster(pyffi.spells.nif.NifToaster):
+    SPELLS = [pyffi.spells.nif.check.SpellCheckVersion]
+
+
 class TestToaster:
     """Test class for spell base."""
 
@@ -58,6 +89,62 @@ class TestToaster:
         assert_true(toaster.is_admissible_branch_class(NifFormat.NiAlphaProperty))
 
 
+class TestToasterJobs:
+    """Test toasting files in several processes."""
+
+    from os.path import dirname
+    input_files = os.path.join(
+        dirname(dirname(__file__)), 'spells', 'nif', 'files')
+
+    @raises(RuntimeError)
+    def test_raise_test_error(self):
+        """Test that errors from the worker processes are raised"""
+        toaster = FailToaster(
+            options=dict(jobs=2, refresh=2, raisetesterror=True, verbose=0,
+                         skip=["invalid"]),
+            spellnames=["test_fail"])
+        toaster.toast(self.input_files)
+
+    def test_no_raise_test_error(self):
+        toaster = FailToaster(
+            options=dict(jobs=2, refresh=2, verbose=0),
+            spellnames=["test_fail"])
+        toaster.toast(self.input_files)
+        assert_equal(toaster.files_done, {})
+        assert_true(toaster.files_failed)
+
+    @raises(BrokenProcessPool)
+    def test_worker_crash(self):
+        """Test that a worker process which dies is detected"""
+        toaster = CrashToaster(
+            options=dict(jobs=2, refresh=2, verbose=0, skip=["invalid"]),
+            spellnames=["test_crash"])
+        toaster.toast(self.input_files)
+
+    def test_merge_results(self):
+        """Test that worker results are merged into the toaster"""
+        toasters = []
+        for jobs in (1, 2):
+            toaster = VersionToaster(
+                options=dict(jobs=jobs, refresh=2, verbose=0,
+                             skip=["invalid"]),
+                spellnames=["check_version"])
+            toaster.toast(self.input_files)
+            toasters.append(toaster)
+        serial, parallel = toasters
+        assert_equal(parallel.files_done, serial.files_done)
+        assert_equal(parallel.files_skipped, serial.files_skipped)
+        assert_equal(parallel.files_failed, serial.files_failed)
+        assert_equal(parallel.versions, serial.versions)
+        assert_equal(
+            dict((version, sorted(user_versions))
+                 for version, user_versions
+                 in parallel.user_versions.items()),
+            dict((version, sorted(user_versions))
+                 for version, user_versions
+                 in serial.user_versions.items()))
+
+
 class TestIniParser:
     """Test the Ini parser"""
 
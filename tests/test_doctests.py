@@ -27,7 +27,9 @@ import pyffi.utils.quickhull
 import pyffi.utils.inertia
 import pyffi.utils.tangentspace
 import pyffi.utils.mopp
+import pyffi.utils.graph
 import pyffi.formats.nif
+import pyffi.formats.nif.scan
 import pyffi.formats.cgf
 import pyffi.formats.kfm
 import pyffi.formats.dds
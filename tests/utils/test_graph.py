@@ -0,0 +1,58 @@
+"""Tests for pyffi.utils.graph module."""
+
+import sys
+
+import nose.tools
+from pyffi.utils.graph import GlobalNode, walk
+
+
+class Node(GlobalNode):
+    def __init__(self, *children):
+        self.children = list(children)
+
+    def get_global_child_nodes(self, edge_filter=None):
+        return iter(self.children)
+
+
+def test_walk_deep():
+    depth = sys.getrecursionlimit() * 2
+    graph = dict((i, [i + 1]) for i in range(depth))
+    graph[depth] = []
+    nose.tools.assert_equal(
+        list(walk(0, graph.__getitem__)), list(range(depth + 1)))
+
+
+def test_walk_unique():
+    # nodes are compared by identity, not by equality
+    first, second = [], []
+    children = {id(first): [second, first], id(second): [first]}
+    get_children = lambda node: children.get(id(node), [])
+    nose.tools.assert_equal(
+        [id(node) for node in walk(first, get_children, unique=True)],
+        [id(first), id(second)])
+    equal = [[], []]
+    nose.tools.assert_equal(
+        len(list(walk(equal, lambda node: node, unique=True))), 3)
+
+
+@nose.tools.raises(ValueError)
+def test_walk_cycle():
+    graph = {0: [1, 2], 1: [3], 2: [3], 3: [1]}
+    list(walk(0, graph.__getitem__))
+
+
+def test_walk_shared():
+    # a node can be reached along several paths without a cycle
+    graph = {0: [1, 2], 1: [3], 2: [3, 1], 3: []}
+    nose.tools.assert_equal(
+        list(walk(0, graph.__getitem__)), [0, 1, 3, 2, 3, 1, 3])
+
+
+def test_global_iterator():
+    leaf = Node()
+    branch = Node(leaf)
+    root = Node(branch, leaf)
+    nose.tools.assert_equal(
+        list(root.get_global_iterator()), [root, branch, leaf, leaf])
+    nose.tools.assert_equal(
+        list(root.get_global_iterator(unique=True)), [root, branch, leaf])